@@ -0,0 +1,159 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# IMA ADPCM (WAVE_FORMAT_IMA_ADPCM, 0x11) encoder for 16-bit mono audio
+# - 4 bits per sample, so 1/4 of the SD Card bandwidth of 16-bit PCM
+# - output is in standard WAV blocks:  4 byte header (first sample + step index)
+#   followed by (block_align - 4) bytes of nibbles, low nibble first
+# - encoder state and the two output blocks are preallocated.  encode() fills one
+#   block while the other block is handed to the caller
+# - decode_block() is used on the host to check the encoder
+#
+from array import array
+try:
+    import micropython
+    native = micropython.native
+except (ImportError, AttributeError):
+    native = lambda f: f
+
+WAVE_FORMAT_IMA_ADPCM = 0x11
+BITS_PER_SAMPLE = 4
+
+INDEX_TABLE = array('b', (-1, -1, -1, -1, 2, 4, 6, 8,
+                          -1, -1, -1, -1, 2, 4, 6, 8))
+
+STEP_TABLE = array('H', (
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17,
+    19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118,
+    130, 143, 157, 173, 190, 209, 230, 253, 279, 307,
+    337, 371, 408, 449, 494, 544, 598, 658, 724, 796,
+    876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066,
+    2272, 2499, 2749, 3024, 3327, 3660, 4026, 4428, 4871, 5358,
+    5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487, 12635, 13899,
+    15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794, 32767))
+
+def samples_per_block(block_align):
+    return (block_align - 4) * 2 + 1
+
+class ADPCMEncoder():
+    def __init__(self, block_align=256):
+        self.block_align = block_align
+        self.samples_per_block = samples_per_block(block_align)
+        self.blocks = (bytearray(block_align), bytearray(block_align))
+        self.active = 0
+        # state:  predicted sample, step index, samples in the active block
+        self.state = array('i', [0, 0, 0])
+
+    # encode one sample into the active block
+    @native
+    def _encode_sample(self, block, sample):
+        state = self.state
+        n = state[2]
+        if n == 0:
+            # block header:  first sample verbatim + step index
+            state[0] = sample
+            block[0] = sample & 0xFF
+            block[1] = (sample >> 8) & 0xFF
+            block[2] = state[1]
+            block[3] = 0
+            state[2] = 1
+            return
+        predicted = state[0]
+        index = state[1]
+        step = STEP_TABLE[index]
+        diff = sample - predicted
+        code = 0
+        if diff < 0:
+            code = 8
+            diff = -diff
+        delta = step >> 3
+        if diff >= step:
+            code |= 4
+            diff -= step
+            delta += step
+        step >>= 1
+        if diff >= step:
+            code |= 2
+            diff -= step
+            delta += step
+        step >>= 1
+        if diff >= step:
+            code |= 1
+            delta += step
+        if code & 8:
+            predicted -= delta
+        else:
+            predicted += delta
+        if predicted > 32767:
+            predicted = 32767
+        elif predicted < -32768:
+            predicted = -32768
+        index += INDEX_TABLE[code]
+        if index < 0:
+            index = 0
+        elif index > 88:
+            index = 88
+        state[0] = predicted
+        state[1] = index
+        # sample n (1..) goes to nibble n-1 after the 4 byte header
+        pos = 4 + ((n - 1) >> 1)
+        if (n - 1) & 1:
+            block[pos] |= code << 4
+        else:
+            block[pos] = code
+        state[2] = n + 1
+
+    # encode 16-bit little-endian PCM samples
+    # returns a completed ADPCM block (the caller must use it before the next call) or None
+    def encode(self, pcm):
+        completed = None
+        block = self.blocks[self.active]
+        spb = self.samples_per_block
+        state = self.state
+        for i in range(0, len(pcm) - 1, 2):
+            sample = pcm[i] | (pcm[i + 1] << 8)
+            if sample & 0x8000:
+                sample -= 0x10000
+            self._encode_sample(block, sample)
+            if state[2] == spb:
+                completed = block
+                self.active ^= 1
+                block = self.blocks[self.active]
+                state[2] = 0
+        return completed
+
+    # samples in the active (incomplete) block
+    def pending_samples(self):
+        return self.state[2]
+
+# decode one mono IMA ADPCM block into a list of samples
+def decode_block(block):
+    predicted = block[0] | (block[1] << 8)
+    if predicted & 0x8000:
+        predicted -= 0x10000
+    index = block[2]
+    out = [predicted]
+    for pos in range(4, len(block)):
+        for code in (block[pos] & 0x0F, block[pos] >> 4):
+            step = STEP_TABLE[index]
+            delta = step >> 3
+            if code & 4:
+                delta += step
+            if code & 2:
+                delta += step >> 1
+            if code & 1:
+                delta += step >> 2
+            if code & 8:
+                predicted -= delta
+            else:
+                predicted += delta
+            predicted = max(-32768, min(32767, predicted))
+            index = max(0, min(88, index + INDEX_TABLE[code]))
+            out.append(predicted)
+    return out
@@ -0,0 +1,183 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Octave / third-octave band analyzer for the microphone stream
+# - bank of 2nd order IIR band-pass filters (one biquad per band)
+# - fed with the same blocks of 256 samples that are written to the SD card, 16, 24 or
+#   32-bit (sample_bytes 2, 3 or 4).  24 and 32-bit samples are decoded from their top
+#   3 bytes (the INMP441's 24 bits) and scaled to 16-bit full scale, so the levels do not
+#   depend on the resolution
+# - band energies are accumulated and converted to dB SPL levels once per second.  A
+#   second ends at the block that reaches sample_rate samples, the samples past it count
+#   towards the next second (e.g. 39 or 40 blocks of 256 at 10 kS/s), so every sample of
+#   the analyzed blocks is used and the seconds do not drift
+# - a band without energy (e.g. no block analyzed, digital silence) has a NaN level:  not
+#   measured, as for the noise statistics (noisestats.py)
+# - all buffers are preallocated in __init__, process() does not create containers.  The
+#   filter is float math:  on the ESP32 port (boxed floats) each operation still allocates
+#   a float on the heap, several per sample and band, which the GC collects
+#
+# To bound the CPU time the analyzer can look at 1 of every `stride` runs of RUN_BLOCKS
+# contiguous blocks.  The band levels are then computed from the analyzed runs only, a
+# fair estimate for stationary street noise.  bench/bench_bands.py measures the
+# throughput on CPython only:  whether a stride keeps up with 10 kS/s on the device is
+# not measured, the t_mic diagnostics probe (diag.py) shows the time per block there
+#
+import math
+from array import array
+try:
+    import micropython
+    native = micropython.native
+except (ImportError, AttributeError):
+    native = lambda f: f
+
+# nominal centre frequencies (Hz)
+OCTAVE_BANDS = (63, 125, 250, 500, 1000, 2000, 4000)
+THIRD_OCTAVE_BANDS = (50, 63, 80, 100, 125, 160, 200, 250, 315, 400,
+                      500, 630, 800, 1000, 1250, 1600, 2000, 2500, 3150, 4000)
+
+OCTAVE = 1
+THIRD_OCTAVE = 3
+
+NAN = float('nan')
+
+RUN_BLOCKS = 4  # contiguous blocks analyzed together when stride > 1
+
+# INMP441 microphone constants, as used by the dba module
+MIC_OFFSET_DB = 3.0103
+MIC_REF_DB = 94.0
+MIC_SENSITIVITY = -26.0
+
+class BandAnalyzer():
+    def __init__(self, sample_rate, fraction=OCTAVE, stride=1, block_samples=256, sample_bytes=2):
+        if sample_bytes not in (2, 3, 4):
+            raise ValueError('sample_bytes must be 2, 3 or 4')
+        self.sample_rate = sample_rate
+        self.sample_bytes = sample_bytes
+        self.fraction = fraction
+        self.stride = stride
+        if fraction == OCTAVE:
+            self.centres = OCTAVE_BANDS
+        elif fraction == THIRD_OCTAVE:
+            self.centres = THIRD_OCTAVE_BANDS
+        else:
+            raise ValueError('fraction must be OCTAVE or THIRD_OCTAVE')
+        num_bands = len(self.centres)
+
+        # RBJ band-pass (0 dB peak gain) coefficients, normalized by a0.  b1 = 0, b2 = -b0
+        bw = 1 / fraction  # bandwidth in octaves
+        q = math.sqrt(2 ** bw) / (2 ** bw - 1)
+        self.b0 = array('f', [0] * num_bands)
+        self.a1 = array('f', [0] * num_bands)
+        self.a2 = array('f', [0] * num_bands)
+        for i, fc in enumerate(self.centres):
+            # exact (base 10) centre frequencies, IEC 61260
+            step = 3 / (10 * fraction)
+            fm = 1000 * 10 ** (step * round(math.log10(fc / 1000) / step))
+            w0 = 2 * math.pi * fm / sample_rate
+            alpha = math.sin(w0) / (2 * q)
+            a0 = 1 + alpha
+            self.b0[i] = alpha / a0
+            self.a1[i] = -2 * math.cos(w0) / a0
+            self.a2[i] = (1 - alpha) / a0
+
+        # filter state, kept across analyzed blocks
+        self.z1 = array('f', [0] * num_bands)
+        self.z2 = array('f', [0] * num_bands)
+        self.energy = array('f', [0] * num_bands)
+        self.x = array('f', [0] * block_samples)
+
+        # dB SPL levels of the last completed second, NaN without energy
+        self.levels = array('f', [NAN] * num_bands)
+        # third-octave levels combined into octaves (same as levels in OCTAVE mode)
+        self.octave_levels = array('f', [NAN] * len(OCTAVE_BANDS))
+
+        ref_ampl = math.pow(10, MIC_SENSITIVITY / 20) * 32767
+        self.level_offset = MIC_OFFSET_DB + MIC_REF_DB - 20 * math.log10(ref_ampl)
+
+        self.block_count = 0
+        self.samples_in_second = 0
+        self.samples_analyzed = 0
+
+    # decode little-endian samples into the preallocated float buffer
+    @native
+    def _decode(self, block, n):
+        x = self.x
+        nb = self.sample_bytes
+        if nb == 2:
+            for i in range(n):
+                s = block[2 * i] | (block[2 * i + 1] << 8)
+                if s & 0x8000:
+                    s -= 0x10000
+                x[i] = s
+        else:
+            # top 3 bytes only:  a 32-bit sample would not fit a small int
+            for i in range(n):
+                k = nb * i + nb - 3
+                s = block[k] | (block[k + 1] << 8) | (block[k + 2] << 16)
+                if s & 0x800000:
+                    s -= 0x1000000
+                x[i] = s / 256
+
+    @native
+    def _filter(self, n):
+        x = self.x
+        for band in range(len(self.centres)):
+            b0 = self.b0[band]
+            a1 = self.a1[band]
+            a2 = self.a2[band]
+            z1 = self.z1[band]
+            z2 = self.z2[band]
+            e = 0.0
+            for i in range(n):
+                s = x[i]
+                y = b0 * s + z1
+                z1 = -a1 * y + z2
+                z2 = -b0 * s - a2 * y
+                e += y * y
+            self.z1[band] = z1
+            self.z2[band] = z2
+            self.energy[band] += e
+
+    def _complete_second(self):
+        n = self.samples_analyzed
+        for band in range(len(self.centres)):
+            e = self.energy[band]
+            if n and e > 0:
+                self.levels[band] = self.level_offset + 10 * math.log10(e / n)
+            else:
+                self.levels[band] = NAN
+            self.energy[band] = 0
+        if self.fraction == OCTAVE:
+            for band in range(len(OCTAVE_BANDS)):
+                self.octave_levels[band] = self.levels[band]
+        else:
+            # three third-octave bands per octave: 50/63/80 -> 63, ... 3150/4000 -> 4000
+            for octave in range(len(OCTAVE_BANDS)):
+                total = 0.0
+                for band in range(3 * octave, min(3 * octave + 3, len(self.centres))):
+                    if self.levels[band] == self.levels[band]:
+                        total += 10 ** (self.levels[band] / 10)
+                self.octave_levels[octave] = 10 * math.log10(total) if total > 0 else NAN
+        self.samples_in_second -= self.sample_rate
+        self.samples_analyzed = 0
+
+    # feed one block of samples
+    # returns True when a second of audio has completed and levels are updated
+    def process(self, block):
+        n = len(block) // self.sample_bytes
+        if (self.block_count // RUN_BLOCKS) % self.stride == 0:
+            self._decode(block, n)
+            self._filter(n)
+            self.samples_analyzed += n
+        self.block_count += 1
+        self.samples_in_second += n
+        if self.samples_in_second >= self.sample_rate:
+            self._complete_second()
+            return True
+        return False
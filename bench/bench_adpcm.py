@@ -0,0 +1,90 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Benchmark:  IMA ADPCM capture mode
+# - encodes 16-bit PCM in 512 byte blocks, as run_mic does, and decodes it again
+# - reports encode/decode speed as a multiple of real time at 10 kS/s
+# - reports the SNR of the decoded audio against the PCM path, and the size ratio
+#
+#   python bench/bench_adpcm.py [--seconds 60] [mic-*.wav ...]
+#
+import argparse
+import math
+import os
+import random
+import struct
+import sys
+import time
+import wave
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import adpcm
+
+SAMPLES_PER_SECOND = 10000
+SECTOR = 512
+
+def wav_pcm(filenames):
+    data = b''
+    for fn in filenames:
+        with wave.open(fn, 'rb') as w:
+            data += w.readframes(w.getnframes())
+    return data
+
+# traffic-like noise with tones and a few loud events
+def synthetic_pcm(seconds):
+    rnd = random.Random(1)
+    out = []
+    level = 500.0
+    lp = 0.0
+    for n in range(seconds * SAMPLES_PER_SECOND):
+        if n % 1000 == 0:
+            level = min(12000.0, max(30.0, level * math.exp(rnd.gauss(0, 0.2))))
+        lp = 0.9 * lp + 0.1 * rnd.gauss(0, level)
+        s = lp + 0.2 * level * math.sin(2 * math.pi * 440 * n / SAMPLES_PER_SECOND)
+        out.append(max(-32768, min(32767, int(s))))
+    return struct.pack('<{}h'.format(len(out)), *out)
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark IMA ADPCM encode/decode')
+    parser.add_argument('wavs', nargs='*', help='16-bit mono mic-*.wav files')
+    parser.add_argument('--seconds', type=int, default=60, help='length of synthetic signal, when no WAV given')
+    parser.add_argument('--block-align', type=int, default=256)
+    args = parser.parse_args()
+
+    pcm = wav_pcm(args.wavs) if args.wavs else synthetic_pcm(args.seconds)
+    pcm = pcm[:len(pcm) - len(pcm) % SECTOR]
+    audio_seconds = len(pcm) / 2 / SAMPLES_PER_SECOND
+
+    encoder = adpcm.ADPCMEncoder(args.block_align)
+    blocks = []
+    start = time.perf_counter()
+    for i in range(0, len(pcm), SECTOR):
+        completed = encoder.encode(pcm[i:i + SECTOR])
+        if completed is not None:
+            blocks.append(bytes(completed))
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = []
+    for block in blocks:
+        decoded.extend(adpcm.decode_block(block))
+    decode_time = time.perf_counter() - start
+
+    original = struct.unpack('<{}h'.format(len(decoded)), pcm[:2 * len(decoded)])
+    signal = sum(s * s for s in original)
+    noise = sum((s - d) ** 2 for s, d in zip(original, decoded))
+    snr = 10 * math.log10(signal / noise) if noise else float('inf')
+
+    adpcm_bytes = len(blocks) * args.block_align
+    print('audio:   {:.1f} s, {} samples in {} ADPCM blocks'.format(audio_seconds, len(decoded), len(blocks)))
+    print('encode:  {:.2f} s = {:.1f} x real time'.format(encode_time, audio_seconds / encode_time))
+    print('decode:  {:.2f} s = {:.1f} x real time'.format(decode_time, audio_seconds / decode_time))
+    print('size:    {:.3f} of 16-bit PCM  ({:.1f} MB/hour vs {:.1f} MB/hour)'.format(
+        adpcm_bytes / (2 * len(decoded)),
+        adpcm_bytes / audio_seconds * 3600 / 1e6,
+        2 * SAMPLES_PER_SECOND * 3600 / 1e6))
+    print('SNR vs PCM:  {:.1f} dB'.format(snr))
+
+main()
@@ -0,0 +1,83 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Benchmark:  band analyzer throughput with synthetic tones
+# - feeds 512 byte blocks, as written to the SD card, at 10 kS/s
+# - checks each tone lands in its own band, that 60 s of blocks give 60 seconds of levels
+#   and that digital silence gives NaN levels
+# - reports samples/s processed and the stride needed to keep up with 10 kS/s, on CPython.
+#   The device is slower and allocates a float per filter operation:  use the t_mic
+#   diagnostics probe there
+#
+#   python bench/bench_bands.py
+#
+import math
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import bands
+
+SAMPLES_PER_SECOND = 10000
+BLOCK_SAMPLES = 256
+
+def tone_blocks(freq, seconds, amplitude=3000):
+    blocks = []
+    pack = struct.Struct('<{}h'.format(BLOCK_SAMPLES)).pack
+    n = 0
+    for _ in range(seconds * SAMPLES_PER_SECOND // BLOCK_SAMPLES + 1):
+        blocks.append(pack(*[int(amplitude * math.sin(2 * math.pi * freq * (n + i) / SAMPLES_PER_SECOND))
+                             for i in range(BLOCK_SAMPLES)]))
+        n += BLOCK_SAMPLES
+    return blocks
+
+def check_tones(fraction):
+    ok = True
+    for band, fc in enumerate(bands.OCTAVE_BANDS if fraction == bands.OCTAVE else bands.THIRD_OCTAVE_BANDS):
+        analyzer = bands.BandAnalyzer(SAMPLES_PER_SECOND, fraction)
+        for block in tone_blocks(fc, 2):
+            analyzer.process(block)
+        peak = max(range(len(analyzer.levels)), key=lambda i: analyzer.levels[i])
+        if peak != band:
+            print('  tone {} Hz:  peak in band {} Hz'.format(fc, analyzer.centres[peak]))
+            ok = False
+    return ok
+
+# seconds completed by 60 s of blocks, and the octave levels of silence
+def check_seconds_and_silence():
+    analyzer = bands.BandAnalyzer(SAMPLES_PER_SECOND, bands.THIRD_OCTAVE)
+    silence = bytes(BLOCK_SAMPLES * 2)
+    seconds = 0
+    for _ in range(60 * SAMPLES_PER_SECOND // BLOCK_SAMPLES + 1):
+        if analyzer.process(silence):
+            seconds += 1
+    nan = all(v != v for v in analyzer.octave_levels) and all(v != v for v in analyzer.levels)
+    print('60 s of blocks:  {} seconds of levels, silence {}'.format(seconds, 'NaN' if nan else 'WRONG'))
+    return seconds == 60 and nan
+
+def throughput(fraction, stride):
+    blocks = tone_blocks(1000, 5)
+    analyzer = bands.BandAnalyzer(SAMPLES_PER_SECOND, fraction, stride=stride)
+    start = time.perf_counter()
+    for block in blocks:
+        analyzer.process(block)
+    elapsed = time.perf_counter() - start
+    return len(blocks) * BLOCK_SAMPLES / elapsed
+
+def main():
+    ok = check_seconds_and_silence()
+    for fraction, name in ((bands.OCTAVE, 'octave'), (bands.THIRD_OCTAVE, '1/3 octave')):
+        tones_ok = check_tones(fraction)
+        ok = ok and tones_ok
+        print('{:10s} tone check: {}'.format(name, 'PASS' if tones_ok else 'FAIL'))
+        for stride in (1, 2, 4, 8):
+            rate = throughput(fraction, stride)
+            print('{:10s} stride {}:  {:9.0f} samples/s  ({:5.1f} x real time at {} S/s, CPython)'.format(
+                name, stride, rate, rate / SAMPLES_PER_SECOND, SAMPLES_PER_SECOND))
+    print('PASS' if ok else 'FAIL')
+
+main()
@@ -0,0 +1,79 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Benchmark:  binary measurement log
+# - writes a synthetic log with binlog.RecordPacker (as SDCardLogger does), a corrupted
+#   record and a torn trailing record
+# - reports the file size against the same data in CSV
+# - reports host/logconv.py read speed in records per second, and checks bad records are skipped
+#
+#   python bench/bench_binlog.py [--records 1000000]
+#
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+sys.path.insert(0, os.path.join(here, '..', 'host'))
+import binlog
+import logconv
+
+NAMES = ('pm25', 'o3', 'o3_vgas', 'o3_vref', 'no2', 'no2_vgas', 'no2_vref', 'tdegc', 'rh',
+         'dba_avg', 'dba_max', 'vusb_avg', 'vusb_min', 'vbat_avg', 'vbat_min')
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark the binary measurement log')
+    parser.add_argument('--records', type=int, default=200000)
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    packer = binlog.RecordPacker(len(NAMES))
+    csv_bytes = len('utc,' + ','.join(NAMES) + '\n')
+    fmt = '{}' + ''.join(',{:.2f}' for _ in NAMES) + '\n'
+    with tempfile.TemporaryDirectory() as tmp:
+        fn = os.path.join(tmp, 'meas.bin')
+        with open(fn, 'wb') as f:
+            f.write(binlog.gen_header(NAMES))
+            for i in range(args.records):
+                values = [rnd.uniform(0, 100) for _ in NAMES]
+                record = packer.pack(1577836800 + 120 * i, values)
+                if i == args.records // 2:
+                    record = bytearray(record)
+                    record[6] ^= 0xFF  # corrupt one record
+                f.write(record)
+                if i < 1000:
+                    csv_bytes += len(fmt.format(1577836800 + 120 * i, *values))
+            f.write(packer.pack(0, [0] * len(NAMES))[:20])  # torn record
+        bin_bytes = os.path.getsize(fn)
+        csv_estimate = csv_bytes * args.records / min(1000, args.records)
+        print('size:  {:.1f} bytes/record binary vs {:.1f} bytes/record CSV  ({:.2f}x smaller)'.format(
+            bin_bytes / args.records, csv_estimate / args.records, csv_estimate / bin_bytes))
+
+        log = logconv.BinLog(fn)
+        start = time.perf_counter()
+        if logconv.np is not None:
+            n = len(log.columns()['utc'])
+            path = 'numpy'
+        else:
+            n = sum(1 for _ in log.rows())
+            path = 'python'
+        elapsed = time.perf_counter() - start
+        print('read ({}):  {} good records, {} bad CRC, {} torn bytes, {:.0f} records/s'.format(
+            path, n, log.bad_crc, log.torn_bytes, n / elapsed))
+        ok = n == args.records - 1 and log.bad_crc == 1 and log.torn_bytes == 20
+        log.close()
+
+        start = time.perf_counter()
+        logconv.to_csv([fn], io.StringIO())
+        elapsed = time.perf_counter() - start
+        print('convert to CSV:  {:.0f} records/s'.format(args.records / elapsed))
+    print('PASS' if ok else 'FAIL')
+
+main()
@@ -0,0 +1,171 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Benchmark:  microphone capture path at 16, 24 and 32-bit resolution (streetsense.MIC_BITS)
+# - per block of 256 I2S frames (25.6 ms at 10 kS/s), as run_mic does:  i2stools.copy of the
+#   left channel (host/sim, stride-based memoryview copies), dba.calc (host dba module),
+#   BandAnalyzer.process at BAND_STRIDE 4 and SDWriter.write (as SegmentRecorder does)
+# - SD Card bandwidth:  bytes per second, MB per hour, 8 kB buffer writes per second, the
+#   card busy time with the bench_sdwriter.py card model (1.5 ms per call + 0.4 ms per kB)
+#   and the hours of audio kept under MIC_DISK_CAP_BYTES
+# - level check:  a quiet and a loud signal with 24-bit content.  dB(A) at each resolution
+#   against the 24-bit level, and the WAV written at each resolution read back and compared
+#   with the source samples
+# - times are CPython and only compare the resolutions:  on the device i2stools and dba are
+#   C modules, the t_mic diagnostics probe gives the time per block
+#
+#   python bench/bench_capture.py [--seconds 10]
+#
+import argparse
+import io
+import math
+import os
+import random
+import sys
+import time
+import wave
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'host'))
+import dba
+import bands
+import wavheader
+from sdwriter import SDWriter
+# after sdwriter, which would take the simulated utime
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'host', 'sim'))
+import i2stools
+
+SAMPLES_PER_SECOND = 10000
+FRAME_BYTES = 8
+BLOCK_FRAMES = 256
+BLOCK_MS = BLOCK_FRAMES * 1000 / SAMPLES_PER_SECOND
+NOISE_BLOCK_MS = 125
+SD_BUFFER = 8192
+CARD_CALL_MS = 1.5
+CARD_MS_PER_KB = 0.4
+DISK_CAP_BYTES = 2 * 1024 * 1024 * 1024
+COEFFA = (1.0, -2.3604841, 0.83692802, 1.54849677, -0.96903429, -0.25092355, 0.1950274)
+COEFFB = (0.61367941, -1.22735882, -0.61367941, 2.45471764, -0.61367941, -1.22735882, 0.61367941)
+FORMATS = {16: (dba.B16, i2stools.B16), 24: (dba.B24, i2stools.B24), 32: (dba.B32, i2stools.B32)}
+TOLERANCE_DB = 0.1  # 24 and 32-bit dB(A) against the 24-bit reference
+
+# 24-bit noise at rms (full scale 8388607), 1 kHz tone added so the A-weighting passes energy
+def signal_24(seconds, rms, seed=1):
+    rnd = random.Random(seed)
+    out = []
+    for n in range(seconds * SAMPLES_PER_SECOND):
+        s = rms * (rnd.gauss(0, 0.7) + math.sin(2 * math.pi * 1000 * n / SAMPLES_PER_SECOND))
+        out.append(max(-8388608, min(8388607, int(s))))
+    return out
+
+# I2S frames:  the 24-bit sample left-justified in both 32-bit slots, as the INMP441 sends it
+def frames(samples):
+    buf = bytearray(len(samples) * FRAME_BYTES)
+    for i, s in enumerate(samples):
+        slot = (s << 8).to_bytes(4, 'little', signed=True)
+        buf[i * FRAME_BYTES:i * FRAME_BYTES + 4] = slot
+        buf[i * FRAME_BYTES + 4:i * FRAME_BYTES + 8] = slot
+    return buf
+
+def run(bits, rx, keep_wav=False):
+    resolution, copy_format = FORMATS[bits]
+    nb = bits // 8
+    noise = dba.DBA(samples=SAMPLES_PER_SECOND * NOISE_BLOCK_MS // 1000, resolution=resolution,
+                    coeffa=COEFFA, coeffb=COEFFB, use_numpy=False)
+    spectrum = bands.BandAnalyzer(SAMPLES_PER_SECOND, fraction=bands.OCTAVE, stride=4,
+                                  block_samples=BLOCK_FRAMES, sample_bytes=nb)
+    card = io.BytesIO()
+    writer = SDWriter(card, buffer_size=SD_BUFFER, num_buffers=3)
+    writer.write(wavheader.gen_wav_header(SAMPLES_PER_SECOND, bits, 1, 0))
+    block = bytearray(BLOCK_FRAMES * nb)
+    times = [0.0] * 4
+    levels = []
+    writes = 0
+    block_rx = BLOCK_FRAMES * FRAME_BYTES
+    for start in range(0, len(rx) - block_rx + 1, block_rx):
+        t0 = time.perf_counter()
+        i2stools.copy(bufin=rx[start:start + block_rx], bufout=block, channel=i2stools.LEFT, format=copy_format)
+        t1 = time.perf_counter()
+        res = noise.calc(block)
+        if res is not None:
+            levels.append(res)
+        t2 = time.perf_counter()
+        spectrum.process(block)
+        t3 = time.perf_counter()
+        writer.write(block)
+        t4 = time.perf_counter()
+        for i, dt in enumerate((t1 - t0, t2 - t1, t3 - t2, t4 - t3)):
+            times[i] += dt
+        # the flush coroutine:  one file write per full buffer
+        while writer.num_full:
+            card.write(writer.mvs[writer.flush_next])
+            writer.flush_next = (writer.flush_next + 1) % writer.num_buffers
+            writer.num_full -= 1
+            writes += 1
+    blocks = len(rx) // block_rx
+    audio = None
+    if keep_wav:
+        data = card.getvalue() + bytes(writer.mvs[writer.fill][:writer.pos])
+        header = wavheader.gen_wav_header(SAMPLES_PER_SECOND, bits, 1, (len(data) - wavheader.WAV_HEADER_LEN) // nb)
+        audio = header + data[wavheader.WAV_HEADER_LEN:]
+    return [t / blocks for t in times], levels, writes / (blocks * BLOCK_MS / 1000), audio
+
+def energy_db(levels):
+    return 10 * math.log10(sum(10 ** (l / 10) for l in levels) / len(levels))
+
+# the WAV read back, as 24-bit values, against the source
+def wav_error(audio, samples, bits):
+    w = wave.open(io.BytesIO(audio), 'rb')
+    nb = w.getsampwidth()
+    header_ok = (nb * 8 == bits and w.getframerate() == SAMPLES_PER_SECOND and w.getnchannels() == 1)
+    data = w.readframes(w.getnframes())
+    worst = 0
+    for i in range(len(data) // nb):
+        v = int.from_bytes(data[i * nb:(i + 1) * nb], 'little', signed=True) << (32 - 8 * nb) >> 8
+        worst = max(worst, abs(v - samples[i]))
+    return header_ok, worst
+
+def main():
+    parser = argparse.ArgumentParser(description='microphone capture path:  16, 24 and 32-bit')
+    parser.add_argument('--seconds', type=int, default=10)
+    args = parser.parse_args()
+
+    ok = True
+    loud = signal_24(args.seconds, 2000000)
+    rx = frames(loud)
+    print('{} s at 10 kS/s, {} frame blocks ({:.1f} ms), CPython us per block'.format(args.seconds, BLOCK_FRAMES, BLOCK_MS))
+    print('{:>4s} {:>8s} {:>8s} {:>8s} {:>8s} {:>8s}   {:>9s} {:>8s} {:>9s} {:>10s} {:>9s}'.format(
+          'bits', 'copy', 'dba', 'bands', 'record', 'total', 'bytes/s', 'MB/hour', 'writes/s', 'card busy', 'cap hours'))
+    for bits in (16, 24, 32):
+        times, _, writes_per_s, _ = run(bits, rx)
+        bytes_per_s = SAMPLES_PER_SECOND * bits // 8
+        busy = writes_per_s * (CARD_CALL_MS + CARD_MS_PER_KB * SD_BUFFER / 1024) / 10
+        print('{:4d} '.format(bits) + ' '.join('{:8.1f}'.format(t * 1e6) for t in times) +
+              ' {:8.1f}   {:9d} {:8.1f} {:9.2f} {:9.2f}% {:9.1f}'.format(
+              sum(times) * 1e6, bytes_per_s, bytes_per_s * 3600 / 1e6, writes_per_s, busy,
+              DISK_CAP_BYTES / bytes_per_s / 3600))
+
+    print('dB(A) and WAV content against the 24-bit source')
+    for name, rms in (('quiet', 100), ('loud', 2000000)):
+        samples = signal_24(2, rms, seed=2)
+        rx = frames(samples)
+        reference = None
+        for bits in (24, 16, 32):
+            _, levels, _, audio = run(bits, rx, keep_wav=True)
+            level = energy_db(levels)
+            if reference is None:
+                reference = level
+            header_ok, worst = wav_error(audio, samples, bits)
+            # 16-bit keeps the top 16 bits:  the error is below one 16-bit step (256 in 24-bit units)
+            exact = worst < 256 if bits == 16 else worst == 0
+            within = bits == 16 or abs(level - reference) <= TOLERANCE_DB
+            print('{:>6s} {:3d}-bit  {:6.1f} dB(A) ({:+.2f})   WAV header {}   max sample error {:6d} (24-bit units)'.format(
+                  name, bits, level, level - reference, 'ok' if header_ok else 'WRONG', worst))
+            ok = ok and header_ok and exact and within
+    print('PASS' if ok else 'FAIL')
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
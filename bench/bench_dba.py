@@ -0,0 +1,118 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Benchmark:  host dba module on recorded audio
+# - processes mic-*.wav files from the SD card (or a synthetic signal)
+# - reports the speed of each filter path as a multiple of real time
+# - checks the numpy and pure Python paths agree
+# - optionally checks results against dB(A) readings logged on the device
+#
+#   python bench/bench_dba.py [--reference dba.txt] [--seconds 3600] [mic-*.wav ...]
+#
+# --reference:  text file with one on-device dB(A) reading per line, in the
+#               order the 1 s windows were computed from the WAV file(s)
+#
+import argparse
+import math
+import os
+import random
+import struct
+import sys
+import time
+import wave
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'host'))
+import dba
+
+SAMPLES_PER_SECOND = 10000
+
+# A-weighting filter coefficients for 10 kHz, as used in streetsense.py
+COEFFA = (1.0, -2.3604841, 0.83692802, 1.54849677, -0.96903429, -0.25092355, 0.1950274)
+COEFFB = (0.61367941, -1.22735882, -0.61367941, 2.45471764, -0.61367941, -1.22735882, 0.61367941)
+
+BLOCK_BYTES = 512 * 64  # 16k samples per calc() call
+
+def wav_blocks(filenames):
+    for fn in filenames:
+        with wave.open(fn, 'rb') as w:
+            if w.getsampwidth() != 2 or w.getnchannels() != 1:
+                raise ValueError('{}: expected 16-bit mono'.format(fn))
+            while True:
+                block = w.readframes(BLOCK_BYTES // 2)
+                if not block:
+                    break
+                yield block
+
+# street-like noise:  random walk level with tones, 16-bit PCM
+def synthetic_blocks(seconds):
+    rnd = random.Random(1)
+    samples_per_block = BLOCK_BYTES // 2
+    pack = struct.Struct('<{}h'.format(samples_per_block)).pack
+    level = 1000.0
+    n = 0
+    total = seconds * SAMPLES_PER_SECOND
+    while n < total:
+        level = min(20000.0, max(50.0, level * math.exp(rnd.gauss(0, 0.05))))
+        k = min(samples_per_block, total - n)
+        block = [max(-32768, min(32767, int(level * (rnd.random() - 0.5) +
+                                        0.3 * level * math.sin(2 * math.pi * 1000 * (n + i) / SAMPLES_PER_SECOND))))
+                 for i in range(k)]
+        n += k
+        yield pack(*block) if k == samples_per_block else struct.pack('<{}h'.format(k), *block)
+
+def run(blocks, use_numpy):
+    noise = dba.DBA(samples=SAMPLES_PER_SECOND, resolution=dba.B16,
+                    coeffa=COEFFA, coeffb=COEFFB, use_numpy=use_numpy)
+    results = []
+    num_bytes = 0
+    start = time.perf_counter()
+    for block in blocks:
+        num_bytes += len(block)
+        results.extend(noise.calc_all(block))
+    elapsed = time.perf_counter() - start
+    audio_seconds = num_bytes / 2 / SAMPLES_PER_SECOND
+    print('{:7s} {:8.1f} s audio in {:6.2f} s  = {:7.1f} x real time'.format(
+        'numpy' if noise.use_numpy else 'python', audio_seconds, elapsed, audio_seconds / elapsed))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark the host dba module')
+    parser.add_argument('wavs', nargs='*', help='mic-*.wav files (16-bit mono, 10 kS/s)')
+    parser.add_argument('--seconds', type=int, default=600, help='length of synthetic signal, when no WAV given')
+    parser.add_argument('--reference', help='file of on-device dB(A) readings, one per line')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='max difference in dB')
+    args = parser.parse_args()
+
+    if args.wavs:
+        blocks = lambda: wav_blocks(args.wavs)
+    else:
+        data = list(synthetic_blocks(args.seconds))
+        blocks = lambda: iter(data)
+
+    results = {}
+    paths = [False, True] if dba.np is not None else [False]
+    for use_numpy in paths:
+        results[use_numpy] = run(blocks(), use_numpy)
+
+    ok = True
+    if len(results) == 2:
+        diff = max((abs(a - b) for a, b in zip(results[False], results[True])), default=0)
+        print('numpy vs python:  max difference = {:.4f} dB'.format(diff))
+        ok = ok and diff <= args.tolerance
+
+    if args.reference:
+        with open(args.reference) as f:
+            reference = [float(line) for line in f if line.strip()]
+        computed = results[paths[-1]]
+        n = min(len(reference), len(computed))
+        diff = max((abs(a - b) for a, b in zip(reference[:n], computed[:n])), default=0)
+        print('device vs host:   {} windows, max difference = {:.4f} dB'.format(n, diff))
+        ok = ok and diff <= args.tolerance
+
+    print('PASS' if ok else 'FAIL')
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,189 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Benchmark:  fleet analysis (host/fleet.py) on a synthetic set of SD Card dumps
+# - units x days of daily meas-*.csv files (one row per logging interval, as SDCardLogger
+#   writes them, the last file of each unit ending in a torn row) and one 16-bit
+#   mic-*.wav segment of --wav-seconds per unit.  The default is 1000 unit-months at a
+#   10 minute logging interval (--interval 120 for the device default, 5x the rows).
+#   A month of audio per unit (~50 GB) is not generated:  the WAV time per audio hour is
+#   reported instead
+# - the dataset is generated once into --data and reused
+# - runs analyze() with 1, 2, 4 ... worker processes up to the core count, and reports wall
+#   time, speedup and efficiency.  From the 1 worker run:  the serial part (walk, merge,
+#   summary) and the longest task bound the speedup (Amdahl), shown for 2 to 32 cores
+# - checks:  every pool run gives the same dataset as the 1 worker run, the recalculated
+#   O3 / NO2 daily means of the first units match the generator (per-unit calibration,
+#   from the 2-decimal logged mV), torn rows are skipped and the audio hours are complete
+#
+#   python bench/bench_fleet.py [--units 1000] [--days 30] [--data /tmp/fleet-bench]
+#
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import struct
+import sys
+import time
+import wave
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'host'))
+import fleet
+
+CHECKED_UNITS = 3
+HEADER = ('utc,pm25,o3,o3_vgas,o3_vref,no2,no2_vgas,no2_vref,tdegc,rh,laeq,lafmax,la10,la50,la90,'
+          'vusb_avg,vusb_min,vbat_avg,vbat_min\n')
+START_UTC = 1577836800 - fleet.UTC_OFFSET_HOURS * 3600  # 2020-01-01 00:00 local
+
+def unit_name(u):
+    return 'unit-{:04d}'.format(u)
+
+# one unit's card.  Returns {day: [o3 sum, no2 sum, rows]} from the logged strings, for checking
+def generate_unit(path, u, days, interval, wav_seconds, cal):
+    os.makedirs(path)
+    rnd = random.Random(u)
+    expected = {}
+    rows_per_day = 86400 // interval
+    for d in range(days):
+        local = START_UTC + fleet.UTC_OFFSET_HOURS * 3600 + d * 86400
+        t = time.gmtime(local)
+        fn = 'meas-{}-{}-{}-0-0-0.csv'.format(t.tm_year, t.tm_mon, t.tm_mday)
+        lines = [HEADER]
+        sums = [0.0, 0.0, 0]
+        for i in range(rows_per_day):
+            o3 = max(0.0, 30 + 20 * math.sin(i / rows_per_day * 2 * math.pi) + rnd.gauss(0, 5))
+            no2 = max(0.0, 20 + rnd.gauss(0, 8))
+            o3_vref = 250 + rnd.gauss(0, 0.2)
+            no2_vref = 261 + rnd.gauss(0, 0.2)
+            cols = ['{:.2f}'.format(v) for v in (o3_vref + o3 * cal[0], o3_vref, no2_vref + no2 * cal[1], no2_vref)]
+            laeq = 55 + rnd.gauss(0, 6)
+            lines.append('{},{:.0f},{:.2f},{},{},{:.2f},{},{},{:.1f},{:.1f},{:.1f},{:.1f},{:.1f},{:.1f},{:.1f},'
+                         '5.00,5.00,4.10,4.10\n'.format(
+                         START_UTC + d * 86400 + i * interval, max(0, 10 + rnd.gauss(0, 4)),
+                         o3, cols[0], cols[1], no2, cols[2], cols[3], 15 + rnd.gauss(0, 3), 60 + rnd.gauss(0, 10),
+                         laeq, laeq + 12, laeq + 5, laeq, laeq - 6))
+            sums[0] += (float(cols[0]) - float(cols[1])) / cal[0]
+            sums[1] += (float(cols[2]) - float(cols[3])) / cal[1]
+            sums[2] += 1
+        if d == days - 1:
+            lines.append(lines[-1][:len(lines[-1]) // 2])  # torn by a reset
+        with open(os.path.join(path, fn), 'w') as f:
+            f.write(''.join(lines))
+        expected[(START_UTC + d * 86400 + fleet.UTC_OFFSET_HOURS * 3600) // 86400] = sums
+    if wav_seconds:
+        n = wav_seconds * fleet.SAMPLES_PER_SECOND
+        level = rnd.uniform(300, 3000)
+        samples = [int(level * rnd.gauss(0, 1)) for _ in range(n)]
+        with wave.open(os.path.join(path, 'mic-2020-1-1-12-0-0.wav'), 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(fleet.SAMPLES_PER_SECOND)
+            w.writeframes(struct.pack('<{}h'.format(n), *[max(-32768, min(32767, s)) for s in samples]))
+    return expected
+
+def calibration(u):
+    rnd = random.Random(1000000 + u)
+    return tuple(f * rnd.uniform(0.8, 1.2) for f in fleet.CALIBRATION)
+
+def generate(data, units, days, interval, wav_seconds):
+    params = {'units': units, 'days': days, 'interval': interval, 'wav_seconds': wav_seconds}
+    marker = os.path.join(data, 'params.json')
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if json.load(f) == params:
+                return [os.path.join(data, 'cards', unit_name(u)) for u in range(units)]
+    shutil.rmtree(data, ignore_errors=True)
+    os.makedirs(os.path.join(data, 'cards'))
+    start = time.perf_counter()
+    with open(os.path.join(data, 'cal.csv'), 'w') as f:
+        f.write('unit,o3_factor,no2_factor\n')
+        for u in range(units):
+            f.write('{},{!r},{!r}\n'.format(unit_name(u), *calibration(u)))
+    for u in range(units):
+        generate_unit(os.path.join(data, 'cards', unit_name(u)), u, days, interval, wav_seconds, calibration(u))
+    with open(marker, 'w') as f:
+        json.dump(params, f)
+    print('generated {} unit-months in {:.0f} s'.format(units * days / 30, time.perf_counter() - start))
+    return [os.path.join(data, 'cards', unit_name(u)) for u in range(units)]
+
+def check(columns, args):
+    ok = True
+    rows = {(unit, day): i for i, (unit, day) in enumerate(zip(columns['unit'], columns['day']))}
+    for u in range(min(CHECKED_UNITS, args.units)):
+        scratch = os.path.join(args.data, 'check')
+        shutil.rmtree(scratch, ignore_errors=True)
+        expected = generate_unit(scratch, u, args.days, args.interval, 0, calibration(u))
+        shutil.rmtree(scratch)
+        for day, (o3, no2, n) in expected.items():
+            i = rows[(unit_name(u), time.strftime('%Y-%m-%d', time.gmtime(day * 86400)))]
+            if (columns['records'][i] != n or abs(columns['o3_mean'][i] - o3 / n) > 1e-6 or
+                    abs(columns['no2_mean'][i] - no2 / n) > 1e-6):
+                print('{} {}:  {} rows, O3 {:.4f}, NO2 {:.4f} ppb, expected {} rows, {:.4f}, {:.4f}'.format(
+                      unit_name(u), day, columns['records'][i], columns['o3_mean'][i], columns['no2_mean'][i],
+                      n, o3 / n, no2 / n))
+                ok = False
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description='fleet analysis:  scaling with worker processes')
+    parser.add_argument('--units', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--interval', type=int, default=600, help='logging interval in seconds')
+    parser.add_argument('--wav-seconds', type=int, default=2, help='audio per unit')
+    parser.add_argument('--data', default='/tmp/fleet-bench')
+    parser.add_argument('--max-jobs', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    dumps = generate(args.data, args.units, args.days, args.interval, args.wav_seconds)
+    cal = fleet.read_calibration(os.path.join(args.data, 'cal.csv'))
+    jobs = [1]
+    while jobs[-1] * 2 <= max(2, args.max_jobs):
+        jobs.append(jobs[-1] * 2)
+    print('{} unit-months, {} cores'.format(args.units * args.days / 30, os.cpu_count()))
+    print('{:>5s} {:>9s} {:>8s} {:>11s} {:>8s} {:>11s}'.format('jobs', 'wall s', 'speedup', 'efficiency', 'MB/s', 'rows/s'))
+    size = sum(os.path.getsize(os.path.join(root, fn)) for d in dumps for root, _, fns in os.walk(d) for fn in fns)
+    ok = True
+    reference = None
+    for j in jobs:
+        columns, stats = fleet.analyze(dumps, jobs=j, calibration=cal)
+        if reference is None:
+            reference, base = columns, stats
+            ok = ok and check(columns, args)
+            ok = ok and stats['skipped'] == args.units and not stats['errors']
+            ok = ok and abs(stats['audio_hours'] - args.units * args.wav_seconds / 3600) < 1e-9
+        elif columns != reference:
+            print('jobs={}:  dataset differs from the 1 worker run'.format(j))
+            ok = False
+        speedup = base['seconds'] / stats['seconds']
+        print('{:5d} {:9.1f} {:8.2f} {:10.0f}% {:8.1f} {:11.0f}'.format(j, stats['seconds'], speedup,
+              100 * speedup / min(j, os.cpu_count() or 1), size / 1e6 / stats['seconds'], stats['rows'] / stats['seconds']))
+    serial = base['seconds'] - base['task_seconds']
+    wav_s = args.units * args.wav_seconds
+    print('{} files, {} rows, {} torn rows skipped, {} unit-days, {:.0f} MB'.format(
+          base['files'], base['rows'], base['skipped'], len(reference['unit']), size / 1e6))
+    print('1 worker:  tasks {:.1f} s (longest {:.3f} s), serial part {:.1f} s ({:.1f}%)'.format(
+          base['task_seconds'], base['task_max_seconds'], serial, 100 * serial / base['seconds']))
+    print('bound on speedup:  ' + '   '.join('{} cores {:.1f}x'.format(p, base['seconds'] / max(
+          serial + base['task_seconds'] / p, serial + base['task_max_seconds'])) for p in (2, 4, 8, 16, 32)))
+    if wav_s:
+        print('WAV dB(A) with the dba module {}:  about {:.0f} s per audio hour and core'.format(
+              'on numpy' if fleet.dba.np is not None else 'in pure Python (no numpy / scipy)',
+              wav_time(dumps) * 3600 / wav_s))
+    print('PASS' if ok else 'FAIL')
+    return 0 if ok else 1
+
+# time of the WAV tasks alone, 1 worker
+def wav_time(dumps):
+    start = time.perf_counter()
+    for d in dumps:
+        for fn in os.listdir(d):
+            if fleet.file_kind(fn) == 'wav':
+                fleet.mic_wav(os.path.join(d, fn), 0)
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    sys.exit(main())
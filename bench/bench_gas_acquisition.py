@@ -0,0 +1,84 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Benchmark:  Spec Sensor gas acquisition, single-ended vs. differential ADS1219 reads
+# - runs SpecSensors.read_all() from streetsense.py against the simulated ADS1219
+#   (host/sim), on the virtual clock
+# - reports acquisition time and ADC conversions per interval, and the O3 / NO2 results:
+#   mean, standard deviation and error against the simulated inputs (world.gas_mv)
+#
+#   python bench/bench_gas_acquisition.py --intervals 60 --noise 0.05
+#
+import argparse
+import logging
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'host'))
+import simulate
+import world
+import uasyncio as asyncio
+import hal
+
+def stats(values):
+    mean = sum(values) / len(values)
+    std = math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+    return mean, std
+
+def main():
+    parser = argparse.ArgumentParser(description='single-ended vs. differential gas acquisition')
+    parser.add_argument('--intervals', type=int, default=60, help='read_all() calls per mode')
+    parser.add_argument('--noise', type=float, default=world.gas_noise_mv, help='ADC input noise, mV rms')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    world.gas_noise_mv = args.noise
+    asyncio.use_virtual_clock()
+    loop = asyncio.get_event_loop()
+    import streetsense
+    # the devices main() sets up
+    i2c = hal.i2c_bus()
+    streetsense.bus = streetsense.I2CBus(i2c)
+    streetsense.clock = streetsense.Clock(hal.rtc(i2c), streetsense.bus, streetsense.RTC_RESYNC_S)
+    streetsense.adc = hal.gas_adc(i2c)
+    measurements = streetsense.measurements
+    repo = streetsense.repo
+
+    o3_true = (world.gas_mv['AIN1'] - world.gas_mv['AIN0']) / streetsense.SpecSensors.CALIBRATION_FACTOR_OZONE
+    no2_true = (world.gas_mv['AIN2'] - world.gas_mv['AIN3']) / streetsense.SpecSensors.CALIBRATION_FACTOR_NO2
+    print('inputs:  O3 {:.2f} ppb, NO2 {:.2f} ppb, noise {} mV rms, {} intervals'.format(
+          o3_true, no2_true, args.noise, args.intervals))
+    print('{:14s} {:>10s} {:>12s} {:>20s} {:>20s} {:>10s}'.format(
+          'mode', 'acq s', 'conversions', 'O3 mean/std ppb', 'NO2 mean/std ppb', 'wall s'))
+
+    for mode in ('single_ended', 'differential'):
+        streetsense.GAS_ACQUISITION = mode
+        spec = streetsense.SpecSensors()
+        conversions = streetsense.adc.conversions
+        o3 = []
+        no2 = []
+        acq = 0
+        t0 = time.perf_counter()
+        for _ in range(args.intervals):
+            start = loop.time()
+            loop.run_until_complete(spec.read_all())
+            acq += loop.time() - start
+            o3.append(repo.current[measurements.O3])
+            no2.append(repo.current[measurements.NO2])
+        wall = time.perf_counter() - t0
+        o3_mean, o3_std = stats(o3)
+        no2_mean, no2_std = stats(no2)
+        print('{:14s} {:10.2f} {:12.1f} {:>20s} {:>20s} {:10.2f}'.format(
+              mode, acq / args.intervals,
+              (streetsense.adc.conversions - conversions) / args.intervals,
+              '{:.2f} / {:.2f}'.format(o3_mean, o3_std),
+              '{:.2f} / {:.2f}'.format(no2_mean, no2_std), wall))
+        print('{:14s} {:>10s} {:>12s} {:>20s} {:>20s}'.format(
+              '', '', 'error', '{:+.2f}'.format(o3_mean - o3_true), '{:+.2f}'.format(no2_mean - no2_true)))
+
+if __name__ == '__main__':
+    main()
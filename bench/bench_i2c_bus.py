@@ -0,0 +1,95 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Benchmark:  I2C bus traffic and ADS1219 DRDY latency, with and without the cached clock
+# and si7021 readings (i2cbus.py)
+# - runs streetsense.py with simulated devices on the virtual clock (microphone off, no
+#   display), once per configuration, each in its own process.  The simulated bus blocks
+#   for the transfer time at 400 kHz, and the si7021 driver for its conversions
+#   - 'uncached':  RTC_RESYNC_S = 0 and TH_MAX_AGE_MS = 0, a DS3231 read for every
+#     timestamp and a si7021 read every second (previous behaviour)
+#   - 'cached':  the streetsense.py settings
+#   - 'demo':  the streetsense.py settings in DEMO mode, no interval timer:  checks the
+#     clock is still resynced every RTC_RESYNC_S (Clock.run_sync)
+# - reports I2C transactions per interval (total and per device), the longest wait for
+#   the bus and the worst DRDY edge to data read latency
+#
+#   python bench/bench_i2c_bus.py --hours 2 --interval 120
+#
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+
+HOST = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'host')
+
+# (name, mode, RTC_RESYNC_S, TH_MAX_AGE_MS), None = streetsense.py setting
+CONFIGS = (('uncached', 'normal', 0, 0),
+           ('cached', 'normal', None, None),
+           ('demo', 'demo', None, None))
+
+DEVICES = ((0x68, 'rtc'), (0x40, 'si7021'), (0x41, 'adc'))
+
+# one simulation, results printed as JSON
+def child(config, hours, interval):
+    name, mode, resync_s, th_max_age_ms = CONFIGS[config]
+    sys.path.insert(0, HOST)
+    import simulate
+    import world
+    logging.disable(logging.WARNING)
+    import streetsense
+    if resync_s is not None:
+        streetsense.RTC_RESYNC_S = resync_s
+    if th_max_age_ms is not None:
+        streetsense.TH_MAX_AGE_MS = th_max_age_ms
+    with tempfile.TemporaryDirectory(prefix='streetsense-sd-') as sd_root:
+        errors = simulate.simulate(hours * 3600, sd_root, interval=interval, mode=mode,
+                                   virtual=True, mic=False)
+    i2c = streetsense.i2c
+    print(json.dumps({'errors': len(errors),
+                      'intervals': sum(1 for topic, _ in world.mqtt_messages if b'/groups/' in topic),
+                      'transactions': i2c.transactions,
+                      'by_address': {str(addr): n for addr, n in i2c.by_address.items()},
+                      'wait_max_us': streetsense.bus.wait_max_us,
+                      'drdy_max_us': streetsense.spec_sensors.drdy_max_us,
+                      'clock_syncs': streetsense.clock.syncs,
+                      'resync_s': streetsense.RTC_RESYNC_S}))
+
+def main():
+    parser = argparse.ArgumentParser(description='I2C bus:  cached clock and si7021 readings')
+    parser.add_argument('--hours', type=float, default=2)
+    parser.add_argument('--interval', type=int, default=120, help='measurement interval in seconds')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child is not None:
+        child(args.child, args.hours, args.interval)
+        return
+
+    print('{} simulated hours, interval {} s, microphone off, no display'.format(args.hours, args.interval))
+    print('{:10s} {:>9s} {:>14s} {:>8s} {:>8s} {:>8s} {:>12s} {:>14s} {:>14s}'.format(
+          'config', 'intervals', 'i2c/interval', 'rtc', 'si7021', 'adc', 'clock syncs', 'bus wait ms', 'DRDY max ms'))
+    for n, (name, mode, _, _) in enumerate(CONFIGS):
+        out = subprocess.run([sys.executable, __file__, '--hours', str(args.hours), '--interval', str(args.interval),
+                              '--child', str(n)],
+                             check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        intervals = max(1, r['intervals'])
+        per_device = [r['by_address'].get(str(addr), 0) / intervals for addr, _ in DEVICES]
+        print('{:10s} {:9d} {:14.1f} {:8.1f} {:8.1f} {:8.1f} {:12d} {:14.1f} {:14.2f}'.format(
+              name, r['intervals'], r['transactions'] / intervals, *per_device,
+              r['clock_syncs'], r['wait_max_us'] / 1000, r['drdy_max_us'] / 1000))
+        if r['errors']:
+            print('  stopped by an exception in a coroutine')
+        if mode == 'demo':
+            # the constructor read, then one resync every RTC_RESYNC_S before the end
+            expected = 1 + (int(args.hours * 3600) - 1) // r['resync_s']
+            print('  demo clock syncs:  {} (expected {}) {}'.format(
+                  r['clock_syncs'], expected, 'PASS' if r['clock_syncs'] >= expected else 'FAIL'))
+
+if __name__ == '__main__':
+    main()
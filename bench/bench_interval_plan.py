@@ -0,0 +1,116 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Benchmark:  the work done each interval (taskplan.py), sequential vs. parallel steps
+# - runs streetsense.py with simulated devices on the virtual clock (microphone off, no
+#   display), once per plan, each in its own process
+# - reports the wall time of the interval's work, the mean duration of each step, and an
+#   energy proxy per interval:  nominal currents times the time each load is on
+#   - CPU awake for the interval's work, WiFi radio on (resume() to pause()), PMS5003 on
+# - check:  a plan where a step raises still finishes, the step is counted as failed and
+#   the steps after it run
+#
+#   python bench/bench_interval_plan.py --hours 2 --interval 120
+#
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+
+HOST = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'host')
+
+# (name, INTERVAL_PLAN, POWER_CONFLICTS)
+PLANS = (('sequential', 'sequential', (('pm', 'gas'),)),
+         ('parallel', 'parallel', (('pm', 'gas'),)),
+         ('parallel, wifi/gas', 'parallel', (('pm', 'gas'), ('wifi', 'gas'))))
+
+# nominal supply currents, mA
+CPU_MA = 40
+WIFI_MA = 120
+PM_MA = 100
+
+# one simulation, results printed as JSON
+def child(plan, conflicts, hours, interval):
+    sys.path.insert(0, HOST)
+    import simulate
+    import world
+    logging.disable(logging.WARNING)
+    import streetsense
+    streetsense.INTERVAL_PLAN = plan
+    streetsense.POWER_CONFLICTS = conflicts
+    with tempfile.TemporaryDirectory(prefix='streetsense-sd-') as sd_root:
+        errors = simulate.simulate(hours * 3600, sd_root, interval=interval, virtual=True, mic=False)
+    p = streetsense.interval_timer.plan
+    print(json.dumps({'errors': len(errors),
+                      'runs': p.runs,
+                      'wall_ms': p.total_wall_ms,
+                      'steps': {step.name: p.total_ms[i] for i, step in enumerate(p.steps)},
+                      'wifi_s': world.wifi_on_seconds,
+                      'messages': len(world.mqtt_messages)}))
+
+# a plan with a raising step:  run() returns, the failure is counted, the later steps run
+def check_failed_step():
+    sys.path.insert(0, HOST)
+    import simulate
+    import uasyncio as asyncio
+    from taskplan import Step, Plan
+    ran = []
+
+    async def good():
+        ran.append('good')
+
+    async def bad():
+        raise OSError(5)
+
+    async def last():
+        ran.append('last')
+
+    plan = Plan([Step('good', good), Step('bad', bad, after=('good',)), Step('last', last, after=('bad',))])
+    logging.disable(logging.CRITICAL)
+    try:
+        asyncio.get_event_loop().run_until_complete(asyncio.wait_for(plan.run(), 5))
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        logging.disable(logging.NOTSET)
+    return ran == ['good', 'last'] and plan.failures == 1 and bytes(plan.state) == bytes([2, 3, 2])
+
+def main():
+    parser = argparse.ArgumentParser(description='interval work:  sequential vs. parallel steps')
+    parser.add_argument('--hours', type=float, default=2)
+    parser.add_argument('--interval', type=int, default=120, help='measurement interval in seconds')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        name, plan, conflicts = PLANS[int(args.child)]
+        child(plan, conflicts, args.hours, args.interval)
+        return
+
+    print('step raises:  {}'.format('PASS' if check_failed_step() else 'FAIL'))
+    print('{} simulated hours, interval {} s, microphone off, no display'.format(args.hours, args.interval))
+    print('energy proxy:  CPU {} mA while working, WiFi {} mA, PMS5003 {} mA'.format(CPU_MA, WIFI_MA, PM_MA))
+    print('{:20s} {:>6s} {:>8s} {:>9s} {:>8s} {:>8s} {:>8s} {:>9s} {:>8s}'.format(
+          'plan', 'runs', 'wall s', 'publish s', 'pm s', 'gas s', 'wifi s', 'mAs', 'sent'))
+    for n, (name, plan, conflicts) in enumerate(PLANS):
+        out = subprocess.run([sys.executable, __file__, '--hours', str(args.hours), '--interval', str(args.interval),
+                              '--child', str(n)],
+                             check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        runs = max(1, r['runs'])
+        wall = r['wall_ms'] / 1000 / runs
+        steps = {step: ms / 1000 / runs for step, ms in r['steps'].items()}
+        wifi = r['wifi_s'] / runs
+        charge = CPU_MA * wall + WIFI_MA * wifi + PM_MA * steps.get('pm', 0)
+        print('{:20s} {:6d} {:8.2f} {:9.2f} {:8.2f} {:8.2f} {:8.2f} {:9.0f} {:8d}'.format(
+              name, r['runs'], wall, steps.get('publish', 0), steps.get('pm', 0), steps.get('gas', 0),
+              wifi, charge, r['messages']))
+        if r['errors']:
+            print('  stopped by an exception in a coroutine')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Benchmark:  measurement log write latency over a simulated month
+# - one record per 2 minute interval for 30 days (21600 records)
+# - 'reopen':  open(fn, 'a+') / write / close per record (the previous SDCardLogger)
+# - 'buffered':  long-lived handle, records batched in RAM, flushed every N records, 
+#   daily file rollover (the current SDCardLogger)
+# - reports mean, p99 and max latency per record, and the file system calls made
+#
+# Run against a mounted SD card for meaningful numbers, e.g. 
+#   python bench/bench_logger.py --dir /media/sdcard
+# A host file system hides the FAT cluster-chain cost that grows with the file length
+#
+import argparse
+import os
+import tempfile
+import time
+
+INTERVAL_IN_SECS = 60*2
+DAYS = 30
+LINE = b'1577836800,12,21.53,150.21,148.22,8.20,140.10,139.01,21.5,45.2,62.3,80.1,4.98,4.95,4.10,4.09\n'
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def run_reopen(directory, records):
+    fn = os.path.join(directory, 'meas-reopen.csv')
+    latency = []
+    calls = 0
+    for i in range(records):
+        start = time.perf_counter()
+        f = open(fn, 'ab')
+        f.write(LINE)
+        f.close()
+        latency.append(time.perf_counter() - start)
+        calls += 3
+    return latency, calls
+
+def run_buffered(directory, records, flush_records):
+    records_per_day = 24 * 3600 // INTERVAL_IN_SECS
+    buffer = bytearray(4096)
+    mv = memoryview(buffer)
+    latency = []
+    calls = 0
+    f = None
+    buffered = 0
+    count = 0
+    for i in range(records):
+        start = time.perf_counter()
+        if i % records_per_day == 0:
+            if f is not None:
+                f.write(mv[:buffered])
+                f.close()
+                calls += 2
+                buffered = 0
+                count = 0
+            f = open(os.path.join(directory, 'meas-day{}.csv'.format(i // records_per_day)), 'wb')
+            calls += 1
+        mv[buffered:buffered + len(LINE)] = LINE
+        buffered += len(LINE)
+        count += 1
+        if count >= flush_records:
+            f.write(mv[:buffered])
+            f.flush()
+            os.fsync(f.fileno())
+            calls += 2
+            buffered = 0
+            count = 0
+        latency.append(time.perf_counter() - start)
+    f.write(mv[:buffered])
+    f.close()
+    return latency, calls
+
+def report(name, latency, calls):
+    print('{:14s} mean {:7.1f} us   p99 {:8.1f} us   max {:8.1f} us   total {:6.3f} s   fs calls {}'.format(
+        name, 1e6 * sum(latency) / len(latency), 1e6 * percentile(latency, 0.99),
+        1e6 * max(latency), sum(latency), calls))
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark measurement log writes over a month')
+    parser.add_argument('--dir', help='directory on the file system to test (default: temporary)')
+    parser.add_argument('--flush-records', type=int, default=15)
+    args = parser.parse_args()
+    records = DAYS * 24 * 3600 // INTERVAL_IN_SECS
+    print('{} records ({} days at {} s intervals)'.format(records, DAYS, INTERVAL_IN_SECS))
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        report('reopen', *run_reopen(tmp, records))
+        report('buffered x{}'.format(args.flush_records), *run_buffered(tmp, records, args.flush_records))
+
+main()
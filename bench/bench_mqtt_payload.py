@@ -0,0 +1,186 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Benchmark:  MQTT bytes on the wire, publish time and radio on time per interval
+# - the published fields are streetsense.MQTT_FIELDS
+# - 'feeds qos0':  one publish per field to '<user>/feeds/<key>', QoS 0 (the original MQTTPublish)
+# - 'feeds qos1':  one publish per field, QoS 1, each waiting for its PUBACK
+# - 'group qos1':  one group feed publish (mqttpayload.py), QoS 1 (the current MQTTPublish)
+# - a minimal local broker (asyncio TCP server) answers CONNECT and PUBLISH, adding
+#   --rtt-ms of latency to each reply to model the WiFi link
+# - bytes on the wire count MQTT packets plus TCP/IP headers (40 bytes per segment,
+#   one segment per packet, and a bare TCP ACK for packets that get no reply)
+# - publish time is the time the radio must stay on after the connection is back,
+#   it does not include WiFi association
+# - radio on time:  MQTTPublish resumes the WiFi for each interval's send and pauses it
+#   after, so the radio is on for the WiFi association and broker reconnect (--connect-s,
+#   the simulator's world.wifi_connect_seconds by default) plus the publish time.  The
+#   charge is the radio on time times a nominal WiFi current (as bench_interval_plan.py)
+#
+#   python bench/bench_mqtt_payload.py --rtt-ms 30 --intervals 50
+#
+import argparse
+import asyncio
+import logging
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'host'))
+import simulate
+import world
+logging.disable(logging.WARNING)
+import streetsense
+import measurements
+from measurements import MeasurementRepo
+from mqttpayload import GroupPayload, group_topic
+
+TCPIP_HEADER_BYTES = 40
+USER = streetsense.MQTT_USER
+FIELDS = streetsense.MQTT_FIELDS
+WIFI_MA = 120  # nominal supply current with the radio on
+
+def remaining_length(n):
+    out = bytearray()
+    while True:
+        byte = n % 128
+        n //= 128
+        out.append(byte | 0x80 if n else byte)
+        if not n:
+            return bytes(out)
+
+def publish_packet(topic, payload, qos, pid):
+    body = struct.pack('!H', len(topic)) + topic
+    if qos:
+        body += struct.pack('!H', pid)
+    body += payload
+    return bytes([0x30 | (qos << 1)]) + remaining_length(len(body)) + body
+
+def connect_packet(client_id):
+    body = b'\x00\x04MQTT\x04\x02\x00\x3c' + struct.pack('!H', len(client_id)) + client_id
+    return b'\x10' + remaining_length(len(body)) + body
+
+async def read_packet(reader):
+    first = (await reader.readexactly(1))[0]
+    n = 0
+    shift = 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        n |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    return first, await reader.readexactly(n)
+
+class Broker():
+    def __init__(self, rtt_ms):
+        self.rtt = rtt_ms / 1000
+        self.received = 0
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                first, body = await read_packet(reader)
+                kind = first >> 4
+                if kind == 1:
+                    await asyncio.sleep(self.rtt)
+                    writer.write(b'\x20\x02\x00\x00')
+                elif kind == 3:
+                    self.received += 1
+                    topic_len = struct.unpack_from('!H', body)[0]
+                    if (first >> 1) & 3:
+                        pid = body[2 + topic_len:4 + topic_len]
+                        await asyncio.sleep(self.rtt)
+                        writer.write(b'\x40\x02' + pid)
+                elif kind == 14:
+                    break
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass
+        writer.close()
+
+def values(repo, i):
+    for channel, value in ((measurements.PM25, 12 + i % 5), (measurements.O3, 21.53), (measurements.NO2, 8.2),
+                           (measurements.TDEGC, 21.5), (measurements.RH, 45.2), (measurements.DBA, 62.3 + i % 7),
+                           (measurements.VBAT, 4.1), (measurements.LAEQ, 62.3 + i % 7), (measurements.LAFMAX, 74.8),
+                           (measurements.LASMAX, 70.1), (measurements.LA10, 66.5), (measurements.LA50, 61.2),
+                           (measurements.LA90, 55.9)):
+        repo.add(channel, value)
+
+def messages(path, repo, group):
+    if path == 'group qos1':
+        return [(group_topic(USER, 'streetsense').encode(), group.encode(repo).encode())], 1
+    qos = 0 if path == 'feeds qos0' else 1
+    msgs = []
+    for key, channel, stat, decimals in FIELDS:
+        value = getattr(repo.get(channel), stat)
+        msgs.append(('{}/feeds/{}'.format(USER, key).encode(), '{:.{}f}'.format(value, decimals).encode()))
+    return msgs, qos
+
+async def run_path(path, port, intervals, rtt):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(connect_packet(b'streetsense'))
+    await read_packet(reader)
+    repo = MeasurementRepo(clock=time.time)
+    group = GroupPayload(FIELDS)
+    wire = 0
+    elapsed = 0.0
+    pid = 0
+    for i in range(intervals):
+        values(repo, i)
+        msgs, qos = messages(path, repo, group)
+        start = time.perf_counter()
+        for topic, payload in msgs:
+            pid = pid % 65535 + 1
+            packet = publish_packet(topic, payload, qos, pid)
+            writer.write(packet)
+            await writer.drain()
+            wire += len(packet) + TCPIP_HEADER_BYTES
+            if qos:
+                await read_packet(reader)
+                wire += 4 + TCPIP_HEADER_BYTES
+            else:
+                wire += TCPIP_HEADER_BYTES
+        if not qos:
+            # QoS 0 has no reply to wait for, but the frames still take one trip to leave the radio
+            await asyncio.sleep(rtt / 2)
+        elapsed += time.perf_counter() - start
+        repo.clear_all_stats()
+    writer.write(b'\xe0\x00')
+    await writer.drain()
+    # wait for the broker to close the connection
+    await reader.read()
+    writer.close()
+    return wire / intervals, elapsed / intervals
+
+async def run(args):
+    broker = Broker(args.rtt_ms)
+    server = await asyncio.start_server(broker.handle, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    print('{} fields, radio on:  {} s to reconnect + publish time, {} mA'.format(len(FIELDS), args.connect_s, WIFI_MA))
+    print('{:12s} {:>16s} {:>20s} {:>14s} {:>10s}'.format(
+          'path', 'bytes/interval', 'publish ms/interval', 'radio s', 'mAs'))
+    for path in ('feeds qos0', 'feeds qos1', 'group qos1'):
+        wire, elapsed = await run_path(path, port, args.intervals, args.rtt_ms / 1000)
+        radio_s = args.connect_s + elapsed
+        print('{:12s} {:16.0f} {:20.1f} {:14.3f} {:10.1f}'.format(path, wire, elapsed * 1000, radio_s, radio_s * WIFI_MA))
+    repo = MeasurementRepo(clock=time.time)
+    values(repo, 0)
+    print('group payload: {}'.format(GroupPayload(FIELDS).encode(repo)))
+    server.close()
+    await server.wait_closed()
+
+def main():
+    parser = argparse.ArgumentParser(description='MQTT payload benchmark')
+    parser.add_argument('--rtt-ms', type=float, default=30, help='broker round trip time')
+    parser.add_argument('--intervals', type=int, default=50)
+    parser.add_argument('--connect-s', type=float, default=world.wifi_connect_seconds,
+                        help='WiFi association and broker reconnect time')
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Benchmark:  noise statistics (noisestats.py) on recorded audio
+# - streams mic-*.wav files from the SD card (or a synthetic street signal) through the
+#   host dba module in 125 ms blocks and NoiseStats, as the microphone coroutine does
+# - checks every interval against an offline computation on the whole signal:  A-weighted
+#   samples, Leq of the interval, fast / slow exponential time weighting per sample (LAFmax,
+#   LASmax), and L10 / L50 / L90 from the sorted fast weighted levels at 125 ms steps
+# - reports the cost of update() and report(), and the arithmetic mean of the 1 s slow
+#   weighted levels (averaged in dB, as the previous 'dba_avg') next to Leq
+# - checks that an interval without blocks reports NaN for every statistic
+#
+#   python bench/bench_noise.py [--interval 60] [--seconds 300] [mic-*.wav ...]
+#
+import argparse
+import math
+import os
+import random
+import struct
+import sys
+import time
+import wave
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'host'))
+import dba
+import noisestats
+from noisestats import NoiseStats
+
+SAMPLES_PER_SECOND = 10000
+BLOCK_MS = 125
+BLOCK_SAMPLES = SAMPLES_PER_SECOND * BLOCK_MS // 1000
+SECTOR_BYTES = 512  # calc() is fed one SD Card sector at a time, as on the device
+
+# A-weighting filter coefficients for 10 kHz, as used in streetsense.py
+COEFFA = (1.0, -2.3604841, 0.83692802, 1.54849677, -0.96903429, -0.25092355, 0.1950274)
+COEFFB = (0.61367941, -1.22735882, -0.61367941, 2.45471764, -0.61367941, -1.22735882, 0.61367941)
+
+# (summary column, name, tolerance in dB)
+METRICS = ((noisestats.LEQ, 'Leq', 0.05),
+           (noisestats.LAFMAX, 'LAFmax', 0.5),
+           (noisestats.LASMAX, 'LASmax', 0.2),
+           (noisestats.L10, 'L10', 0.25),
+           (noisestats.L50, 'L50', 0.25),
+           (noisestats.L90, 'L90', 0.25))
+
+def wav_samples(filenames):
+    data = bytearray()
+    for fn in filenames:
+        with wave.open(fn, 'rb') as w:
+            if w.getsampwidth() != 2 or w.getnchannels() != 1:
+                raise ValueError('{}: expected 16-bit mono'.format(fn))
+            data += w.readframes(w.getnframes())
+    return bytes(data)
+
+# street-like noise:  a background level with random walk, and pass-by events that rise
+# and fall over a few seconds, 16-bit PCM
+def synthetic_samples(seconds):
+    rnd = random.Random(1)
+    samples = []
+    background = 300.0
+    event_t = 0
+    for n in range(seconds * SAMPLES_PER_SECOND):
+        if n % 1000 == 0:
+            background = min(3000.0, max(50.0, background * math.exp(rnd.gauss(0, 0.05))))
+            if event_t <= 0 and rnd.random() < 0.02:
+                event_t = rnd.randint(2, 8) * SAMPLES_PER_SECOND
+                event_len = event_t
+                event_peak = rnd.uniform(2000, 20000)
+        level = background
+        if event_t > 0:
+            level += event_peak * math.sin(math.pi * event_t / event_len)
+            event_t -= 1
+        samples.append(max(-32768, min(32767, int(level * (rnd.random() - 0.5)))))
+    return struct.pack('<{}h'.format(len(samples)), *samples)
+
+def level_db(mean_sqr, ref_ampl):
+    if mean_sqr <= 0:
+        return 0.0
+    return dba.MIC_OFFSET_DB + dba.MIC_REF_DB + 10 * math.log10(mean_sqr / ref_ampl ** 2)
+
+# streaming, as on the device:  one summary per interval, and the 1 s dB(A) levels
+def streaming(data, interval_s):
+    noise = dba.DBA(samples=BLOCK_SAMPLES, resolution=dba.B16, coeffa=COEFFA, coeffb=COEFFB)
+    stats = NoiseStats(BLOCK_MS / 1000)
+    blocks_per_interval = interval_s * 1000 // BLOCK_MS
+    summaries = []
+    levels_1s = []
+    blocks = 0
+    update_s = 0
+    report_s = 0
+    for start in range(0, len(data), SECTOR_BYTES):
+        res = noise.calc(data[start:start + SECTOR_BYTES])
+        if res is None:
+            continue
+        t0 = time.perf_counter()
+        stats.update(res)
+        update_s += time.perf_counter() - t0
+        blocks += 1
+        if blocks % (1000 // BLOCK_MS) == 0:
+            levels_1s.append(stats.las())
+        if blocks % blocks_per_interval == 0:
+            t0 = time.perf_counter()
+            stats.report()
+            report_s += time.perf_counter() - t0
+            summaries.append(list(stats.summary))
+    return summaries, levels_1s, update_s / max(1, blocks), report_s / max(1, len(summaries))
+
+# offline:  the whole signal A-weighted sample by sample, then per interval statistics
+def offline(data, interval_s):
+    n = len(data) // 2
+    x = struct.unpack('<{}h'.format(n), data[:2 * n])
+    ref_ampl = math.pow(10, dba.MIC_SENSITIVITY / 20) * 32767
+    a = COEFFA
+    b = COEFFB
+    order = len(a) - 1
+    z = [0.0] * order
+    fast_k = 1 / (noisestats.FAST_TAU_S * SAMPLES_PER_SECOND)
+    slow_k = 1 / (noisestats.SLOW_TAU_S * SAMPLES_PER_SECOND)
+    fast = slow = 0.0
+    interval_samples = interval_s * SAMPLES_PER_SECOND
+    summaries = []
+    sum_sqr = 0.0
+    fast_max = slow_max = 0.0
+    fast_levels = []
+    for i, s in enumerate(x):
+        y = b[0] * s + z[0]
+        for k in range(order - 1):
+            z[k] = b[k + 1] * s + z[k + 1] - a[k + 1] * y
+        z[order - 1] = b[order] * s - a[order] * y
+        sqr = y * y
+        sum_sqr += sqr
+        fast += (sqr - fast) * fast_k
+        slow += (sqr - slow) * slow_k
+        fast_max = max(fast_max, fast)
+        slow_max = max(slow_max, slow)
+        if (i + 1) % BLOCK_SAMPLES == 0:
+            fast_levels.append(level_db(fast, ref_ampl))
+        if (i + 1) % interval_samples == 0:
+            ordered = sorted(fast_levels, reverse=True)
+            exceeded = lambda pct: ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+            summary = [0] * noisestats.NUM_SUMMARY
+            summary[noisestats.LEQ] = level_db(sum_sqr / interval_samples, ref_ampl)
+            summary[noisestats.LAFMAX] = level_db(fast_max, ref_ampl)
+            summary[noisestats.LASMAX] = level_db(slow_max, ref_ampl)
+            summary[noisestats.L10] = exceeded(10)
+            summary[noisestats.L50] = exceeded(50)
+            summary[noisestats.L90] = exceeded(90)
+            summaries.append(summary)
+            sum_sqr = 0.0
+            fast_max = slow_max = 0.0
+            fast_levels = []
+    return summaries
+
+def main():
+    parser = argparse.ArgumentParser(description='noise statistics:  streaming vs. offline')
+    parser.add_argument('wavs', nargs='*', help='mic-*.wav files (16-bit mono, 10 kS/s)')
+    parser.add_argument('--seconds', type=int, default=300, help='length of synthetic signal, when no WAV given')
+    parser.add_argument('--interval', type=int, default=60, help='reporting interval in seconds')
+    args = parser.parse_args()
+
+    data = wav_samples(args.wavs) if args.wavs else synthetic_samples(args.seconds)
+    summaries, levels_1s, update_s, report_s = streaming(data, args.interval)
+    reference = offline(data, args.interval)
+    print('{} intervals of {} s, {} ms blocks'.format(len(summaries), args.interval, BLOCK_MS))
+    print('update() {:.1f} us, report() {:.1f} us (CPython), histogram {} bytes'.format(
+          update_s * 1e6, report_s * 1e6, noisestats.NUM_BINS * 4))
+
+    print('{:>8s}'.format('interval') + ''.join('{:>16s}'.format(name) for _, name, _ in METRICS) + '{:>16s}'.format('mean of dB'))
+    per_second = args.interval
+    for k, (s, r) in enumerate(zip(summaries, reference)):
+        mean_db = sum(levels_1s[k * per_second:(k + 1) * per_second]) / per_second
+        print('{:8d}'.format(k) + ''.join('{:>16s}'.format('{:.1f} / {:.1f}'.format(s[col], r[col])) for col, _, _ in METRICS) +
+              '{:16.1f}'.format(mean_db))
+
+    ok = True
+    for col, name, tolerance in METRICS:
+        diff = max((abs(s[col] - r[col]) for s, r in zip(summaries, reference)), default=0)
+        print('{:8s} max difference = {:.3f} dB (tolerance {} dB)'.format(name, diff, tolerance))
+        ok = ok and diff <= tolerance
+    empty = NoiseStats(BLOCK_MS / 1000)
+    empty.report()
+    nan = all(v != v for v in empty.summary)
+    print('interval without blocks:  {}'.format('all NaN' if nan else 'WRONG ' + str(list(empty.summary))))
+    ok = ok and nan
+    print('PASS' if ok else 'FAIL')
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
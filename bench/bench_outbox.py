@@ -0,0 +1,257 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Benchmark:  store-and-forward MQTT outbox (outbox.py) against an unreliable broker
+# - readings are queued every interval (9 messages, as MQTTPublish does) while a fake
+#   broker randomly fails publishes and goes offline for stretches of intervals
+# - the device is "reset" at random points:  the Outbox is recreated from the files,
+#   sometimes with a torn message appended to the outbox file
+# - checks that every message reaches the broker, oldest first, at least once
+# - reports duplicates, drain throughput (messages/s) and the outbox size on disk
+# - long outage:  with a small max_bytes, the file size stays below max_bytes +
+#   compact_bytes while the oldest messages are dropped
+# - corruption:  a message in the middle of the file is damaged before a reset (a payload
+#   byte, or a garbage header with 0xFFFF lengths).  Only that message is lost, the
+#   messages after it are still delivered, and no read asks for more than a message
+# - garbage run:  --garbage-kb of random bytes in the middle of a large outbox.  Reports
+#   the start-up recovery time and the file reads it takes
+#
+#   python bench/bench_outbox.py --intervals 2000 --failure-rate 0.05
+#
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import outbox as outbox_module
+from outbox import Outbox, MAX_MESSAGE_BYTES
+
+FEEDS = 9
+
+class FakeBroker():
+    def __init__(self, failure_rate, rng):
+        self.failure_rate = failure_rate
+        self.rng = rng
+        self.online = True
+        self.received = []
+
+    async def publish(self, topic, payload):
+        if not self.online:
+            raise OSError('not connected')
+        if self.rng.random() < self.failure_rate:
+            # half of the failures lose the PUBACK after the broker got the message
+            if self.rng.random() < 0.5:
+                self.received.append(payload)
+            raise OSError('no PUBACK')
+        self.received.append(payload)
+
+def check_delivery(received, expected):
+    # each message at least once, and the first copies in order
+    first = {}
+    for i, payload in enumerate(received):
+        first.setdefault(payload, i)
+    missing = [p for p in expected if p not in first]
+    order = [first[p] for p in expected if p in first]
+    in_order = all(a < b for a, b in zip(order, order[1:]))
+    return missing, in_order
+
+async def run(args):
+    rng = random.Random(args.seed)
+    directory = tempfile.mkdtemp()
+    fn = os.path.join(directory, 'outbox.dat')
+    checkpoint_fn = os.path.join(directory, 'outbox.ckp')
+    broker = FakeBroker(args.failure_rate, rng)
+    outbox = Outbox(fn, checkpoint_fn)
+    expected = []
+    resets = 0
+    torn = 0
+    max_pending = 0
+    drain_time = 0.0
+    sent = 0
+    offline_left = 0
+
+    for interval in range(args.intervals):
+        for feed in range(FEEDS):
+            payload = '{}:{}'.format(interval, feed).encode()
+            outbox.put('user/feeds/{}'.format(feed), payload)
+            expected.append(payload)
+        max_pending = max(max_pending, outbox.pending_bytes())
+
+        if offline_left:
+            offline_left -= 1
+        elif rng.random() < args.outage_rate:
+            offline_left = rng.randint(1, args.max_outage)
+        broker.online = offline_left == 0
+
+        start = time.perf_counter()
+        sent += await outbox.drain(broker.publish, batch_size=10, pacing_ms=0, max_batches=30)
+        drain_time += time.perf_counter() - start
+
+        if rng.random() < args.reset_rate:
+            if rng.random() < 0.5:
+                # reset during put():  part of a message reached the card
+                with open(fn, 'ab') as f:
+                    f.write(b'\x0c\x00\x05\x00user/fe')
+                torn += 1
+            outbox = Outbox(fn, checkpoint_fn)
+            resets += 1
+
+    # final drain with a healthy broker
+    broker.online = True
+    broker.failure_rate = 0
+    while outbox.pending_bytes():
+        start = time.perf_counter()
+        sent += await outbox.drain(broker.publish, batch_size=10, pacing_ms=0, max_batches=30)
+        drain_time += time.perf_counter() - start
+
+    missing, in_order = check_delivery(broker.received, expected)
+    print('messages queued:      {}'.format(len(expected)))
+    print('messages received:    {} ({} duplicates)'.format(len(broker.received), len(broker.received) - len(set(broker.received))))
+    print('missing:              {}'.format(len(missing)))
+    print('in order:             {}'.format(in_order))
+    print('resets:               {} ({} with a torn message)'.format(resets, torn))
+    print('max outbox backlog:   {} bytes'.format(max_pending))
+    print('drain throughput:     {:.0f} messages/s (host file system)'.format(sent / drain_time if drain_time else 0))
+    for name in (fn, checkpoint_fn):
+        if os.path.exists(name):
+            os.remove(name)
+    os.rmdir(directory)
+    if missing or not in_order:
+        raise SystemExit('FAILED')
+
+# queue through a long outage, then deliver.  Returns (largest file size, delivered newest)
+async def long_outage(directory, max_bytes, compact_bytes, intervals):
+    fn = os.path.join(directory, 'outage.dat')
+    outbox = Outbox(fn, os.path.join(directory, 'outage.ckp'), max_bytes, compact_bytes)
+    largest = 0
+    for interval in range(intervals):
+        for feed in range(FEEDS):
+            outbox.put('user/feeds/{}'.format(feed), '{}:{}'.format(interval, feed))
+        largest = max(largest, os.path.getsize(fn))
+    broker = FakeBroker(0, random.Random(1))
+    while outbox.pending_bytes():
+        await outbox.drain(broker.publish, batch_size=10, pacing_ms=0, max_batches=30)
+    return largest, broker.received[-1] == '{}:{}'.format(intervals - 1, FEEDS - 1).encode()
+
+# the outbox module's open(), counting the reads and the largest read request
+class CountingFile():
+    reads = 0
+    largest = 0
+
+    def __init__(self, f):
+        self.f = f
+
+    def read(self, n=-1):
+        CountingFile.reads += 1
+        CountingFile.largest = max(CountingFile.largest, n)
+        return self.f.read(n)
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.f.close()
+
+def counting_open(*args):
+    return CountingFile(open(*args))
+
+# damage the 6th message, reset, deliver.  Returns the payloads received
+# damage:  'payload' flips a payload byte, 'length' writes a header with 0xFFFF lengths
+async def corrupted(directory, damage):
+    fn = os.path.join(directory, 'corrupt.dat')
+    checkpoint_fn = os.path.join(directory, 'corrupt.ckp')
+    outbox = Outbox(fn, checkpoint_fn)
+    offsets = []
+    for k in range(12):
+        offsets.append(outbox.size)
+        outbox.put('user/feeds/0', '{}'.format(k))
+    with open(fn, 'r+b') as f:
+        if damage == 'payload':
+            f.seek(offsets[6] - 5)
+            f.write(b'x')
+        else:
+            f.seek(offsets[5])
+            f.write(b'\xff\xff\xff\xff')
+    CountingFile.largest = 0
+    outbox_module.open = counting_open
+    outbox = Outbox(fn, checkpoint_fn)
+    del outbox_module.open
+    broker = FakeBroker(0, random.Random(1))
+    await outbox.drain(broker.publish, batch_size=20, pacing_ms=0, max_batches=1)
+    return broker.received, CountingFile.largest
+
+# random bytes in the middle of an outbox of messages, reset.  Returns (recovery s,
+# reads, messages left)
+def garbage_run(directory, garbage_bytes, messages=2000):
+    fn = os.path.join(directory, 'garbage.dat')
+    checkpoint_fn = os.path.join(directory, 'garbage.ckp')
+    outbox = Outbox(fn, checkpoint_fn, max_bytes=10 * 1024 * 1024)
+    rng = random.Random(2)
+    for k in range(messages):
+        outbox.put('user/feeds/{}'.format(k % FEEDS), '{}:{}'.format(k, rng.random()))
+        if k == messages // 2:
+            with open(fn, 'ab') as f:
+                f.write(bytes(rng.getrandbits(8) for _ in range(garbage_bytes)))
+            outbox.size += garbage_bytes
+    CountingFile.reads = 0
+    outbox_module.open = counting_open
+    start = time.perf_counter()
+    outbox = Outbox(fn, checkpoint_fn, max_bytes=10 * 1024 * 1024)
+    elapsed = time.perf_counter() - start
+    del outbox_module.open
+    left = len(outbox.read_batch(messages + 1))
+    return elapsed, CountingFile.reads, left
+
+async def checks(garbage_kb):
+    directory = tempfile.mkdtemp()
+    max_bytes, compact_bytes = 20000, 5000
+    largest, newest = await long_outage(directory, max_bytes, compact_bytes, 2000)
+    expected = [str(k).encode() for k in range(12) if k != 5]
+    ok = True
+    for damage in ('payload', 'length'):
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        received, largest_read = await corrupted(directory, damage)
+        good = received == expected and largest_read <= MAX_MESSAGE_BYTES + 4
+        print('corrupt {:8s}      {} of 11 others delivered, largest read {} bytes{}'.format(
+              damage + ':', len([p for p in received if p in expected]), largest_read, '' if good else ', FAILED'))
+        ok = ok and good
+    elapsed, reads, left = garbage_run(directory, garbage_kb * 1024)
+    print('garbage run:          {} kB recovered in {:.1f} ms, {} reads, {} of 2000 messages kept{}'.format(
+          garbage_kb, elapsed * 1000, reads, left, '' if left == 2000 else ', FAILED'))
+    ok = ok and left == 2000
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+    bounded = largest <= max_bytes + compact_bytes + 100
+    print('long outage:          file at most {} bytes (max_bytes {} + compact_bytes {}){}'.format(
+          largest, max_bytes, compact_bytes, '' if bounded and newest else ', FAILED'))
+    return bounded and newest and ok
+
+def main():
+    parser = argparse.ArgumentParser(description='outbox delivery benchmark')
+    parser.add_argument('--intervals', type=int, default=2000)
+    parser.add_argument('--failure-rate', type=float, default=0.05, help='publish failures per message')
+    parser.add_argument('--outage-rate', type=float, default=0.02, help='outages per interval')
+    parser.add_argument('--max-outage', type=int, default=50, help='longest outage, in intervals')
+    parser.add_argument('--reset-rate', type=float, default=0.01, help='resets per interval')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--garbage-kb', type=int, default=16, help='random bytes in the garbage run')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    asyncio.run(run(args))
+    if not asyncio.run(checks(args.garbage_kb)):
+        raise SystemExit('FAILED')
+
+if __name__ == '__main__':
+    main()
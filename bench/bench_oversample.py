@@ -0,0 +1,94 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Benchmark:  gas ADC capture, fixed 100-sample mean vs. adaptive oversampling (oversample.py)
+# - ADC traces at 20 SPS:  a constant input plus Gaussian noise, and optionally impulse
+#   spikes (e.g. radio bursts coupling into the sensor leads)
+# - every method captures until it stops (update() returns True), as the DRDY loop
+#   in SpecSensors.read() does, then estimates
+# - reports mean capture time and RMS error, in mV and in O3 ppb
+#
+# Traces are simulated unless a file of recorded codes (one integer per line) is given:
+#   python bench/bench_oversample.py --trace codes.txt
+#
+import argparse
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from oversample import Oversampler
+
+VREF_MV = 2048
+CODES_PER_MV = 0x7FFFFF / VREF_MV
+DATA_RATE = 20
+O3_MV_PER_PPB = 21.7913e-3
+
+# (name, max samples, min samples, target standard error in mV, trim)
+METHODS = (('mean, 100 fixed', 100, 100, 0, 0),
+           ('trimmed 10%', 100, 20, 0.005, 0.1),
+           ('median', 100, 20, 0.005, 0.5))
+
+# (name, noise mV rms, spike probability, spike amplitude mV)
+SCENARIOS = (('quiet', 0.01, 0, 0),
+             ('noisy', 0.05, 0, 0),
+             ('spikes', 0.02, 0.03, 2.0))
+
+def simulated_trace(rng, value_mv, noise_mv, spike_p, spike_mv, n):
+    codes = []
+    for _ in range(n):
+        mv = value_mv + rng.gauss(0, noise_mv)
+        if rng.random() < spike_p:
+            mv += spike_mv * rng.choice((-1, 1))
+        codes.append(int(mv * CODES_PER_MV))
+    return codes
+
+def capture(oversampler, trace):
+    oversampler.reset()
+    for code in trace:
+        oversampler.add(code)
+        if oversampler.update():
+            break
+    return oversampler.captured(), oversampler.estimate() / CODES_PER_MV
+
+def run(traces, truth_mv):
+    print('{:18s} {:>10s} {:>10s} {:>12s} {:>12s}'.format('method', 'samples', 'capture s', 'rms err mV', 'rms err ppb'))
+    for name, max_samples, min_samples, target_se_mv, trim in METHODS:
+        oversampler = Oversampler(max_samples, min_samples, target_se_mv * CODES_PER_MV, trim)
+        total_n = 0
+        sq_err = 0
+        for trace in traces:
+            n, mv = capture(oversampler, trace)
+            total_n += n
+            sq_err += (mv - truth_mv) ** 2
+        rms = math.sqrt(sq_err / len(traces))
+        print('{:18s} {:10.1f} {:10.2f} {:12.4f} {:12.2f}'.format(
+              name, total_n / len(traces), total_n / len(traces) / DATA_RATE, rms, rms / O3_MV_PER_PPB))
+
+def main():
+    parser = argparse.ArgumentParser(description='gas ADC capture:  fixed mean vs. adaptive oversampling')
+    parser.add_argument('--trials', type=int, default=500)
+    parser.add_argument('--trace', help='recorded ADC codes, one per line (truth = median of the file)')
+    args = parser.parse_args()
+
+    if args.trace:
+        with open(args.trace) as f:
+            codes = [int(line) for line in f if line.strip()]
+        truth_mv = sorted(codes)[len(codes) // 2] / CODES_PER_MV
+        traces = [codes[i:i + 100] for i in range(0, len(codes) - 99, 100)]
+        print('{}:  {} captures'.format(args.trace, len(traces)))
+        run(traces, truth_mv)
+        return
+
+    rng = random.Random(1)
+    value_mv = -1.5
+    for name, noise_mv, spike_p, spike_mv in SCENARIOS:
+        print('\n{}:  noise {} mV rms, spikes {:.0%} of {} mV, {} trials'.format(name, noise_mv, spike_p, spike_mv, args.trials))
+        traces = [simulated_trace(rng, value_mv, noise_mv, spike_p, spike_mv, 100) for _ in range(args.trials)]
+        run(traces, value_mv)
+
+if __name__ == '__main__':
+    main()
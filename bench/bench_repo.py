@@ -0,0 +1,162 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Micro-benchmark:  MeasurementRepo.add()
+# - compares the array-backed repo with the previous namedtuple/dict repo
+# - reports time and heap allocation per add(), for a channel without history and
+#   for a history channel with 10 adds per second, and with time moving 1 s per add (a
+#   new 1 s bucket every time, as the once a second dB(A) reading does)
+# - checks window() against the average of the raw samples, for windows served by
+#   each history tier, and that a window longer than the history raises ValueError
+#
+# runs under CPython (allocations counted with tracemalloc) or on the
+# device under MicroPython (allocations counted with gc.mem_alloc)
+#
+#   python bench/bench_repo.py
+#
+import os
+import sys
+import gc
+from collections import namedtuple
+try:
+    import utime as time
+    ticks_us = time.ticks_us
+    ticks_diff = time.ticks_diff
+except ImportError:
+    import time
+    ticks_us = lambda: int(time.perf_counter() * 1000000)
+    ticks_diff = lambda a, b: a - b
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+except AttributeError:
+    # MicroPython has no os.path:  the modules are next to the bench on the device
+    sys.path.insert(0, '')
+import measurements
+from measurements import MeasurementRepo
+
+NUM_ADDS = 10000
+REPEAT = 5  # best time of
+
+#
+# the repo as it was before the array-backed rewrite
+#
+class LegacyMeasurementRepo():
+    Measurement = namedtuple('Measurement', 'current min max sum avg count')
+
+    def __init__(self):
+        self.measurement_repo = {}
+
+    def add(self, measurement, value):
+        if not measurement in self.measurement_repo:
+            self.measurement_repo[measurement] = LegacyMeasurementRepo.Measurement(current=None, min=None, max=None, sum=0, avg=0, count=0)
+        min =  self.measurement_repo[measurement].min
+        if min is None or value < min:
+            min = value
+        max =  self.measurement_repo[measurement].max
+        if max is None or value > max:
+            max = value
+        sum = self.measurement_repo[measurement].sum + value
+        count = self.measurement_repo[measurement].count + 1
+        avg = sum / count
+        self.measurement_repo[measurement] = LegacyMeasurementRepo.Measurement(current=value, min=min, max=max, sum=sum, avg=avg, count=count)
+
+def alloc_start():
+    gc.collect()
+    if tracemalloc:
+        tracemalloc.start()
+        return 0
+    return gc.mem_alloc()
+
+def alloc_stop(start):
+    if tracemalloc:
+        # CPython frees each temporary immediately, so the peak of traced
+        # memory is reported.  Under MicroPython the gc is disabled during
+        # the run and mem_alloc() gives the total bytes allocated
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak
+    return gc.mem_alloc() - start
+
+# timed without tracemalloc (which slows every allocation), best of REPEAT passes, then
+# one more pass counts the allocations
+def run(name, add, channel, values):
+    gc.collect()
+    gc.disable()
+    dt = None
+    for _ in range(REPEAT):
+        t = ticks_us()
+        for v in values:
+            add(channel, v)
+        d = ticks_diff(ticks_us(), t)
+        if dt is None or d < dt:
+            dt = d
+    a = alloc_start()
+    for v in values:
+        add(channel, v)
+    allocated = alloc_stop(a)
+    gc.enable()
+    print('{:10s} {:8.2f} us/add  {:8d} bytes allocated{}'.format(name, dt / len(values), allocated,
+                                                             ' (peak)' if tracemalloc else ''))
+
+# window() against the samples:  one sample per second, whole buckets in the window
+def check_window():
+    t = [0]
+    repo = MeasurementRepo(clock=lambda: t[0])
+    samples = []
+    for k in range(3 * 86400):
+        t[0] = k
+        v = 50 + (k * 7919) % 101 / 10
+        repo.add(measurements.PM25, v)
+        samples.append(v)
+    ok = True
+    for seconds in (60, 240, 3600, 5 * 3600, 86400, 2 * 86400):
+        res = [r for r, n in measurements.HISTORY_TIERS if r * n >= seconds][0]
+        # the window starts at a bucket boundary and ends with the open bucket
+        last = (t[0] // res + 1) * res
+        window = samples[last - seconds:]
+        got = repo.window('pm25', seconds)
+        buckets = [window[i:i + res] for i in range(0, len(window), res)]
+        avgs = [sum(b) / len(b) for b in buckets]
+        expect = sum(avgs) / len(avgs)
+        good = (got.count == len(avgs) and abs(got.avg - expect) < 0.01 and
+                abs(got.min - min(avgs)) < 0.01 and abs(got.max - max(avgs)) < 0.01)
+        print('window {:6d} s:  {:4d} buckets avg {:.3f} (samples {:.3f}) {}'.format(
+              seconds, got.count, got.avg, expect, 'ok' if good else 'WRONG'))
+        ok = ok and good
+    try:
+        repo.window('pm25', 8 * 86400)
+        print('window longer than the history:  no error')
+        ok = False
+    except ValueError:
+        pass
+    return ok
+
+def main():
+    # dBA-like values, already boxed so the loop measures add() only
+    values = [40.0 + (i % 500) / 10 for i in range(NUM_ADDS)]
+    run('legacy', LegacyMeasurementRepo().add, 'dba', values)
+    repo = MeasurementRepo()
+    run('array', repo.add, measurements.OCT63, values)
+    assert abs(repo.get('oct63').avg - sum(values) / len(values)) < 0.01  # all passes
+    t = [0]
+    def tick():
+        t[0] += 1
+        return t[0]
+    def tick_10():
+        t[0] += 1
+        return t[0] // 10
+    repo = MeasurementRepo(clock=tick_10)
+    run('hist 10/s', repo.add, measurements.DBA, values)
+    repo = MeasurementRepo(clock=tick)
+    run('hist 1/s', repo.add, measurements.DBA, values)
+    assert abs(repo.get('dba').avg - sum(values) / len(values)) < 0.01  # all passes
+    print('PASS' if check_window() else 'FAIL')
+
+main()
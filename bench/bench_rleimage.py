@@ -0,0 +1,121 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Benchmark:  splash image loading, whole-file read vs. RLE row decoding (rleimage.py)
+# - 'raw':  f.read() of the RGB565 image (the previous show_welcome_screens)
+# - 'rle':  RLEImage.read_row() for every row into one row buffer, as the LVGL decoder does
+#   while drawing into the 320x10 display buffer.  'rows' reads and decodes each row on its
+#   own (strip_rows=1, the first version), 'strips' a STRIP_ROWS strip per readinto()
+# - reports file size, time, decode throughput and peak memory (tracemalloc), and checks
+#   the decoded pixels against the raw image
+# - times are CPython:  they compare the paths, they are not the boot time on the device
+#
+# Uses a synthetic 320x240 splash (flat background, bands, a logo with anti-aliased edges)
+# unless images are given:
+#   python bench/bench_rleimage.py --size 320x240 street_sense_b_rgb565.bin
+#
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'host'))
+import rleimage
+import png2rle
+
+def synthetic_splash(width, height):
+    rng = random.Random(1)
+    data = bytearray()
+    for y in range(height):
+        for x in range(width):
+            if (x - width // 2) ** 2 + (y - height // 2) ** 2 < (height // 3) ** 2:
+                # logo:  a few colors with noisy edges
+                pixel = 0xF800 if (x // 16 + y // 16) % 2 else 0x07E0
+                if rng.random() < 0.05:
+                    pixel = rng.randrange(0x10000)
+            elif y < height // 6:
+                pixel = 0x001F  # banner
+            else:
+                pixel = 0xFFFF  # background
+            data += pixel.to_bytes(2, 'big')
+    return width, height, bytes(data)
+
+# best of 5 without tracemalloc (it slows the decode loop several times), then the peak
+# memory of one more run
+def measure(fn_run):
+    elapsed = None
+    for _ in range(5):
+        start = time.perf_counter()
+        fn_run()
+        t = time.perf_counter() - start
+        elapsed = t if elapsed is None else min(elapsed, t)
+    tracemalloc.start()
+    fn_run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+def bench(name, width, height, data, directory):
+    raw_fn = os.path.join(directory, 'image.bin')
+    rle_fn = os.path.join(directory, 'image.rle')
+    with open(raw_fn, 'wb') as f:
+        f.write(data)
+    with open(rle_fn, 'wb') as f:
+        f.write(png2rle.encode(width, height, data))
+
+    def read_raw():
+        with open(raw_fn, 'rb') as f:
+            f.read()
+
+    decoded = bytearray(len(data))
+
+    def read_rle(strip_rows):
+        image = rleimage.RLEImage(rle_fn, strip_rows)
+        row = bytearray(width * 2)
+        for y in range(height):
+            image.read_row(y, 0, width, row)
+            decoded[y * width * 2:(y + 1) * width * 2] = row
+        image.close()
+
+    raw_time, raw_peak = measure(read_raw)
+    pixels = width * height
+    print('{} ({}x{})'.format(name, width, height))
+    print('  raw:         {:7d} bytes  {:8.2f} ms  peak {:7d} bytes'.format(len(data), raw_time * 1000, raw_peak))
+    ok = True
+    for mode, strip_rows in (('rows', 1), ('strips', rleimage.STRIP_ROWS)):
+        rle_time, rle_peak = measure(lambda: read_rle(strip_rows))
+        good = decoded == data
+        ok = ok and good
+        reads = (height + strip_rows - 1) // strip_rows
+        print('  rle {:7s}  {:7d} bytes  {:8.2f} ms  peak {:7d} bytes  {:.2f} Mpixel/s  {:3d} file reads{}'.format(
+            mode + ':', os.path.getsize(rle_fn), rle_time * 1000, rle_peak, pixels / rle_time / 1e6, reads,
+            '' if good else '  WRONG PIXELS'))
+    os.remove(raw_fn)
+    os.remove(rle_fn)
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description='RLE splash image benchmark')
+    parser.add_argument('images', nargs='*', help='raw RGB565 images')
+    parser.add_argument('--size', default='320x240', help='WxH of the raw images')
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+    ok = True
+    if args.images:
+        for fn in args.images:
+            width, height, data = png2rle.load_raw(fn, args.size)
+            ok = bench(fn, width, height, data, directory) and ok
+    else:
+        ok = bench('synthetic splash', *synthetic_splash(320, 240), directory)
+    os.rmdir(directory)
+    print('PASS' if ok else 'FAIL')
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
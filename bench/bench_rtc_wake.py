@@ -0,0 +1,85 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Benchmark:  waiting for the DS3231 alarm between intervals, I2C polling vs. the INT interrupt
+# - runs streetsense.py with simulated devices on the virtual clock (microphone off, no
+#   display), once per wake mode, each in its own process:
+#   - 'poll':  alarm flag read over I2C every 250 ms (previous behaviour)
+#   - 'interrupt':  DS3231 INT on GPIO 36, the timer waits on a flag in RAM
+#   - 'interrupt + light sleep':  as 'interrupt', the ESP32 light sleeps between intervals
+# - reports I2C transactions per interval (total and per device), event loop passes per
+#   second, and the share of time in light sleep
+#
+#   python bench/bench_rtc_wake.py --hours 2 --interval 120
+#
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HOST = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'host')
+
+MODES = (('poll', 'poll', False),
+         ('interrupt', 'interrupt', False),
+         ('interrupt + light sleep', 'interrupt', True))
+
+DEVICES = ((0x68, 'rtc'), (0x40, 'si7021'), (0x41, 'adc'))
+
+# one simulation, results printed as JSON
+def child(wake, light_sleep, hours, interval):
+    sys.path.insert(0, HOST)
+    import simulate
+    import world
+    import uasyncio as asyncio
+    logging.disable(logging.WARNING)
+    import streetsense
+    streetsense.RTC_ALARM_WAKE = wake
+    streetsense.LIGHT_SLEEP = light_sleep
+    with tempfile.TemporaryDirectory(prefix='streetsense-sd-') as sd_root:
+        cpu = time.process_time()
+        errors = simulate.simulate(hours * 3600, sd_root, interval=interval, virtual=True, mic=False)
+        cpu = time.process_time() - cpu
+    i2c = streetsense.i2c
+    print(json.dumps({'errors': len(errors),
+                      'intervals': sum(1 for topic, _ in world.mqtt_messages if b'/groups/' in topic),
+                      'transactions': i2c.transactions,
+                      'by_address': {str(addr): n for addr, n in i2c.by_address.items()},
+                      'passes': asyncio.get_event_loop().passes,
+                      'light_sleep_s': world.light_sleep_seconds,
+                      'cpu_s': cpu}))
+
+def main():
+    parser = argparse.ArgumentParser(description='DS3231 alarm wait:  I2C polling vs. interrupt')
+    parser.add_argument('--hours', type=float, default=2)
+    parser.add_argument('--interval', type=int, default=120, help='measurement interval in seconds')
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child[0], args.child[1] == '1', args.hours, args.interval)
+        return
+
+    seconds = args.hours * 3600
+    print('{} simulated hours, interval {} s, microphone off, no display'.format(args.hours, args.interval))
+    print('{:24s} {:>9s} {:>14s} {:>8s} {:>8s} {:>8s} {:>12s} {:>12s} {:>8s}'.format(
+          'mode', 'intervals', 'i2c/interval', 'rtc', 'si7021', 'adc', 'passes/s', 'light sleep', 'cpu s'))
+    for name, wake, light_sleep in MODES:
+        out = subprocess.run([sys.executable, __file__, '--hours', str(args.hours), '--interval', str(args.interval),
+                              '--child', wake, '1' if light_sleep else '0'],
+                             check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        intervals = max(1, r['intervals'])
+        per_device = [r['by_address'].get(str(addr), 0) / intervals for addr, _ in DEVICES]
+        print('{:24s} {:9d} {:14.1f} {:8.1f} {:8.1f} {:8.1f} {:12.1f} {:11.1f}% {:8.2f}'.format(
+              name, r['intervals'], r['transactions'] / intervals, *per_device,
+              r['passes'] / seconds, 100 * r['light_sleep_s'] / seconds, r['cpu_s']))
+        if r['errors']:
+            print('  stopped by an exception in a coroutine')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Benchmark:  inline 512 byte SD writes vs. the buffered SDWriter
+# - a capture coroutine models the I2S DMA memory (64 x 256 frames of 8 bytes, 10 kS/s)
+#   and produces 512 byte sectors as run_mic does
+# - the SD Card is a file object whose write() blocks for a modelled latency:
+#   fixed cost per call + cost per kB + occasional long stalls (FAT updates, wear levelling)
+# - reports write calls per second, worst-case stall seen by the capture loop and
+#   DMA overrun count for each approach.  The card stalls are random (1% of the calls):
+#   in a short run the few 16 kB writes may see none, --seconds 60 shows the same worst
+#   stall for every buffer size
+# - preallocated segment cut by a reset (recorder.py):  records through the flush coroutine
+#   into a preallocated WAV, stops without closing it, recovers it and checks that the
+#   header holds the audio up to the last checkpoint, not the preallocated size
+#
+#   python bench/bench_sdwriter.py [--seconds 10]
+#
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from sdwriter import SDWriter
+from recorder import SegmentRecorder
+import tempfile
+import wavheader
+
+SAMPLES_PER_SECOND = 10000
+NUM_BYTES_RX = 8
+BLOCK_RX = 2048     # 256 frames
+SECTOR = 512        # 256 x 16-bit samples
+DMA_CAPACITY = 64 * 256 * NUM_BYTES_RX
+
+class ModelSDCard():
+    def __init__(self, call_ms=1.5, ms_per_kb=0.4, stall_ms=120, stall_per_call=0.01, seed=1):
+        self.call_ms = call_ms
+        self.ms_per_kb = ms_per_kb
+        self.stall_ms = stall_ms
+        self.stall_per_call = stall_per_call
+        self.rnd = random.Random(seed)
+        self.calls = 0
+
+    def write(self, data):
+        self.calls += 1
+        ms = self.call_ms + self.ms_per_kb * len(data) / 1024
+        if self.rnd.random() < self.stall_per_call:
+            ms += self.stall_ms
+        time.sleep(ms / 1000)
+        return len(data)
+
+    def seek(self, pos):
+        pass
+
+async def capture(seconds, sink):
+    sector = bytearray(SECTOR)
+    start = time.perf_counter()
+    consumed = 0
+    overruns = 0
+    max_gap = 0
+    last = start
+    while True:
+        now = time.perf_counter()
+        if now - start > seconds:
+            break
+        max_gap = max(max_gap, now - last)
+        last = now
+        produced = int((now - start) * SAMPLES_PER_SECOND * NUM_BYTES_RX)
+        if produced - consumed > DMA_CAPACITY:
+            # oldest samples overwritten
+            overruns += 1
+            consumed = produced - DMA_CAPACITY
+        if produced - consumed >= BLOCK_RX:
+            consumed += BLOCK_RX
+            sink(sector)
+            await asyncio.sleep(0)
+        else:
+            await asyncio.sleep(0.002)
+    return overruns, max_gap
+
+async def run_inline(seconds, card):
+    return await capture(seconds, card.write)
+
+async def run_buffered(seconds, card, buffer_size, num_buffers):
+    writer = SDWriter(card, buffer_size=buffer_size, num_buffers=num_buffers)
+    flush_task = asyncio.ensure_future(writer.run_flush())
+    result = await capture(seconds, writer.write)
+    flush_task.cancel()
+    return result + (writer.dropped_blocks,)
+
+def report(name, seconds, card, overruns, max_gap, dropped=0):
+    print('{:18s} {:7.1f} writes/s   worst stall {:6.1f} ms   overruns {:3d}   dropped blocks {}'.format(
+        name, card.calls / seconds, max_gap * 1000, overruns, dropped))
+
+# record seconds of 16-bit audio into a preallocated 60 s segment, then "reset".
+# Returns (bytes of audio written to the file, header data size after recovery, file size)
+async def preallocated_reset(directory, seconds, checkpoint_bytes):
+    writer = SDWriter(buffer_size=8192, num_buffers=3)
+    recorder = SegmentRecorder(directory, 'mic', lambda: 'mic-2020-1-1-0-0-0.wav', writer, SAMPLES_PER_SECOND, 16,
+                               60, 1 << 30, preallocate=True, checkpoint_bytes=checkpoint_bytes)
+    recorder.start()
+    flush_task = asyncio.ensure_future(writer.run_flush())
+    sector = bytes(range(256)) * 2
+    for _ in range(seconds * SAMPLES_PER_SECOND * 2 // SECTOR):
+        recorder.write(sector)
+        await asyncio.sleep(0.001)
+    await asyncio.sleep(0.05)
+    flush_task.cancel()
+    written = writer.file_bytes - wavheader.WAV_HEADER_LEN
+    recorder.f.close()  # the reset:  no close_segment()
+    recorder = SegmentRecorder(directory, 'mic', None, writer, SAMPLES_PER_SECOND, 16, 60, 1 << 30,
+                               preallocate=True, checkpoint_bytes=checkpoint_bytes)
+    recorder.recover()
+    fn = os.path.join(directory, 'mic-2020-1-1-0-0-0.wav')
+    with open(fn, 'rb') as f:
+        datasize = wavheader.read_data_size(f)
+    size = os.path.getsize(fn)
+    os.remove(fn)
+    return written, datasize, size
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark SD writes of the audio stream')
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    card = ModelSDCard()
+    overruns, max_gap = asyncio.run(run_inline(args.seconds, card))
+    report('inline 512 B', args.seconds, card, overruns, max_gap)
+
+    for buffer_size in (4096, 8192, 16384):
+        card = ModelSDCard()
+        overruns, max_gap, dropped = asyncio.run(run_buffered(args.seconds, card, buffer_size, 3))
+        report('buffered 3x{}k'.format(buffer_size // 1024), args.seconds, card, overruns, max_gap, dropped)
+
+    directory = tempfile.mkdtemp()
+    checkpoint_bytes = 65536
+    written, datasize, size = asyncio.run(preallocated_reset(directory, 10, checkpoint_bytes))
+    os.rmdir(directory)
+    ok = 0 < datasize <= written and datasize > written - checkpoint_bytes - 8192
+    print('preallocated reset:  {} bytes written, {} in the recovered header ({} byte file){}'.format(
+          written, datasize, size, '' if ok else ', FAILED'))
+    print('PASS' if ok else 'FAIL')
+
+main()
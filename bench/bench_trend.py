@@ -0,0 +1,85 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Benchmark:  trend chart data path, zero-copy rings (trend.py) vs. rebuilding the points
+# - 'ring':  Trend.add() writes one slot per series and moves the start index, the chart
+#   reads the rings in place (as Display.show_trend_screen does)
+# - 'rebuild':  every new sample shifts each series' point list and copies it into the
+#   chart point array (what lv.chart set_points / set_next on a plain list costs)
+# - reports time and bytes allocated per new sample (tracemalloc), for 4 series and
+#   several chart lengths.  The LVGL drawing is the same for both and is not included:
+#   on the device the DISP:refresh debug log and the t_disp diagnostics probe give the
+#   refresh time and heap use with the chart shown
+#
+#   python bench/bench_trend.py --samples 2000
+#
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import trend
+from trend import Trend
+
+# (channel, lo, hi) for dB(A), PM2.5, NO2, O3
+CHANNELS = ((0, 30, 110), (1, 0, 100), (2, 0, 100), (3, 0, 100))
+
+def scaled(value, lo, hi):
+    return max(0, min(trend.RANGE, int((value - lo) * trend.RANGE / (hi - lo))))
+
+def values_at(k):
+    return (60 + k % 40, k % 90, (k * 3) % 70, (k * 7) % 50)
+
+def ring(points):
+    t = Trend(CHANNELS, points)
+    def step(k):
+        t.add(values_at(k))
+        return t.head  # the series start_point
+    return step
+
+def rebuild(points):
+    lists = [[trend.NO_POINT] * points for _ in CHANNELS]
+    chart = [array('h', [trend.NO_POINT] * points) for _ in CHANNELS]
+    def step(k):
+        values = values_at(k)
+        for i, (channel, lo, hi) in enumerate(CHANNELS):
+            lists[i] = lists[i][1:] + [scaled(values[channel], lo, hi)]
+            chart[i][:] = array('h', lists[i])
+    return step
+
+def measure(make, points, samples):
+    step = make(points)
+    for k in range(points):  # fill
+        step(k)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    peak_alloc = 0
+    start = time.perf_counter()
+    for k in range(samples):
+        step(points + k)
+        current, peak = tracemalloc.get_traced_memory()
+        peak_alloc = max(peak_alloc, peak - before)
+        tracemalloc.reset_peak()
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+    return elapsed / samples, peak_alloc
+
+def main():
+    parser = argparse.ArgumentParser(description='trend chart:  zero-copy rings vs. rebuilt point lists')
+    parser.add_argument('--samples', type=int, default=2000)
+    args = parser.parse_args()
+    print('4 series, {} new samples per run, time includes tracemalloc overhead'.format(args.samples))
+    print('{:>7s} {:>10s} {:>14s} {:>18s}'.format('points', 'method', 'us / sample', 'peak alloc bytes'))
+    for points in (60, 180, 720):
+        for name, make in (('ring', ring), ('rebuild', rebuild)):
+            us, alloc = measure(make, points, args.samples)
+            print('{:7d} {:>10s} {:14.1f} {:18d}'.format(points, name, us * 1e6, alloc))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Benchmark:  simulated time per wall-clock second, application on the virtual clock
+# - runs streetsense.py with simulated devices (host/simulate.py --virtual) for a number
+#   of simulated hours
+# - reports simulated hours per wall-clock second, event loop passes, log records and
+#   MQTT messages (expected:  one of each per measurement interval)
+# - the microphone is off unless --mic is given:  it reads the I2S DMA memory every
+#   few ms of simulated time and dominates the run time
+#
+#   python bench/bench_virtual_clock.py --hours 24 --interval 120
+#
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'host'))
+import simulate
+import world
+import uasyncio as asyncio
+
+def main():
+    parser = argparse.ArgumentParser(description='simulated hours per wall-clock second')
+    parser.add_argument('--hours', type=float, default=6)
+    parser.add_argument('--interval', type=int, default=120, help='measurement interval in seconds')
+    parser.add_argument('--mic', action='store_true', help='with microphone capture')
+    args = parser.parse_args()
+
+    # the application logs every sensor reading at INFO level
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory(prefix='streetsense-sd-') as sd_root:
+        t0 = time.perf_counter()
+        errors = simulate.simulate(args.hours * 3600, sd_root, interval=args.interval,
+                                   virtual=True, mic=args.mic)
+        wall = time.perf_counter() - t0
+        passes = asyncio.get_event_loop().passes
+        records = 0
+        for fn in os.listdir(sd_root):
+            if fn.startswith('meas-'):
+                with open(os.path.join(sd_root, fn), 'rb') as f:
+                    records += f.read().count(b'\n') - 1
+
+    print('simulated:  {:.2f} hours, interval {} s, microphone {}'.format(
+          args.hours, args.interval, 'on' if args.mic else 'off'))
+    print('wall clock:  {:.2f} s'.format(wall))
+    print('speed:  {:.2f} simulated hours per wall-clock second ({:.0f}x real time)'.format(
+          args.hours / wall, args.hours * 3600 / wall))
+    print('event loop passes:  {} ({:.0f} per simulated second)'.format(
+          passes, passes / (args.hours * 3600)))
+    print('log records:  {}, MQTT messages:  {}'.format(records, len(world.mqtt_messages)))
+    if errors:
+        raise SystemExit('stopped by an exception in a coroutine')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Compact binary measurement log
+#
+# File layout (little-endian):
+#   header:  magic 'SSLG' (4s), version (H), record size (H), field count (H), names length (H),
+#            field names:  comma separated ASCII, padded with spaces to a multiple of 4 bytes
+#   records: utc (I), one float32 (f) per field, CRC-32 of the preceding bytes of the record (I)
+#
+# A record is written with a single write, so a reset can only leave a torn record at the
+# end of the file.  Readers skip records whose CRC does not match (see host/logconv.py)
+#
+try:
+    import ustruct as struct
+    import ubinascii as binascii
+except ImportError:
+    import struct
+    import binascii
+
+MAGIC = b'SSLG'
+VERSION = 1
+HEADER_FORMAT = '<4sHHHH'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+def record_format(num_fields):
+    return '<I{}f'.format(num_fields)
+
+def record_size(num_fields):
+    return struct.calcsize(record_format(num_fields)) + 4
+
+def gen_header(names):
+    num_fields = len(names)
+    names = ','.join(names).encode()
+    names += b' ' * (-len(names) % 4)
+    return struct.pack(HEADER_FORMAT, MAGIC, VERSION, record_size(num_fields),
+                       num_fields, len(names)) + names
+
+# returns (version, record size, field names, header length) from the start of a file
+def parse_header(data):
+    magic, version, rec_size, num_fields, names_len = struct.unpack(HEADER_FORMAT, data[:HEADER_SIZE])
+    if magic != MAGIC:
+        raise ValueError('not a Street Sense binary log')
+    if version != VERSION:
+        raise ValueError('unsupported binary log version {}'.format(version))
+    names = bytes(data[HEADER_SIZE:HEADER_SIZE + names_len]).decode().strip().split(',')
+    if len(names) != num_fields:
+        raise ValueError('corrupt binary log header')
+    return version, rec_size, names, HEADER_SIZE + names_len
+
+#
+# packs records into a preallocated buffer
+#
+class RecordPacker():
+    def __init__(self, num_fields):
+        self.format = record_format(num_fields)
+        self.crc_offset = struct.calcsize(self.format)
+        self.record = bytearray(self.crc_offset + 4)
+        self.mv = memoryview(self.record)
+
+    # returns the packed record (valid until the next call)
+    def pack(self, utc, values):
+        struct.pack_into(self.format, self.record, 0, utc, *values)
+        crc = binascii.crc32(self.mv[:self.crc_offset]) & 0xFFFFFFFF
+        struct.pack_into('<I', self.record, self.crc_offset, crc)
+        return self.record
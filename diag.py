@@ -0,0 +1,225 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Diagnostics:  latency histograms for coroutines, the event loop, sensors and I/O
+# - every probe has a fixed integer handle, used as an index into preallocated arrays
+#   (as the measurement channels in measurements.py).  record() is O(number of bins),
+#   allocates nothing and does nothing while diagnostics are disabled
+# - durations are counted in bins with 1-2-5 upper bounds, from 100 us to 5 s.
+#   Percentiles are the upper bound of the bin holding the percentile, capped at the
+#   largest duration recorded
+# - probes:
+#   - coroutines:  run time of every step, i.e. the time between two awaits, while the
+#     coroutine holds the CPU (see timed())
+#   - event loop lag:  how late a periodic sleep wakes up (see run_lag_monitor())
+#   - sensor acquisition:  time to read a sensor, including waits
+#   - SD Card and MQTT:  file writes and QoS 1 publish round trips
+#   - I2C:  latency of the ADS1219 data read after the DRDY interrupt
+# - report() summarizes the probes (p50, p95, max, count) into a fixed array and starts
+#   new histograms.  The summary is written to the SD Card, published with MQTT and the
+#   live histograms are shown on the diagnostics screen (see streetsense.py)
+#
+# Memory:  17 probes x 16 bins x 4 bytes = 1.1 kB of histograms, plus ~0.5 kB of counters
+#
+from array import array
+try:
+    import utime
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+    import time
+    class utime():
+        ticks_us = lambda: int(time.perf_counter() * 1000000)
+        ticks_diff = lambda a, b: a - b
+
+###################################
+#    Probes
+###################################
+#
+# coroutine steps
+TASK_TIMER = 0
+TASK_MQTT = 1
+TASK_MIC = 2
+TASK_SD_FLUSH = 3
+TASK_DISPLAY = 4
+TASK_VMON = 5
+TASK_TH = 6
+TASK_PM = 7
+# event loop scheduling lag
+LOOP_LAG = 8
+# sensor acquisition
+ACQ_PM = 9
+ACQ_GAS = 10
+ACQ_TH = 11
+# I/O
+SD_LOG = 12
+SD_AUDIO = 13
+SD_OUTBOX = 14
+MQTT_PUBLISH = 15
+# ADS1219 DRDY edge to data read
+I2C_DRDY = 16
+
+# probe names, in handle order.  Used in the SD Card record, MQTT payload and display
+PROBES = ('t_timer', 't_mqtt', 't_mic', 't_sdflush', 't_disp', 't_vmon', 't_th', 't_pm',
+          'lag',
+          'a_pm', 'a_gas', 'a_th',
+          'sd_log', 'sd_audio', 'sd_outbox', 'mqtt_pub',
+          'i2c_drdy')
+
+NUM_PROBES = len(PROBES)
+
+# bin upper bounds in us.  The last bin holds everything above 5 s
+BINS = array('I', (100, 200, 500,
+                   1000, 2000, 5000,
+                   10000, 20000, 50000,
+                   100000, 200000, 500000,
+                   1000000, 2000000, 5000000, 0xFFFFFFFF))
+NUM_BINS = len(BINS)
+
+# summary columns, per probe
+P50 = 0
+P95 = 1
+MAX = 2
+COUNT = 3
+NUM_SUMMARY = 4
+
+LAG_PERIOD_MS = 100
+
+class Diagnostics():
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.hist = array('I', [0] * (NUM_PROBES * NUM_BINS))
+        self.count = array('I', [0] * NUM_PROBES)
+        self.max_us = array('I', [0] * NUM_PROBES)
+        # (p50, p95, max, count) per probe, for the last reporting period
+        self.summary = array('I', [0] * (NUM_PROBES * NUM_SUMMARY))
+        self.reports = 0
+
+    # diagnostics can be switched on and off while the application runs.
+    # Histograms restart when switched on
+    def enable(self, enabled):
+        if enabled and not self.enabled:
+            self.clear()
+        self.enabled = enabled
+
+    def clear(self):
+        for i in range(len(self.hist)):
+            self.hist[i] = 0
+        for probe in range(NUM_PROBES):
+            self.count[probe] = 0
+            self.max_us[probe] = 0
+
+    def record(self, probe, us):
+        if not self.enabled:
+            return
+        b = 0
+        while us > BINS[b]:
+            b += 1
+        self.hist[probe * NUM_BINS + b] += 1
+        self.count[probe] += 1
+        if us > self.max_us[probe]:
+            self.max_us[probe] = us
+
+    # records the time since start, a utime.ticks_us() value
+    def done(self, probe, start):
+        if self.enabled:
+            self.record(probe, utime.ticks_diff(utime.ticks_us(), start))
+
+    # pct = 0..100.  0 if nothing was recorded
+    def percentile(self, probe, pct):
+        count = self.count[probe]
+        if count == 0:
+            return 0
+        rank = (count * pct + 99) // 100  # 1-based rank of the percentile sample
+        seen = 0
+        base = probe * NUM_BINS
+        for b in range(NUM_BINS):
+            seen += self.hist[base + b]
+            if seen >= rank:
+                return min(BINS[b], self.max_us[probe])
+        return self.max_us[probe]
+
+    # summarize the histograms into self.summary and start new histograms
+    def report(self):
+        for probe in range(NUM_PROBES):
+            i = probe * NUM_SUMMARY
+            self.summary[i + P50] = self.percentile(probe, 50)
+            self.summary[i + P95] = self.percentile(probe, 95)
+            self.summary[i + MAX] = self.max_us[probe]
+            self.summary[i + COUNT] = self.count[probe]
+        self.clear()
+        self.reports += 1
+
+    # summary as CSV:  timestamp, then p50, p95, max (ms) and count for every probe
+    def csv_header(self):
+        return 'utc,' + ','.join(['{0}_p50,{0}_p95,{0}_max,{0}_n'.format(name) for name in PROBES]) + '\n'
+
+    def csv_record(self, timestamp):
+        parts = [str(timestamp)]
+        s = self.summary
+        for i in range(0, NUM_PROBES * NUM_SUMMARY, NUM_SUMMARY):
+            parts.append('{:.1f},{:.1f},{:.1f},{}'.format(s[i] / 1000, s[i + 1] / 1000, s[i + 2] / 1000, s[i + 3]))
+        return ','.join(parts) + '\n'
+
+    # summary as JSON, probes that recorded nothing are left out:
+    #   {"v":1,"diag":{"lag":[0.2,1.0,3.4,1200],...}}  [p50, p95, max (ms), count]
+    def json(self, version=1):
+        parts = []
+        s = self.summary
+        for probe in range(NUM_PROBES):
+            i = probe * NUM_SUMMARY
+            if s[i + COUNT]:
+                parts.append('"{}":[{:.1f},{:.1f},{:.1f},{}]'.format(PROBES[probe], s[i] / 1000, s[i + 1] / 1000,
+                                                                    s[i + 2] / 1000, s[i + 3]))
+        return '{{"v":{},"diag":{{{}}}}}'.format(version, ','.join(parts))
+
+    # wraps a coroutine so the run time of each step (send to the next await) is recorded:
+    #   loop.create_task(diag.timed(diag.TASK_MQTT, self.run_mqtt()))
+    async def timed(self, probe, coro):
+        return await _Timed(self, probe, coro)
+
+    # coroutine:  event loop lag, how late a LAG_PERIOD_MS sleep returns
+    async def run_lag_monitor(self, period_ms=LAG_PERIOD_MS):
+        while True:
+            start = utime.ticks_us()
+            await asyncio.sleep(period_ms / 1000)
+            if self.enabled:
+                self.record(LOOP_LAG, max(0, utime.ticks_diff(utime.ticks_us(), start) - period_ms * 1000))
+
+class _Timed():
+    def __init__(self, diag, probe, coro):
+        self.diag = diag
+        self.probe = probe
+        self.coro = coro
+
+    def __await__(self):
+        diag = self.diag
+        coro = self.coro
+        value = None
+        error = None
+        while True:
+            start = utime.ticks_us() if diag.enabled else None
+            try:
+                if error is None:
+                    request = coro.send(value)
+                else:
+                    request = coro.throw(error)
+            except StopIteration as e:
+                if start is not None:
+                    diag.done(self.probe, start)
+                return e.value
+            if start is not None:
+                diag.done(self.probe, start)
+            try:
+                value = yield request
+                error = None
+            except BaseException as e:
+                value = None
+                error = e
+
+    __iter__ = __await__  # MicroPython uses __iter__ for await
@@ -0,0 +1,162 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Device layer:  creates the peripherals and sensor drivers used by streetsense.py
+# (pin allocation is described at the top of streetsense.py)
+#
+# On the ESP32 these are the MicroPython machine module and the sensor drivers.
+# host/simulate.py puts simulated modules with the same names (host/sim) first on the
+# module path, so the application runs unchanged under CPython
+#
+import machine
+import esp32
+from machine import Pin
+from machine import I2C
+from machine import I2S
+from machine import UART
+from machine import ADC
+from machine import SDCard
+import uos
+import utime
+import urtc
+import si7021
+from ads1219 import ADS1219
+
+# mount point of the SD Card.  The simulator sets this to a local directory
+SD_ROOT = '/sd'
+
+# light_sleep() wake reasons
+WAKE_TIMER = machine.TIMER_WAKE
+WAKE_RTC_ALARM = machine.EXT0_WAKE
+WAKE_BUTTON = machine.EXT1_WAKE
+
+# I2C bus with a transaction counter:  one count per bus transaction (start condition 
+# to stop condition), in total and per device address
+class CountingI2C():
+    def __init__(self, i2c):
+        self.i2c = i2c
+        self.transactions = 0
+        self.by_address = {}
+
+    def count(self, addr):
+        self.transactions += 1
+        self.by_address[addr] = self.by_address.get(addr, 0) + 1
+
+    def scan(self):
+        return self.i2c.scan()
+
+    def readfrom(self, addr, nbytes, *args):
+        self.count(addr)
+        return self.i2c.readfrom(addr, nbytes, *args)
+
+    def readfrom_into(self, addr, buf, *args):
+        self.count(addr)
+        return self.i2c.readfrom_into(addr, buf, *args)
+
+    def writeto(self, addr, buf, *args):
+        self.count(addr)
+        return self.i2c.writeto(addr, buf, *args)
+
+    def readfrom_mem(self, addr, memaddr, nbytes, **kwargs):
+        self.count(addr)
+        return self.i2c.readfrom_mem(addr, memaddr, nbytes, **kwargs)
+
+    def readfrom_mem_into(self, addr, memaddr, buf, **kwargs):
+        self.count(addr)
+        return self.i2c.readfrom_mem_into(addr, memaddr, buf, **kwargs)
+
+    def writeto_mem(self, addr, memaddr, buf, **kwargs):
+        self.count(addr)
+        return self.i2c.writeto_mem(addr, memaddr, buf, **kwargs)
+
+def i2c_bus():
+    return CountingI2C(I2C(scl=Pin(26), sda=Pin(27)))
+
+def rtc(i2c):
+    return urtc.DS3231(i2c, address=0x68)
+
+# DS3231 INT/SQW output, open drain:  GPIO 36 is input only, without internal pull-up,
+# so the board needs an external pull-up resistor
+def rtc_int_pin():
+    return Pin(36, Pin.IN)
+
+def gas_adc(i2c):
+    return ADS1219(i2c, address=0x41)
+
+def gas_adc_drdy_pin():
+    return Pin(34, mode=Pin.IN)
+
+def temp_humidity(i2c):
+    return si7021.Si7021(i2c)
+
+def pm_power_pin():
+    return Pin(25, Pin.OUT)
+
+def pm_uart():
+    return UART(1, tx=32, rx=33, baudrate=9600)
+
+# stop the UART pins from powering the PMS5003 through its inputs
+def pm_uart_release():
+    Pin(32, Pin.IN, Pin.PULL_DOWN)
+    Pin(33, Pin.IN, Pin.PULL_DOWN)
+
+# dmacount range:  2 to 128 incl
+# dmalen range:   8 to 1024 incl
+def mic_i2s(sample_rate, dmacount, dmalen):
+    return I2S(I2S.NUM0,
+               bck=Pin(13),
+               ws=Pin(12),
+               sdin=Pin(14),
+               mode=I2S.MASTER_RX,
+               samplerate=sample_rate,
+               dataformat=I2S.B32,
+               channelformat=I2S.RIGHT_LEFT,
+               standard=I2S.PHILIPS,
+               dmacount=dmacount,
+               dmalen=dmalen)
+
+def _adc(pin):
+    adc = ADC(Pin(pin))
+    adc.atten(ADC.ATTN_11DB)
+    adc.width(ADC.WIDTH_12BIT)
+    return adc
+
+def battery_adc():
+    return _adc(35)
+
+def usb_adc():
+    return _adc(39)
+
+def backlight_pin():
+    return Pin(2, Pin.OUT)
+
+def screen_button_pin():
+    return Pin(0, Pin.IN, Pin.PULL_UP)
+
+# light sleep for at most ms, waking early on the DS3231 alarm (INT low) or a press of 
+# the screen button.  Blocks the scheduler.  Returns the wake reason (WAKE_*)
+def light_sleep(ms):
+    esp32.wake_on_ext0(pin=rtc_int_pin(), level=esp32.WAKEUP_ALL_LOW)
+    esp32.wake_on_ext1(pins=(screen_button_pin(),), level=esp32.WAKEUP_ALL_LOW)
+    machine.lightsleep(ms)
+    return machine.wake_reason()
+
+# slot=2 configures SD Card to use the SPI3 controller (VSPI), DMA channel = 2
+# slot=3 configures SD Card to use the SPI2 controller (HSPI), DMA channel = 1
+# returns the mount point
+def mount_sd():
+    sd = SDCard(slot=3, sck=Pin(18), mosi=Pin(23), miso=Pin(19), cs=Pin(4))
+    # loop until mount() stops raising exception "OSError: 16"
+    # which is related to this error "sdmmc_common: sdmmc_init_csd: send_csd returned 0x109"
+    while True:
+        try:
+            uos.mount(sd, SD_ROOT)
+            break
+        except:
+            utime.sleep_ms(100)
+    return SD_ROOT
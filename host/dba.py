@@ -0,0 +1,143 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Host (CPython) reference of the firmware dba module
+#
+# Same streaming API as the C module in the micropython fork:
+#
+#   noise = dba.DBA(samples=10000, resolution=dba.B16, coeffa=(...), coeffb=(...))
+#   res = noise.calc(buffer)   # None, or dB(A) when a window of samples completes
+#
+# - buffer holds little-endian signed samples (2, 3 or 4 bytes each)
+# - coeffa/coeffb are the denominator/numerator of the A-weighting IIR filter
+# - filter state is kept across calls, so blocks of any size can be fed
+#
+# When numpy and scipy are installed, blocks are filtered with
+# scipy.signal.lfilter (batched).  Otherwise a pure Python filter is used.
+#
+import math
+try:
+    import numpy as np
+    from scipy.signal import lfilter
+except ImportError:
+    np = None
+
+B16 = 16
+B24 = 24
+B32 = 32
+
+# INMP441 microphone constants, as used by the firmware
+MIC_OFFSET_DB = 3.0103      # sine-wave RMS vs. dBFS
+MIC_REF_DB = 94.0           # dB SPL at which sensitivity is specified
+MIC_SENSITIVITY = -26.0     # dBFS at MIC_REF_DB
+
+class DBA():
+    def __init__(self, samples, resolution, coeffa, coeffb, use_numpy=True):
+        if resolution not in (B16, B24, B32):
+            raise ValueError('resolution must be B16, B24 or B32')
+        if len(coeffa) != len(coeffb) or coeffa[0] != 1.0:
+            raise ValueError('coeffa and coeffb must be the same length, with coeffa[0] = 1.0')
+        self.samples = samples
+        self.resolution = resolution
+        self.sample_bytes = resolution // 8
+        self.coeffa = tuple(coeffa)
+        self.coeffb = tuple(coeffb)
+        # full-scale sample amplitude at MIC_REF_DB
+        self.ref_ampl = math.pow(10, MIC_SENSITIVITY / 20) * ((1 << (resolution - 1)) - 1)
+        self.use_numpy = use_numpy and np is not None
+        # filter state (direct form II transposed), kept across blocks
+        self.zi = [0.0] * (len(coeffa) - 1)
+        if self.use_numpy:
+            self.zi = np.zeros(len(coeffa) - 1)
+        self.sum_sqr = 0.0
+        self.count = 0
+        self.tail = b''  # partial sample carried to the next block
+
+    def _level(self, sum_sqr, count):
+        rms = math.sqrt(sum_sqr / count)
+        if rms == 0:
+            return 0.0
+        return MIC_OFFSET_DB + MIC_REF_DB + 20 * math.log10(rms / self.ref_ampl)
+
+    def _samples_python(self, buffer):
+        nb = self.sample_bytes
+        if nb == 2:
+            import array
+            a = array.array('h')
+            a.frombytes(buffer)
+            return a
+        return [int.from_bytes(buffer[i:i + nb], 'little', signed=True) for i in range(0, len(buffer), nb)]
+
+    # filter a block, returning a list of squared filter outputs
+    def _filter_python(self, x):
+        a = self.coeffa
+        b = self.coeffb
+        z = self.zi
+        order = len(z)
+        out = []
+        append = out.append
+        b0 = b[0]
+        for s in x:
+            y = b0 * s + z[0]
+            for k in range(order - 1):
+                z[k] = b[k + 1] * s + z[k + 1] - a[k + 1] * y
+            z[order - 1] = b[order] * s - a[order] * y
+            append(y * y)
+        return out
+
+    def _filter_numpy(self, buffer):
+        nb = self.sample_bytes
+        if nb == 3:
+            raw = np.frombuffer(buffer, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+            x = (raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16))
+            x = np.where(x & 0x800000, x - 0x1000000, x).astype(np.float64)
+        else:
+            x = np.frombuffer(buffer, dtype='<i{}'.format(nb)).astype(np.float64)
+        y, self.zi = lfilter(self.coeffb, self.coeffa, x, zi=self.zi)
+        return y * y
+
+    # feed a block of samples, returning every dB(A) result completed
+    # by this block (a list, possibly empty)
+    def calc_all(self, buffer):
+        if self.tail:
+            buffer = self.tail + bytes(buffer)
+        extra = len(buffer) % self.sample_bytes
+        if extra:
+            self.tail = bytes(buffer[len(buffer) - extra:])
+            buffer = buffer[:len(buffer) - extra]
+        else:
+            self.tail = b''
+
+        if self.use_numpy:
+            sqr = self._filter_numpy(buffer)
+        else:
+            sqr = self._filter_python(self._samples_python(buffer))
+
+        results = []
+        start = 0
+        n = len(sqr)
+        while start < n:
+            take = min(self.samples - self.count, n - start)
+            if self.use_numpy:
+                self.sum_sqr += float(sqr[start:start + take].sum())
+            else:
+                self.sum_sqr += math.fsum(sqr[start:start + take])
+            self.count += take
+            start += take
+            if self.count == self.samples:
+                results.append(self._level(self.sum_sqr, self.count))
+                self.sum_sqr = 0.0
+                self.count = 0
+        return results
+
+    # firmware API:  returns dB(A) when a window completes, otherwise None
+    def calc(self, buffer):
+        results = self.calc_all(buffer)
+        if results:
+            return results[-1]
+        return None
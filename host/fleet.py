@@ -0,0 +1,364 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Fleet analysis:  daily summaries from the SD Card dumps of many units
+#
+#   python host/fleet.py -o fleet.csv /media/cards/*
+#   python host/fleet.py --format parquet -o fleet.parquet --jobs 8 --calibration cal.csv /media/cards/*
+#
+# - each dump is a directory holding a copy of one unit's SD Card, the unit is named after
+#   the directory.  Files below it are found with os.walk
+# - every file is one task, run on a process pool (--jobs, default all cores).  The largest
+#   files are submitted first, so a long WAV does not finish last on its own
+#   - meas-*.csv:  streamed a row at a time.  O3 and NO2 are recalculated in ppb from the
+#     logged vgas - vref with the unit's calibration factors (--calibration, a CSV of
+#     unit,o3_factor,no2_factor; SpecSensors' factors otherwise).  Torn rows are skipped
+#   - meas-*.bin:  memory-mapped (logconv.BinLog)
+#   - mic-*.wav:  memory-mapped, dB(A) recomputed with the host dba module in 125 ms
+#     blocks, as the microphone coroutine does.  16, 24 or 32-bit PCM and IMA ADPCM.
+#     A segment left open by a reset is read to the end of the file, digital silence
+#     (a preallocated tail) is not counted
+# - a task returns partial sums per day, merged in the main process.  The result is one
+#   row per unit and day (local time, --utc-offset):  means, maxima, the logged and the
+#   recomputed Leq.  Written as CSV, or with numpy as npz or parquet (needs pyarrow)
+#
+import argparse
+import calendar
+import csv
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import adpcm
+import dba
+import logconv
+import wavheader
+from recorder import segment_key
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+UTC_OFFSET_HOURS = -8  # the local time of the file names, as gmt_to_pst()
+NOISE_BLOCK_MS = 125
+SAMPLES_PER_SECOND = 10000  # the A-weighting coefficients are for this rate
+COEFFA = (1.0, -2.3604841, 0.83692802, 1.54849677, -0.96903429, -0.25092355, 0.1950274)
+COEFFB = (0.61367941, -1.22735882, -0.61367941, 2.45471764, -0.61367941, -1.22735882, 0.61367941)
+# SpecSensors.CALIBRATION_FACTOR_OZONE, CALIBRATION_FACTOR_NO2
+CALIBRATION = (-21.7913 * (10**-3), -11.13768 * (10**-3))
+
+MEAN_FIELDS = ('pm25', 'o3', 'no2', 'tdegc', 'rh')
+
+# accumulator slots, per unit and day
+RECORDS = 0
+MEAN_SUM = 1  # sum and count of each of MEAN_FIELDS
+PM25_MAX = MEAN_SUM + 2 * len(MEAN_FIELDS)
+LAFMAX_MAX = PM25_MAX + 1
+LAEQ_ENERGY = LAFMAX_MAX + 1
+LAEQ_COUNT = LAEQ_ENERGY + 1
+WAV_ENERGY = LAEQ_COUNT + 1
+WAV_BLOCKS = WAV_ENERGY + 1
+NUM_SLOTS = WAV_BLOCKS + 1
+MAX_SLOTS = (PM25_MAX, LAFMAX_MAX)
+
+COLUMNS = (('unit', 'day', 'records') + tuple(name + '_mean' for name in MEAN_FIELDS) +
+           ('pm25_max', 'lafmax', 'laeq', 'wav_laeq', 'wav_hours'))
+
+def new_slots():
+    slots = [0.0] * NUM_SLOTS
+    for i in MAX_SLOTS:
+        slots[i] = -math.inf
+    return slots
+
+def merge(into, slots):
+    for i in range(NUM_SLOTS):
+        if i in MAX_SLOTS:
+            into[i] = max(into[i], slots[i])
+        else:
+            into[i] += slots[i]
+
+#
+# per-file tasks:  each returns {day: slots} and the number of rows (or audio blocks) and
+# of skipped rows.  day is the local day number since 1970-01-01
+#
+def add_rows(days, header, rows, cal, utc_offset_s):
+    pos = {name: i for i, name in enumerate(header)}
+    utc = pos['utc']
+    # (mean slot, column) for logged values, (mean slot, vgas, vref, factor) for the gases
+    logged = []
+    gases = []
+    factors = {'o3': cal[0], 'no2': cal[1]}
+    for k, name in enumerate(MEAN_FIELDS):
+        slot = MEAN_SUM + 2 * k
+        vgas = pos.get(name + '_vgas')
+        vref = pos.get(name + '_vref')
+        if name in factors and vgas is not None and vref is not None:
+            gases.append((slot, vgas, vref, factors[name]))
+        elif name in pos:
+            logged.append((slot, pos[name]))
+    pm25 = pos.get('pm25')
+    laeq = pos.get('laeq')
+    lafmax = pos.get('lafmax')
+    n = 0
+    for values in rows:
+        day = (int(values[utc]) + utc_offset_s) // 86400
+        slots = days.get(day)
+        if slots is None:
+            slots = days[day] = new_slots()
+        slots[RECORDS] += 1
+        # nan:  not measured in that interval
+        for slot, i in logged:
+            if values[i] == values[i]:
+                slots[slot] += values[i]
+                slots[slot + 1] += 1
+        for slot, vgas, vref, factor in gases:
+            v = (values[vgas] - values[vref]) / factor
+            if v == v:
+                slots[slot] += v
+                slots[slot + 1] += 1
+        if pm25 is not None and values[pm25] > slots[PM25_MAX]:
+            slots[PM25_MAX] = values[pm25]
+        if lafmax is not None and values[lafmax] > slots[LAFMAX_MAX]:
+            slots[LAFMAX_MAX] = values[lafmax]
+        if laeq is not None and values[laeq] > 0:
+            slots[LAEQ_ENERGY] += math.pow(10, values[laeq] / 10)
+            slots[LAEQ_COUNT] += 1
+        n += 1
+    return n
+
+def meas_csv(fn, cal, utc_offset_s):
+    days = {}
+    skipped = [0]
+    with open(fn, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return days, 0, 0
+        def rows():
+            for row in reader:
+                # a row cut short by a reset, or a header line
+                if len(row) != len(header):
+                    skipped[0] += 1
+                    continue
+                try:
+                    yield [float(v) for v in row]
+                except ValueError:
+                    skipped[0] += 1
+        n = add_rows(days, header, rows(), cal, utc_offset_s)
+    return days, n, skipped[0]
+
+def meas_bin(fn, cal, utc_offset_s):
+    days = {}
+    log = logconv.BinLog(fn)
+    try:
+        n = add_rows(days, ['utc'] + log.names, log.rows(), cal, utc_offset_s)
+        return days, n, log.bad_crc + (1 if log.torn_bytes else 0)
+    finally:
+        log.close()
+
+def wav_chunks(data, fmt, block_align, nb):
+    if fmt == 0x11:
+        for start in range(0, len(data) - block_align + 1, block_align):
+            yield array('h', adpcm.decode_block(data[start:start + block_align])).tobytes()
+    else:
+        step = SAMPLES_PER_SECOND * nb
+        for start in range(0, len(data), step):
+            yield data[start:start + step]
+
+def mic_wav(fn, utc_offset_s):
+    days = {}
+    blocks = 0
+    # the file name is the local start time of the segment
+    start_s = calendar.timegm(segment_key(os.path.basename(fn)) + (0, 0, 0))
+    with open(fn, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= wavheader.WAV_HEADER_LEN:
+            return days, 0, 0
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header_len = wavheader.header_len(mm)
+            fmt, channels, rate = struct.unpack_from('<HHI', mm, 20)
+            block_align, bits = struct.unpack_from('<HH', mm, 32)
+            if channels != 1 or rate != SAMPLES_PER_SECOND:
+                raise ValueError('{}: mono {} S/s needed'.format(fn, SAMPLES_PER_SECOND))
+            datasize = wavheader.read_data_size(mm, header_len)
+            if datasize == 0 or datasize > size - header_len:
+                # left open:  as SegmentRecorder.recover_file()
+                datasize = size - header_len
+                datasize -= datasize % block_align
+            nb = 2 if fmt == 0x11 else bits // 8
+            noise = dba.DBA(samples=SAMPLES_PER_SECOND * NOISE_BLOCK_MS // 1000, resolution=8 * nb,
+                            coeffa=COEFFA, coeffb=COEFFB)
+            with memoryview(mm) as mv, mv[header_len:header_len + datasize] as data:
+                for chunk in wav_chunks(data, fmt, block_align, nb):
+                    for level in noise.calc_all(chunk):
+                        if level > 0:
+                            day = (start_s + blocks * NOISE_BLOCK_MS // 1000) // 86400
+                            slots = days.get(day)
+                            if slots is None:
+                                slots = days[day] = new_slots()
+                            slots[WAV_ENERGY] += math.pow(10, level / 10)
+                            slots[WAV_BLOCKS] += 1
+                        blocks += 1
+                    # the slice must go before the mmap is closed
+                    del chunk
+        finally:
+            mm.close()
+    return days, blocks, 0
+
+# runs in a pool process.  Returns (unit, {day: slots}, rows, skipped, seconds, error)
+def run_task(task):
+    kind, unit, fn, cal, utc_offset_s = task
+    start = time.perf_counter()
+    try:
+        if kind == 'csv':
+            days, n, skipped = meas_csv(fn, cal, utc_offset_s)
+        elif kind == 'bin':
+            days, n, skipped = meas_bin(fn, cal, utc_offset_s)
+        else:
+            days, n, skipped = mic_wav(fn, utc_offset_s)
+        error = None
+    except (ValueError, OSError, KeyError) as e:
+        days, n, skipped, error = {}, 0, 0, '{}: {}'.format(fn, e)
+    return unit, kind, days, n, skipped, time.perf_counter() - start, error
+
+def file_kind(fn):
+    if fn.startswith('meas-') and fn.endswith('.csv'):
+        return 'csv'
+    if fn.startswith('meas-') and fn.endswith('.bin'):
+        return 'bin'
+    if fn.startswith('mic-') and fn.endswith('.wav'):
+        return 'wav'
+    return None
+
+def find_tasks(dumps, calibration, utc_offset_s, wav=True):
+    tasks = []
+    for dump in dumps:
+        unit = os.path.basename(os.path.normpath(dump))
+        cal = calibration.get(unit, CALIBRATION)
+        for root, _, files in os.walk(dump):
+            for fn in files:
+                kind = file_kind(fn)
+                if kind is None or (kind == 'wav' and not wav):
+                    continue
+                path = os.path.join(root, fn)
+                tasks.append((os.path.getsize(path), (kind, unit, path, cal, utc_offset_s)))
+    # largest first
+    tasks.sort(key=lambda t: -t[0])
+    return [task for _, task in tasks]
+
+def read_calibration(fn):
+    calibration = {}
+    with open(fn, newline='') as f:
+        for row in csv.DictReader(f):
+            calibration[row['unit']] = (float(row['o3_factor']), float(row['no2_factor']))
+    return calibration
+
+#
+# analyze a set of dumps.  Returns the columns (a dict of lists, COLUMNS order) and the
+# run statistics
+#
+def analyze(dumps, jobs=None, calibration=None, utc_offset_s=UTC_OFFSET_HOURS * 3600, wav=True):
+    start = time.perf_counter()
+    tasks = find_tasks(dumps, calibration or {}, utc_offset_s, wav)
+    stats = {'files': len(tasks), 'rows': 0, 'audio_hours': 0.0, 'skipped': 0,
+             'task_seconds': 0.0, 'task_max_seconds': 0.0, 'errors': []}
+    jobs = jobs or os.cpu_count() or 1
+    units = {}
+    def collect(results):
+        for unit, kind, days, n, skipped, seconds, error in results:
+            per_day = units.setdefault(unit, {})
+            for day, slots in days.items():
+                if day in per_day:
+                    merge(per_day[day], slots)
+                else:
+                    per_day[day] = slots
+            if kind == 'wav':
+                stats['audio_hours'] += n * NOISE_BLOCK_MS / 3600000
+            else:
+                stats['rows'] += n
+            stats['skipped'] += skipped
+            stats['task_seconds'] += seconds
+            stats['task_max_seconds'] = max(stats['task_max_seconds'], seconds)
+            if error:
+                stats['errors'].append(error)
+    if jobs == 1:
+        collect(map(run_task, tasks))
+    else:
+        with ProcessPoolExecutor(jobs) as pool:
+            collect(pool.map(run_task, tasks, chunksize=max(1, len(tasks) // (jobs * 32))))
+    columns = {name: [] for name in COLUMNS}
+    for unit in sorted(units):
+        for day in sorted(units[unit]):
+            slots = units[unit][day]
+            row = [unit, time.strftime('%Y-%m-%d', time.gmtime(day * 86400)), int(slots[RECORDS])]
+            for k in range(len(MEAN_FIELDS)):
+                count = slots[MEAN_SUM + 2 * k + 1]
+                row.append(slots[MEAN_SUM + 2 * k] / count if count else math.nan)
+            row += [slots[i] if slots[i] > -math.inf else math.nan for i in MAX_SLOTS]
+            for energy, count in ((slots[LAEQ_ENERGY], slots[LAEQ_COUNT]), (slots[WAV_ENERGY], slots[WAV_BLOCKS])):
+                row.append(10 * math.log10(energy / count) if count else math.nan)
+            row.append(slots[WAV_BLOCKS] * NOISE_BLOCK_MS / 3600000)
+            for name, value in zip(COLUMNS, row):
+                columns[name].append(value)
+    stats['seconds'] = time.perf_counter() - start
+    return columns, stats
+
+def write_csv(columns, out):
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(COLUMNS)
+    for row in zip(*(columns[name] for name in COLUMNS)):
+        writer.writerow(['{:.6g}'.format(v) if isinstance(v, float) else v for v in row])
+
+def main():
+    parser = argparse.ArgumentParser(description='daily summaries from Street Sense SD Card dumps')
+    parser.add_argument('dumps', nargs='+', help='SD Card dump directories, one per unit')
+    parser.add_argument('--format', choices=('csv', 'npz', 'parquet'), default='csv')
+    parser.add_argument('-o', '--output', help='output file (default: stdout, csv only)')
+    parser.add_argument('--jobs', type=int, help='worker processes (default: all cores)')
+    parser.add_argument('--calibration', help='CSV of unit,o3_factor,no2_factor')
+    parser.add_argument('--utc-offset', type=float, default=UTC_OFFSET_HOURS, help='hours from UTC of the local day')
+    parser.add_argument('--no-wav', action='store_true', help='skip the mic-*.wav files')
+    args = parser.parse_args()
+
+    calibration = read_calibration(args.calibration) if args.calibration else None
+    columns, stats = analyze(args.dumps, args.jobs, calibration, int(args.utc_offset * 3600), not args.no_wav)
+    for error in stats['errors']:
+        print(error, file=sys.stderr)
+    print('{} files, {} rows ({} skipped), {:.1f} hours of audio, {} unit-days in {:.1f} s'.format(
+          stats['files'], stats['rows'], stats['skipped'], stats['audio_hours'], len(columns['unit']),
+          stats['seconds']), file=sys.stderr)
+
+    if args.format == 'csv':
+        if args.output:
+            with open(args.output, 'w', newline='') as out:
+                write_csv(columns, out)
+        else:
+            write_csv(columns, sys.stdout)
+        return
+    if not args.output:
+        parser.error('--output is required for {}'.format(args.format))
+    if np is None:
+        raise SystemExit('numpy is required for npz and parquet output')
+    arrays = {name: np.array(columns[name]) for name in COLUMNS}
+    if args.format == 'npz':
+        np.savez(args.output, **arrays)
+    else:
+        import pyarrow
+        import pyarrow.parquet
+        pyarrow.parquet.write_table(pyarrow.table(arrays), args.output)
+
+if __name__ == '__main__':
+    main()
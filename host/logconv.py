@@ -0,0 +1,157 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Convert binary measurement logs (meas-*.bin, see binlog.py) to CSV, NumPy or Parquet
+#
+#   python host/logconv.py meas-2020-1-1-0-0-0.bin > meas.csv
+#   python host/logconv.py --format npz -o meas.npz /media/sd/meas-*.bin
+#   python host/logconv.py --format parquet -o meas.parquet /media/sd/meas-*.bin
+#
+# - files are memory-mapped, nothing is read into memory up front
+# - a torn record at the end of a file (reset during a write) and records with a bad CRC are skipped
+# - with numpy installed, records are decoded and CRC-checked as whole arrays
+#   (millions of records per second); otherwise a pure Python reader is used
+# - parquet output needs pyarrow
+#
+import argparse
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import binlog
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def _crc_table():
+    table = []
+    for n in range(256):
+        c = n
+        for _ in range(8):
+            c = (c >> 1) ^ 0xEDB88320 if c & 1 else c >> 1
+        table.append(c)
+    return table
+
+#
+# one memory-mapped binary log file
+#
+class BinLog():
+    def __init__(self, fn):
+        self.fn = fn
+        self.f = open(fn, 'rb')
+        size = os.fstat(self.f.fileno()).st_size
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.version, self.record_size, self.names, self.header_len = binlog.parse_header(self.mm)
+        self.num_records = (size - self.header_len) // self.record_size
+        self.torn_bytes = (size - self.header_len) % self.record_size
+        self.bad_crc = 0
+
+    def close(self):
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self.f.close()
+
+    # numpy:  returns a dict of column arrays for records with a valid CRC
+    def columns(self):
+        n = len(self.names)
+        dtype = np.dtype([('utc', '<u4')] + [(name, '<f4') for name in self.names] + [('crc', '<u4')])
+        raw = np.frombuffer(self.mm, dtype=np.uint8, count=self.num_records * self.record_size,
+                            offset=self.header_len).reshape(self.num_records, self.record_size)
+        # table-driven CRC-32, one byte column at a time over all records
+        table = np.array(_crc_table(), dtype=np.uint32)
+        crc = np.full(self.num_records, 0xFFFFFFFF, dtype=np.uint32)
+        for j in range(self.record_size - 4):
+            crc = table[(crc ^ raw[:, j]) & 0xFF] ^ (crc >> 8)
+        crc ^= 0xFFFFFFFF
+        records = raw.view(dtype).reshape(self.num_records)
+        ok = crc == records['crc']
+        self.bad_crc = int(self.num_records - ok.sum())
+        records = records[ok]
+        return {name: records[name] for name in ['utc'] + self.names}
+
+    # pure Python:  yields (utc, values...) for records with a valid CRC
+    def rows(self):
+        rec = struct.Struct(binlog.record_format(len(self.names)))
+        crc_offset = rec.size
+        for i in range(self.num_records):
+            start = self.header_len + i * self.record_size
+            data = self.mm[start:start + self.record_size]
+            if zlib.crc32(data[:crc_offset]) != struct.unpack_from('<I', data, crc_offset)[0]:
+                self.bad_crc += 1
+                continue
+            yield rec.unpack_from(data)
+
+def report(log):
+    if log.bad_crc or log.torn_bytes:
+        print('{}: skipped {} records with bad CRC, {} bytes of torn record'.format(
+            log.fn, log.bad_crc, log.torn_bytes), file=sys.stderr)
+
+def to_csv(fns, out):
+    header = None
+    for fn in fns:
+        log = BinLog(fn)
+        if header is None:
+            header = ['utc'] + log.names
+            out.write(','.join(header) + '\n')
+        elif ['utc'] + log.names != header:
+            raise ValueError('{}: different fields from the first file'.format(fn))
+        if np is not None:
+            cols = log.columns()
+            if len(cols['utc']):
+                table = np.column_stack([cols[name].astype(np.float64) for name in header])
+                np.savetxt(out, table, delimiter=',', fmt=['%d'] + ['%.6g'] * len(log.names))
+        else:
+            fmt = '{}' + ',{:.6g}' * len(log.names) + '\n'
+            for row in log.rows():
+                out.write(fmt.format(*row))
+        report(log)
+        log.close()
+
+def to_arrays(fns):
+    if np is None:
+        raise SystemExit('numpy is required for npz and parquet output')
+    parts = {}
+    for fn in fns:
+        log = BinLog(fn)
+        for name, col in log.columns().items():
+            parts.setdefault(name, []).append(col.copy())
+        report(log)
+        log.close()
+    return {name: np.concatenate(cols) for name, cols in parts.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description='convert Street Sense binary measurement logs')
+    parser.add_argument('files', nargs='+', help='meas-*.bin files')
+    parser.add_argument('--format', choices=('csv', 'npz', 'parquet'), default='csv')
+    parser.add_argument('-o', '--output', help='output file (default: stdout, csv only)')
+    args = parser.parse_args()
+
+    if args.format == 'csv':
+        if args.output:
+            with open(args.output, 'w') as out:
+                to_csv(args.files, out)
+        else:
+            to_csv(args.files, sys.stdout)
+        return
+    if not args.output:
+        parser.error('--output is required for {}'.format(args.format))
+    arrays = to_arrays(args.files)
+    if args.format == 'npz':
+        np.savez(args.output, **arrays)
+    else:
+        import pyarrow
+        import pyarrow.parquet
+        pyarrow.parquet.write_table(pyarrow.table(arrays), args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Convert splash images to run-length encoded RGB565 files (.rle, see rleimage.py)
+#
+#   python host/png2rle.py street_sense.png street_sense_b_rgb565.rle
+#   python host/png2rle.py --size 320x240 street_sense_b_rgb565.bin street_sense_b_rgb565.rle
+#
+# - PNG (or any image Pillow can open) input needs Pillow.  Raw RGB565 input (the
+#   *_rgb565.bin images used before) needs --size and is copied without conversion
+# - --byte-order big (default) swaps the two bytes of each pixel, as the ILI9341 display expects
+#
+import argparse
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import rleimage
+
+def rgb_to_565(r, g, b, byte_order):
+    pixel = ((r & 0xF8) << 8) | ((g & 0xFC) << 3) | (b >> 3)
+    return struct.pack('>H' if byte_order == 'big' else '<H', pixel)
+
+def load_png(fn, byte_order):
+    from PIL import Image
+    image = Image.open(fn).convert('RGB')
+    width, height = image.size
+    data = bytearray()
+    for r, g, b in image.getdata():
+        data += rgb_to_565(r, g, b, byte_order)
+    return width, height, bytes(data)
+
+def load_raw(fn, size):
+    width, height = (int(v) for v in size.lower().split('x'))
+    with open(fn, 'rb') as f:
+        data = f.read()
+    if len(data) != width * height * 2:
+        raise SystemExit('{}: {} bytes, expected {} for {}'.format(fn, len(data), width * height * 2, size))
+    return width, height, data
+
+# encode one row of 2-byte pixels into packets
+def encode_row(row):
+    pixels = [row[i:i + 2] for i in range(0, len(row), 2)]
+    out = bytearray()
+    literal = []
+
+    def flush_literal():
+        while literal:
+            chunk = literal[:rleimage.MAX_PACKET_PIXELS]
+            del literal[:rleimage.MAX_PACKET_PIXELS]
+            out.append(len(chunk) - 1)
+            for p in chunk:
+                out.extend(p)
+
+    i = 0
+    while i < len(pixels):
+        n = 1
+        while i + n < len(pixels) and n < rleimage.MAX_PACKET_PIXELS and pixels[i + n] == pixels[i]:
+            n += 1
+        # a run of 2 costs the same as 2 literal pixels, so only use runs of 3 or more
+        if n >= 3:
+            flush_literal()
+            out.append(0x80 | (n - 1))
+            out += pixels[i]
+            i += n
+        else:
+            literal.append(pixels[i])
+            i += 1
+    flush_literal()
+    return bytes(out)
+
+def encode(width, height, data):
+    rows = [encode_row(data[y * width * 2:(y + 1) * width * 2]) for y in range(height)]
+    offset = rleimage.HEADER_SIZE + height * 4
+    table = bytearray()
+    for row in rows:
+        table += struct.pack('<I', offset)
+        offset += len(row)
+    return struct.pack(rleimage.HEADER_FORMAT, rleimage.MAGIC, width, height) + bytes(table) + b''.join(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description='convert images to Street Sense RLE images')
+    parser.add_argument('input', help='PNG image, or raw RGB565 with --size')
+    parser.add_argument('output', help='.rle file')
+    parser.add_argument('--size', help='WxH of a raw RGB565 input, e.g. 320x240')
+    parser.add_argument('--byte-order', choices=('big', 'little'), default='big')
+    args = parser.parse_args()
+
+    if args.size:
+        width, height, data = load_raw(args.input, args.size)
+    else:
+        width, height, data = load_png(args.input, args.byte_order)
+    encoded = encode(width, height, data)
+    with open(args.output, 'wb') as f:
+        f.write(encoded)
+    print('{}: {}x{}, {} bytes -> {} bytes ({:.1f}%)'.format(args.output, width, height, len(data),
+                                                          len(encoded), 100 * len(encoded) / len(data)))
+
+if __name__ == '__main__':
+    main()
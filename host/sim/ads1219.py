@@ -0,0 +1,139 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Simulated ADS1219 24-bit ADC driver, with inputs from world.gas_mv
+# - single shot conversions complete when read_data() is called
+# - in continuous mode a conversion completes every 1/data rate seconds and the
+#   DRDY pin (GPIO 34 on the Street Sense board) raises a falling edge interrupt, at the
+#   time the conversion completed
+# - I2C transactions are made as by the driver:  configuration setters read-modify-write
+#   the configuration register (3 transactions), a data read is a command and a read
+#
+import random
+import uasyncio as asyncio
+from machine import Pin
+import world
+
+class ADS1219():
+    CHANNEL_AIN0_AIN1 = 0
+    CHANNEL_AIN2_AIN3 = 32
+    CHANNEL_AIN1_AIN2 = 64
+    CHANNEL_AIN0 = 96
+    CHANNEL_AIN1 = 128
+    CHANNEL_AIN2 = 160
+    CHANNEL_AIN3 = 192
+    CHANNEL_MID_AVDD = 224
+    GAIN_1X = 0
+    GAIN_4X = 16
+    DR_20_SPS = 0
+    DR_90_SPS = 4
+    DR_330_SPS = 8
+    DR_1000_SPS = 12
+    CM_SINGLE = 0
+    CM_CONTINUOUS = 2
+    VREF_INTERNAL = 0
+    VREF_EXTERNAL = 1
+    VREF_INTERNAL_MV = 2048
+    POSITIVE_CODE_RANGE = 0x7FFFFF
+
+    DRDY_PIN = 34
+    INPUTS = {CHANNEL_AIN0_AIN1: ('AIN0', 'AIN1'), CHANNEL_AIN2_AIN3: ('AIN2', 'AIN3'),
+              CHANNEL_AIN1_AIN2: ('AIN1', 'AIN2'), CHANNEL_AIN0: ('AIN0', None),
+              CHANNEL_AIN1: ('AIN1', None), CHANNEL_AIN2: ('AIN2', None), CHANNEL_AIN3: ('AIN3', None)}
+    DATA_RATES = {DR_20_SPS: 20, DR_90_SPS: 90, DR_330_SPS: 330, DR_1000_SPS: 1000}
+
+    COMMAND_RDATA = 0x10
+    COMMAND_START_SYNC = 0x08
+    COMMAND_RREG_CONFIG = 0x20
+    COMMAND_WREG_CONFIG = 0x40
+
+    def __init__(self, i2c, address=0x40):
+        self.i2c = i2c
+        self.address = address
+        self.channel = ADS1219.CHANNEL_AIN0
+        self.gain = ADS1219.GAIN_1X
+        self.data_rate = ADS1219.DR_20_SPS
+        self.mode = ADS1219.CM_SINGLE
+        self.vref = ADS1219.VREF_INTERNAL
+        self.conversions = 0
+        self.data = 0
+        self.handle = None
+
+    def reset(self):
+        self.__init__(self.i2c, self.address)
+
+    def _read_modify_write_config(self):
+        self.i2c.writeto(self.address, bytes([ADS1219.COMMAND_RREG_CONFIG]))
+        self.i2c.readfrom_into(self.address, bytearray(1))
+        self.i2c.writeto_mem(self.address, ADS1219.COMMAND_WREG_CONFIG, b'\x00')
+
+    def _read_data(self):
+        self.i2c.writeto(self.address, bytes([ADS1219.COMMAND_RDATA]))
+        self.i2c.readfrom_into(self.address, bytearray(3))
+
+    def set_channel(self, channel):
+        self._read_modify_write_config()
+        self.channel = channel
+
+    def set_gain(self, gain):
+        self._read_modify_write_config()
+        self.gain = gain
+
+    def set_data_rate(self, data_rate):
+        self._read_modify_write_config()
+        self.data_rate = data_rate
+
+    def set_vref(self, vref):
+        self._read_modify_write_config()
+        self.vref = vref
+
+    def set_conversion_mode(self, mode):
+        self._read_modify_write_config()
+        self.mode = mode
+        if mode == ADS1219.CM_SINGLE and self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+    def _convert(self):
+        positive, negative = ADS1219.INPUTS[self.channel]
+        mv = world.gas_mv[positive] - (world.gas_mv[negative] if negative else 0)
+        mv += random.gauss(0, world.gas_noise_mv)
+        gain = 4 if self.gain == ADS1219.GAIN_4X else 1
+        code = int(mv * gain / ADS1219.VREF_INTERNAL_MV * ADS1219.POSITIVE_CODE_RANGE)
+        self.conversions += 1
+        return max(-ADS1219.POSITIVE_CODE_RANGE - 1, min(ADS1219.POSITIVE_CODE_RANGE, code))
+
+    # conversions follow the ADC clock, however late the loop runs the timer.  A result
+    # not read before the next conversion is lost
+    def _conversion_done(self):
+        due = self.handle.when()
+        self.data = self._convert()
+        self.handle = asyncio.get_event_loop().call_at(due + 1 / ADS1219.DATA_RATES[self.data_rate],
+                                                       self._conversion_done)
+        Pin.trigger(ADS1219.DRDY_PIN, at=due)
+
+    def start_sync(self):
+        self.i2c.writeto(self.address, bytes([ADS1219.COMMAND_START_SYNC]))
+        if self.mode == ADS1219.CM_CONTINUOUS:
+            if self.handle is not None:
+                self.handle.cancel()
+            self.handle = asyncio.get_event_loop().call_later(1 / ADS1219.DATA_RATES[self.data_rate],
+                                                              self._conversion_done)
+
+    def read_data(self):
+        self._read_data()
+        if self.mode == ADS1219.CM_SINGLE:
+            return self._convert()
+        return self.data
+
+    def read_data_irq(self):
+        self._read_data()
+        return self.data
+
+    def powerdown(self):
+        self.set_conversion_mode(ADS1219.CM_SINGLE)
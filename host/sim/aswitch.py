@@ -0,0 +1,25 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Simulated aswitch module:  a Pushbutton that is never pressed
+#
+class Pushbutton():
+    def __init__(self, pin, suppress=False):
+        self.pin = pin
+
+    def press_func(self, func, args=()):
+        self._press = (func, args)
+
+    def release_func(self, func, args=()):
+        self._release = (func, args)
+
+    def double_func(self, func, args=()):
+        self._double = (func, args)
+
+    def long_func(self, func, args=()):
+        self._long = (func, args)
@@ -0,0 +1,85 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Simulated asyn module (micropython-async):  Event and Lock with the same polling behaviour
+#
+# With delay_ms=0 the device polls on every pass of the scheduler.  Here a waiter sleeps
+# until set() / release() instead:  the same for the waiter, and a virtual clock can
+# advance while it waits (a busy poll never lets the loop go idle)
+#
+import uasyncio as asyncio
+
+def _wake(waiters):
+    for waiter in waiters:
+        if not waiter.done():
+            waiter.set_result(None)
+    waiters.clear()
+
+async def _poll(delay_ms, waiters):
+    if delay_ms:
+        await asyncio.sleep_ms(delay_ms)
+    else:
+        waiter = asyncio.get_event_loop().create_future()
+        waiters.append(waiter)
+        await waiter
+
+class Lock():
+    def __init__(self, delay_ms=0):
+        self._locked = False
+        self.delay_ms = delay_ms
+        self._waiters = []
+
+    def locked(self):
+        return self._locked
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *args):
+        self.release()
+        await asyncio.sleep(0)
+
+    async def acquire(self):
+        while self._locked:
+            await _poll(self.delay_ms, self._waiters)
+        self._locked = True
+
+    def release(self):
+        if not self._locked:
+            raise RuntimeError('Attempt to release a lock which has not been set')
+        self._locked = False
+        _wake(self._waiters)
+
+class Event():
+    def __init__(self, delay_ms=0):
+        self.delay_ms = delay_ms
+        self._waiters = []
+        self.clear()
+
+    def clear(self):
+        self._flag = False
+        self._data = None
+
+    async def wait(self):
+        while not self._flag:
+            await _poll(self.delay_ms, self._waiters)
+
+    def __await__(self):
+        return self.wait().__await__()
+
+    def is_set(self):
+        return self._flag
+
+    def set(self, data=None):
+        self._flag = True
+        self._data = data
+        _wake(self._waiters)
+
+    def value(self):
+        return self._data
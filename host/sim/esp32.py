@@ -0,0 +1,23 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Simulated esp32 module:  light sleep wake sources (see machine.lightsleep())
+#
+WAKEUP_ALL_LOW = False
+WAKEUP_ANY_HIGH = True
+
+ext0_pin = None
+ext1_pins = ()
+
+def wake_on_ext0(pin, level):
+    global ext0_pin
+    ext0_pin = None if pin is None else pin.id
+
+def wake_on_ext1(pins, level):
+    global ext1_pins
+    ext1_pins = tuple(pin.id for pin in pins or ())
@@ -0,0 +1,33 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Simulated i2stools firmware module:  copy one channel of 32-bit stereo I2S frames
+# - the sample is left-justified in the channel's 32-bit little-endian slot (right slot
+#   first).  B16 keeps the top 2 bytes, B24 the top 3 and B32 all 4
+# - each output byte lane is one stride-based memoryview copy (stride FRAME_BYTES in,
+#   the sample size out)
+#
+LEFT = 0
+RIGHT = 1
+B16 = 16
+B24 = 24
+B32 = 32
+
+FRAME_BYTES = 8
+SLOT_BYTES = 4
+
+def copy(bufin, bufout, channel=LEFT, format=B16):
+    if format not in (B16, B24, B32):
+        raise ValueError('format must be B16, B24 or B32')
+    nb = format // 8
+    n = min(len(bufin) // FRAME_BYTES, len(bufout) // nb)
+    first = (4 if channel == LEFT else 0) + SLOT_BYTES - nb
+    mv = memoryview(bufout)
+    for lane in range(nb):
+        mv[lane:n * nb:nb] = bytes(bufin[first + lane:n * FRAME_BYTES:FRAME_BYTES])
+    return n * nb
@@ -0,0 +1,330 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Simulated MicroPython machine module, with the devices wired as on the Street Sense board
+# - Pin:  values and IRQ handlers.  Simulated devices raise edges with Pin.trigger()
+# - UART 1:  a PMS5003 that answers passive mode commands with frames built from world.pm
+# - I2S:  samples from world.wav_file, arriving in (simulated) time into a bounded DMA memory
+# - ADC:  battery (pin 35) and USB (pin 39) voltages from world.vbat / world.vusb
+# - SDCard:  see uos.mount(), the card is a local directory
+# - I2C:  transactions complete without data.  The simulated drivers make the same
+#   transactions as the device drivers, so bus traffic can be counted (hal.CountingI2C)
+# - lightsleep():  blocks the scheduler for the sleep time (on a virtual clock the clock
+#   jumps ahead), waking early on the DS3231 alarm when esp32.wake_on_ext0() is set
+#
+import struct
+import time
+import wave
+import world
+import uasyncio as asyncio
+
+PWRON_RESET = 1
+EXT0_WAKE = 2
+PIN_WAKE = EXT0_WAKE
+EXT1_WAKE = 3
+TIMER_WAKE = 4
+
+_wake_reason = 0
+
+def reset_cause():
+    return PWRON_RESET
+
+def wake_reason():
+    return _wake_reason
+
+def lightsleep(time_ms=None):
+    global _wake_reason
+    import esp32
+    seconds = time_ms / 1000
+    _wake_reason = TIMER_WAKE
+    if esp32.ext0_pin == 36 and world.rtc_int_at is not None:
+        until = world.rtc_int_at - world.monotonic()
+        if until <= seconds:
+            seconds = max(0, until)
+            _wake_reason = EXT0_WAKE
+    world.light_sleep_seconds += seconds
+    loop = asyncio.get_event_loop()
+    if hasattr(loop, 'advance'):
+        loop.advance(seconds)
+    else:
+        time.sleep(seconds)
+
+def reset():
+    raise SystemExit('machine.reset()')
+
+def freq():
+    return 240000000
+
+class Pin():
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+    _values = {}
+    _handlers = {}
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        if value is not None:
+            Pin._values[id] = value
+
+    def value(self, value=None):
+        if value is None:
+            return Pin._values.get(self.id, 0)
+        Pin._values[self.id] = value
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING, hard=False):
+        if handler is None:
+            Pin._handlers.pop(self.id, None)
+        else:
+            Pin._handlers[self.id] = handler
+
+    # called by simulated devices:  an edge on the pin runs its IRQ handler.  at:  the
+    # monotonic() time of the edge, if the loop ran the device timer late.  The handler
+    # sees the clock at the edge, as a hard interrupt handler does
+    @staticmethod
+    def trigger(id, at=None):
+        handler = Pin._handlers.get(id)
+        if handler is None:
+            return
+        if at is None:
+            handler(Pin(id))
+            return
+        monotonic = world.monotonic
+        world.monotonic = lambda: at
+        try:
+            handler(Pin(id))
+        finally:
+            world.monotonic = monotonic
+
+# transfers block for their time on the bus:  9 clocks per byte, plus the address byte
+class I2C():
+    def __init__(self, id=-1, scl=None, sda=None, freq=400000):
+        self.scl = scl
+        self.sda = sda
+        self.freq = freq
+
+    def _transfer(self, nbytes):
+        world.block((nbytes + 1) * 9 / self.freq)
+
+    def scan(self):
+        return [0x40, 0x41, 0x68]
+
+    def readfrom(self, addr, nbytes, stop=True):
+        self._transfer(nbytes)
+        return bytes(nbytes)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        self._transfer(len(buf))
+
+    def writeto(self, addr, buf, stop=True):
+        self._transfer(len(buf))
+        return len(buf)
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        self._transfer(1 + nbytes)
+        return bytes(nbytes)
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        self._transfer(1 + len(buf))
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        self._transfer(1 + len(buf))
+
+class SDCard():
+    def __init__(self, slot=1, **kwargs):
+        pass
+
+class Timer():
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id):
+        self.handle = None
+
+    def init(self, period=1000, mode=PERIODIC, callback=None):
+        self.deinit()
+        self.period = period / 1000
+        self.mode = mode
+        self.callback = callback
+        self.handle = asyncio.get_event_loop().call_later(self.period, self._expired)
+
+    def _expired(self):
+        if self.mode == Timer.PERIODIC:
+            self.handle = asyncio.get_event_loop().call_later(self.period, self._expired)
+        else:
+            self.handle = None
+        self.callback(self)
+
+    def deinit(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+class ADC():
+    ATTN_0DB = 0
+    ATTN_11DB = 3
+    WIDTH_12BIT = 3
+    # ADC counts per volt at the supply, through the resistive dividers on the board
+    # (inverse of the VoltageMonitor calibration)
+    COUNTS_PER_VOLT = {35: 1 / 0.001757, 39: 1 / 0.001419}
+
+    def __init__(self, pin):
+        self.pin = pin.id
+
+    def atten(self, attenuation):
+        pass
+
+    def width(self, width):
+        pass
+
+    def read(self):
+        volts = world.vbat if self.pin == 35 else world.vusb
+        return max(0, min(4095, int(volts * ADC.COUNTS_PER_VOLT[self.pin])))
+
+#
+# PMS5003 on UART 1, passive mode protocol
+#
+PMS_CMD_PASSIVE = b'\x42\x4d\xe1\x00\x00\x01\x70'
+PMS_CMD_ACTIVE = b'\x42\x4d\xe1\x00\x01\x01\x71'
+PMS_CMD_READ = b'\x42\x4d\xe2\x00\x00\x01\x71'
+PMS_REPLY_DELAY_S = 0.05
+
+def pms5003_frame(pm1, pm25, pm10):
+    words = [pm1, pm25, pm10, pm1, pm25, pm10] + [0] * 7
+    frame = b'\x42\x4d' + struct.pack('>H', 2 * len(words) + 2) + struct.pack('>13H', *words)
+    return frame + struct.pack('>H', sum(frame) & 0xFFFF)
+
+def pms5003_mode_reply(mode):
+    frame = b'\x42\x4d\x00\x04\xe1' + bytes([mode])
+    return frame + struct.pack('>H', sum(frame) & 0xFFFF)
+
+class UART():
+    def __init__(self, id, baudrate=9600, tx=None, rx=None, **kwargs):
+        self.id = id
+        self.rx = bytearray()
+
+    def _reply(self, data):
+        self.rx += data
+
+    def write(self, data):
+        data = bytes(data)
+        if self.id != 1:
+            return len(data)
+        loop = asyncio.get_event_loop()
+        if data == PMS_CMD_READ:
+            loop.call_later(PMS_REPLY_DELAY_S, self._reply, pms5003_frame(*world.next_pm()))
+        elif data == PMS_CMD_PASSIVE:
+            loop.call_later(PMS_REPLY_DELAY_S, self._reply, pms5003_mode_reply(0))
+        elif data == PMS_CMD_ACTIVE:
+            loop.call_later(PMS_REPLY_DELAY_S, self._reply, pms5003_mode_reply(1))
+        return len(data)
+
+    def any(self):
+        return len(self.rx)
+
+    def read(self, nbytes=-1):
+        if not self.rx:
+            return None
+        if nbytes < 0:
+            nbytes = len(self.rx)
+        data = bytes(self.rx[:nbytes])
+        del self.rx[:nbytes]
+        return data
+
+    def deinit(self):
+        pass
+
+#
+# I2S microphone.  Each sample is a frame of two 32-bit slots (right, left),
+# with the 16, 24 or 32-bit WAV sample in the top bits of both.  Samples are read
+# in whole DMA buffers (dmalen frames), as on the ESP32
+#
+class I2S():
+    NUM0 = 0
+    NUM1 = 1
+    MASTER_RX = 5
+    MASTER_TX = 6
+    B16 = 16
+    B24 = 24
+    B32 = 32
+    RIGHT_LEFT = 0
+    ALL_RIGHT = 1
+    ALL_LEFT = 2
+    ONLY_RIGHT = 3
+    ONLY_LEFT = 4
+    PHILIPS = 1
+    LSB = 2
+    FRAME_BYTES = 8
+
+    def __init__(self, id, bck=None, ws=None, sdin=None, sdout=None, mode=MASTER_RX, samplerate=16000,
+                 dataformat=B32, channelformat=RIGHT_LEFT, standard=PHILIPS, dmacount=16, dmalen=64):
+        self.samplerate = samplerate
+        self.dmalen = dmalen
+        self.capacity = dmacount * dmalen * I2S.FRAME_BYTES
+        self.start = world.monotonic()
+        self.frames_read = 0
+        self.frames_lost = 0
+        self.wav = None
+        self.sample_bytes = 2
+        if world.wav_file is not None:
+            self.wav = wave.open(world.wav_file, 'rb')
+            self.sample_bytes = self.wav.getsampwidth()
+            if self.sample_bytes not in (2, 3, 4) or self.wav.getnchannels() != 1:
+                raise ValueError('{}: 16, 24 or 32-bit mono WAV needed'.format(world.wav_file))
+
+    def _samples(self, n):
+        nb = self.sample_bytes
+        if self.wav is None:
+            return bytes(n * nb)
+        data = b''
+        while len(data) < n * nb:
+            chunk = self.wav.readframes(n - len(data) // nb)
+            if not chunk:
+                self.wav.rewind()
+                continue
+            data += chunk
+        return data
+
+    # returns the number of bytes read.  Frames that arrived while the DMA memory
+    # was full are lost
+    def readinto(self, buf, timeout=-1):
+        arrived = int((world.monotonic() - self.start) * self.samplerate) - self.frames_read - self.frames_lost
+        max_frames = self.capacity // I2S.FRAME_BYTES
+        if arrived > max_frames:
+            self.frames_lost += arrived - max_frames
+            self._samples(arrived - max_frames)
+            arrived = max_frames
+        n = min(arrived, len(buf) // I2S.FRAME_BYTES)
+        n -= n % self.dmalen
+        if n <= 0:
+            return 0
+        samples = self._samples(n)
+        nb = self.sample_bytes
+        mv = memoryview(buf)
+        for slot in (0, 4):
+            for lane in range(4):
+                k = lane - (4 - nb)  # byte of the WAV sample, the top bytes are aligned
+                data = samples[k::nb] if k >= 0 else bytes(n)
+                mv[slot + lane:n * I2S.FRAME_BYTES:I2S.FRAME_BYTES] = data
+        self.frames_read += n
+        return n * I2S.FRAME_BYTES
+
+    def deinit(self):
+        if self.wav is not None:
+            self.wav.close()
+            self.wav = None
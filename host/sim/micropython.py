@@ -0,0 +1,16 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Simulated micropython module:  schedule() only.  On the device the function runs
+# between bytecodes once the hard interrupt handler returns, here on the next pass of
+# the event loop.  native is left out, so modules fall back to plain Python
+#
+import uasyncio as asyncio
+
+def schedule(func, arg):
+    asyncio.get_event_loop().call_soon(func, arg)
@@ -0,0 +1,53 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Simulated mqtt_as (pause/resume branch):  publishes go to world.mqtt_messages.
+# While world.mqtt_online is False, the client is not connected and publish() waits
+# for the connection, as the real client does.  world.wifi_on_seconds adds up the time
+# between resume() and pause()
+#
+import uasyncio as asyncio
+import world
+
+RTT_MS = 30
+
+class MQTTClient():
+    DEBUG = False
+
+    def __init__(self, server=None, ssid=None, wifi_pw=None, user=None, password=None, **kwargs):
+        self.server = server
+        self.paused = False
+        self.connected_at = 0
+        self.resumed_at = None
+
+    async def connect(self):
+        while not world.mqtt_online:
+            await asyncio.sleep(1)
+
+    def isconnected(self):
+        return world.mqtt_online and not self.paused and world.monotonic() >= self.connected_at
+
+    def pause(self):
+        self.paused = True
+        if self.resumed_at is not None:
+            world.wifi_on_seconds += world.monotonic() - self.resumed_at
+            self.resumed_at = None
+
+    def resume(self):
+        self.paused = False
+        self.resumed_at = world.monotonic()
+        self.connected_at = self.resumed_at + world.wifi_connect_seconds
+
+    async def publish(self, topic, msg, retain=False, qos=0):
+        while not self.isconnected():
+            await asyncio.sleep(1)
+        await asyncio.sleep_ms(RTT_MS if qos else 0)
+        world.mqtt_messages.append((bytes(topic), bytes(msg) if not isinstance(msg, str) else msg.encode()))
+
+    def close(self):
+        pass
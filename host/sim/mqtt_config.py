@@ -0,0 +1,11 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Simulated MQTT configuration (the device reads WiFi and Adafruit IO credentials from this module)
+#
+mqtt_config = {'ssid': 'sim', 'wifi_pw': 'sim', 'user': 'sim', 'password': 'sim'}
@@ -0,0 +1,15 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Simulated ms_timer module:  await timer(ms)
+#
+import uasyncio as asyncio
+
+class MillisecTimer():
+    def __call__(self, ms):
+        return asyncio.sleep_ms(ms)
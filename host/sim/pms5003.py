@@ -0,0 +1,65 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Simulated pms5003 driver (micropython-pms5003-minimal API), using the passive mode
+# protocol over the simulated UART (see machine.py)
+#
+import struct
+import uasyncio as asyncio
+
+_debug = False
+
+def set_debug(debug):
+    global _debug
+    _debug = debug
+
+CMD_PASSIVE = b'\x42\x4d\xe1\x00\x00\x01\x70'
+CMD_READ = b'\x42\x4d\xe2\x00\x00\x01\x71'
+FRAME_BYTES = 32
+TIMEOUT_MS = 2000
+
+class PMS5003():
+    def __init__(self, uart, lock, active_mode=True, event=None):
+        self.uart = uart
+        self.lock = lock
+        self.event = event
+        self.pm10_standard = 0
+        self.pm25_standard = 0
+        self.pm100_standard = 0
+        self.pm10_env = 0
+        self.pm25_env = 0
+        self.pm100_env = 0
+
+    async def setPassiveMode(self):
+        async with self.lock:
+            self.uart.write(CMD_PASSIVE)
+            await asyncio.sleep_ms(100)
+            self.uart.read()  # discard the mode change reply
+
+    async def read(self):
+        async with self.lock:
+            self.uart.write(CMD_READ)
+        asyncio.get_event_loop().create_task(self._receive())
+
+    async def _receive(self):
+        frame = b''
+        for _ in range(TIMEOUT_MS // 10):
+            data = self.uart.read(FRAME_BYTES - len(frame))
+            if data:
+                frame += data
+            if len(frame) == FRAME_BYTES:
+                break
+            await asyncio.sleep_ms(10)
+        if len(frame) != FRAME_BYTES or frame[:2] != b'\x42\x4d':
+            return
+        if sum(frame[:-2]) & 0xFFFF != struct.unpack('>H', frame[-2:])[0]:
+            return
+        (self.pm10_standard, self.pm25_standard, self.pm100_standard,
+         self.pm10_env, self.pm25_env, self.pm100_env) = struct.unpack('>6H', frame[4:16])
+        if self.event is not None:
+            self.event.set()
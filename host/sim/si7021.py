@@ -0,0 +1,39 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Simulated si7021 driver:  temperature and humidity from world
+# I2C transactions are made as by the driver:  a measure command, then a read once the
+# conversion is done.  The driver blocks while it waits for the conversion
+#
+import world
+
+class Si7021():
+    TEMP_NOHOLD = 0xF3
+    HUMIDITY_NOHOLD = 0xF5
+    # conversion time in seconds (datasheet maximum).  A humidity measurement includes a 
+    # temperature conversion
+    CONVERSION_S = {TEMP_NOHOLD: 0.0108, HUMIDITY_NOHOLD: 0.012 + 0.0108}
+
+    def __init__(self, i2c, address=0x40):
+        self.i2c = i2c
+        self.address = address
+
+    def _measure(self, command):
+        self.i2c.writeto(self.address, bytes([command]))
+        world.block(Si7021.CONVERSION_S[command])
+        self.i2c.readfrom(self.address, 3)
+
+    @property
+    def temperature(self):
+        self._measure(Si7021.TEMP_NOHOLD)
+        return world.temperature
+
+    @property
+    def relative_humidity(self):
+        self._measure(Si7021.HUMIDITY_NOHOLD)
+        return world.humidity
@@ -0,0 +1,74 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Simulated uasyncio (fast_io):  the uasyncio API used by Street Sense, on CPython asyncio
+#
+# use_virtual_clock() (before the first get_event_loop()) makes the loop run on a virtual
+# clock:  when no coroutine is ready, time jumps to the next timer instead of sleeping,
+# so hours of operation run in seconds.  world.monotonic() follows the loop time, and
+# world.block() moves it on
+#
+import asyncio as _asyncio
+import selectors
+from asyncio import sleep, wait_for, TimeoutError, CancelledError, Task, create_task
+import world
+
+_loop = None
+_virtual_clock = False
+
+class _VirtualSelector(selectors.SelectSelector):
+    def __init__(self, loop):
+        super().__init__()
+        self.loop = loop
+
+    # poll without blocking, then advance the clock by the time the loop would have slept
+    def select(self, timeout=None):
+        self.loop.passes += 1
+        events = super().select(0)
+        if not events and timeout:
+            self.loop.advance(timeout)
+        return events
+
+class VirtualClockLoop(_asyncio.SelectorEventLoop):
+    def __init__(self):
+        self.virtual_time = 0.0
+        self.passes = 0
+        super().__init__(selector=_VirtualSelector(self))
+
+    def time(self):
+        return self.virtual_time
+
+    def advance(self, seconds):
+        self.virtual_time += seconds
+
+def use_virtual_clock():
+    global _virtual_clock
+    if _loop is not None:
+        raise RuntimeError('the event loop already exists')
+    _virtual_clock = True
+    world.monotonic = get_event_loop().time
+    world.block = _loop.advance
+    world.set_time(world.rtc_start)
+
+def get_event_loop(runq_len=16, waitq_len=16, ioq_len=0, lp_len=0):
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = VirtualClockLoop() if _virtual_clock else _asyncio.new_event_loop()
+        _asyncio.set_event_loop(_loop)
+    return _loop
+
+async def sleep_ms(ms):
+    await _asyncio.sleep(ms / 1000)
+
+def set_debug(value):
+    pass
+
+class core():
+    @staticmethod
+    def set_debug(value):
+        pass
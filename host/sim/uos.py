@@ -0,0 +1,23 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Simulated MicroPython uos module.  The SD Card is a local directory (hal.SD_ROOT)
+#
+from os import listdir, stat, remove, rename, mkdir, rmdir, getcwd, chdir
+import os as _os
+
+def mount(block_device, mount_point):
+    if not _os.path.isdir(mount_point):
+        raise OSError(16, 'no directory for the SD Card: {}'.format(mount_point))
+
+def umount(mount_point):
+    pass
+
+def statvfs(path):
+    s = _os.statvfs(path)
+    return (s.f_bsize, s.f_frsize, s.f_blocks, s.f_bfree, s.f_bavail, s.f_files, s.f_ffree, s.f_favail, 0, s.f_namemax)
@@ -0,0 +1,138 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Simulated urtc module:  a DS3231 running on world.now(), with alarm 0 and alarm 1
+# - alarm_time() fields set to None are "don't care", as on the DS3231
+# - the alarm flag is set when the time passes the alarm time, and stays set until cleared
+# - with interrupt() enabled, the INT output (GPIO 36 on the Street Sense board) goes low
+#   when an alarm flag is set:  a falling edge interrupt, and world.rtc_int_at for light sleep
+# - I2C transactions are made as by the urtc driver, one per register block access
+#
+import calendar
+import time
+from collections import namedtuple
+import world
+import uasyncio as asyncio
+from machine import Pin
+
+DateTimeTuple = namedtuple('DateTimeTuple', ['year', 'month', 'day', 'weekday', 'hour',
+                                             'minute', 'second', 'millisecond'])
+
+def datetime_tuple(year=None, month=None, day=None, weekday=None, hour=None, minute=None,
+                   second=None, millisecond=None):
+    return DateTimeTuple(year, month, day, weekday, hour, minute, second, millisecond)
+
+UPY_EPOCH = 946684800
+
+def tuple2seconds(datetime):
+    return calendar.timegm((datetime[0], datetime[1], datetime[2], datetime[4],
+                            datetime[5], datetime[6], 0, 0, 0)) - UPY_EPOCH
+
+def seconds2tuple(seconds):
+    t = time.gmtime(seconds + UPY_EPOCH)
+    return DateTimeTuple(t.tm_year, t.tm_mon, t.tm_mday, t.tm_wday, t.tm_hour, t.tm_min, t.tm_sec, 0)
+
+class DS3231():
+    INT_PIN = 36
+    _DATETIME_REGISTER = 0x00
+    _ALARM_REGISTERS = (0x07, 0x0b)
+    _CONTROL_REGISTER = 0x0e
+    _STATUS_REGISTER = 0x0f
+
+    def __init__(self, i2c, address=0x68):
+        self.i2c = i2c
+        self.address = address
+        self.alarm_target = [None, None]
+        self.alarm_flag = [False, False]
+        self.interrupt_enabled = [False, False]
+        self.handles = [None, None]
+        Pin(DS3231.INT_PIN, value=1)
+
+    # read or read-modify-write of one register
+    def _register(self, register, write=False):
+        self.i2c.readfrom_mem(self.address, register, 1)
+        if write:
+            self.i2c.writeto_mem(self.address, register, b'\x00')
+
+    def datetime(self, datetime=None):
+        if datetime is None:
+            self.i2c.readfrom_mem(self.address, DS3231._DATETIME_REGISTER, 7)
+            return seconds2tuple(int(world.now()))
+        self.i2c.writeto_mem(self.address, DS3231._DATETIME_REGISTER, bytes(7))
+        world.set_time(tuple2seconds(datetime))
+        for i in (0, 1):
+            self._schedule(i)
+
+    def _update_alarms(self):
+        now = world.now()
+        for i in (0, 1):
+            if self.alarm_target[i] is not None and now >= self.alarm_target[i]:
+                self._set_flag(i)
+
+    def _set_flag(self, alarm):
+        self.alarm_target[alarm] = None
+        if self.handles[alarm] is not None:
+            self.handles[alarm].cancel()
+            self.handles[alarm] = None
+        if self.alarm_flag[alarm]:
+            return
+        self.alarm_flag[alarm] = True
+        self._update_int()
+
+    # INT is low while an enabled alarm flag is set
+    def _update_int(self):
+        low = any(self.alarm_flag[i] and self.interrupt_enabled[i] for i in (0, 1))
+        if low and world.rtc_int_at is None:
+            world.rtc_int_at = world.monotonic()
+            Pin(DS3231.INT_PIN).value(0)
+            Pin.trigger(DS3231.INT_PIN)
+        elif not low and world.rtc_int_at is not None:
+            world.rtc_int_at = None
+            Pin(DS3231.INT_PIN).value(1)
+
+    # with the interrupt enabled, the flag is set by a timer at the alarm time
+    def _schedule(self, alarm):
+        if self.handles[alarm] is not None:
+            self.handles[alarm].cancel()
+            self.handles[alarm] = None
+        target = self.alarm_target[alarm]
+        if target is not None and self.interrupt_enabled[alarm]:
+            self.handles[alarm] = asyncio.get_event_loop().call_later(max(0, target - world.now()),
+                                                                       self._set_flag, alarm)
+
+    def alarm_time(self, datetime=None, alarm=0):
+        if datetime is None:
+            self.i2c.readfrom_mem(self.address, DS3231._ALARM_REGISTERS[alarm], 4 - alarm)
+            return self.alarm_target[alarm]
+        self.i2c.writeto_mem(self.address, DS3231._ALARM_REGISTERS[alarm], bytes(4 - alarm))
+        # missing fields take the current value, i.e. the next match from now
+        now = seconds2tuple(int(world.now()))
+        fields = [now[i] if datetime[i] is None else datetime[i] for i in range(7)] + [0]
+        self.alarm_target[alarm] = tuple2seconds(fields)
+        self._schedule(alarm)
+
+    def alarm(self, value=None, alarm=0):
+        self._register(DS3231._STATUS_REGISTER, write=value is not None)
+        self._update_alarms()
+        if value is None:
+            return self.alarm_flag[alarm]
+        self.alarm_flag[alarm] = value
+        self._update_int()
+
+    def interrupt(self, alarm=0):
+        self._register(DS3231._CONTROL_REGISTER, write=True)
+        self.interrupt_enabled[alarm] = True
+        self._schedule(alarm)
+        self._update_int()
+
+    def no_interrupt(self):
+        self._register(DS3231._CONTROL_REGISTER, write=True)
+        self.interrupt_enabled = [False, False]
+        self._schedule(0)
+        self._schedule(1)
+        self._update_int()
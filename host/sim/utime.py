@@ -0,0 +1,46 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Simulated MicroPython utime module.  time() uses the MicroPython epoch (2000-01-01),
+# ticks and time() come from world.monotonic()
+#
+import time as _time
+import world
+
+_TICKS_PERIOD = 1 << 30
+
+def time():
+    return int(world.now())
+
+def localtime(secs=None):
+    if secs is None:
+        secs = time()
+    t = _time.gmtime(secs + 946684800)
+    return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, t.tm_wday, t.tm_yday)
+
+# blocking sleeps:  with a virtual clock, time does not move while the loop is blocked
+def sleep(seconds):
+    _time.sleep(seconds)
+
+def sleep_ms(ms):
+    _time.sleep(ms / 1000)
+
+def sleep_us(us):
+    _time.sleep(us / 1000000)
+
+def ticks_ms():
+    return int(world.monotonic() * 1000) % _TICKS_PERIOD
+
+def ticks_us():
+    return int(world.monotonic() * 1000000) % _TICKS_PERIOD
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) % _TICKS_PERIOD
+
+def ticks_diff(end, start):
+    return ((end - start + _TICKS_PERIOD // 2) % _TICKS_PERIOD) - _TICKS_PERIOD // 2
@@ -0,0 +1,76 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# State of the simulated environment, read by the simulated devices in host/sim
+# Set the values before (or while) the application runs, e.g. from host/simulate.py
+#
+import time
+
+# time:  the simulated devices and utime read monotonic().  It is the host clock, or
+# with a virtual clock (uasyncio.use_virtual_clock()) the event loop time, which jumps
+# ahead to the next timer instead of sleeping
+# the simulated RTC starts at rtc_start (seconds since 2000-01-01, MicroPython epoch)
+monotonic = time.monotonic
+rtc_start = 0
+_start = monotonic()
+
+# seconds since 2000-01-01 (MicroPython epoch)
+def now():
+    return rtc_start + (monotonic() - _start)
+
+def set_time(seconds):
+    global rtc_start, _start
+    rtc_start = seconds
+    _start = monotonic()
+
+# blocking device time, e.g. an I2C transfer or a si7021 conversion the driver waits for:
+# the host sleeps.  With a virtual clock the loop time moves on, and timers due meanwhile
+# run late, as scheduled work does on the device
+block = time.sleep
+
+# DS3231 INT output:  monotonic() time it goes (or went) low, None while high.  Set by
+# the simulated DS3231, read by machine.lightsleep()
+rtc_int_at = None
+# time spent in machine.lightsleep()
+light_sleep_seconds = 0
+
+# PMS5003:  (pm1.0, pm2.5, pm10) in ug/m3.  A list is used as a script, one entry
+# per reading (the last entry repeats)
+pm = [(8, 12, 15)]
+
+# ADS1219 inputs in mV, by channel name ('AIN0' ... 'AIN3').  Differential
+# channels read the difference of their two inputs
+gas_mv = {'AIN0': 250.0,  # O3 reference
+          'AIN1': 248.5,  # O3 gas
+          'AIN2': 260.0,  # NO2 gas
+          'AIN3': 261.2}  # NO2 reference
+gas_noise_mv = 0.05
+
+# si7021
+temperature = 21.5
+humidity = 45.0
+
+# voltages at the battery and USB supply, before the resistive dividers
+vbat = 4.1
+vusb = 5.0
+
+# I2S microphone:  16-bit mono WAV file, played in a loop.  Silence if None
+wav_file = None
+
+# MQTT:  messages received by the simulated broker (topic, payload), and whether
+# the broker can be reached.  After resume() the client is connected again once the WiFi 
+# and broker connection are back, wifi_connect_seconds later
+mqtt_messages = []
+mqtt_online = True
+wifi_connect_seconds = 3
+wifi_on_seconds = 0
+
+def next_pm():
+    if len(pm) > 1:
+        return pm.pop(0)
+    return pm[0]
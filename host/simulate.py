@@ -0,0 +1,123 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Run the Street Sense application under CPython, with simulated devices (host/sim)
+#
+#   python host/simulate.py --duration 300 --sd /tmp/sd --wav street.wav
+#
+# - the application (streetsense.py) runs unchanged:  host/sim holds modules with the
+#   names of the MicroPython modules and drivers it imports (machine, uasyncio, urtc,
+#   ads1219, pms5003, ...), host/dba.py stands in for the dba firmware module
+# - the SD Card is a local directory, the microphone plays a WAV file in a loop,
+#   MQTT messages are collected by a simulated broker
+# - sensor values are set in host/sim/world.py
+# - there is no display
+# - the simulation runs in real time.  With --virtual it runs on a virtual clock:  the
+#   event loop, utime, the RTC and the simulated devices share one clock, which jumps
+#   to the next timer when no coroutine is ready (e.g. a day in a few minutes, see
+#   bench/bench_virtual_clock.py).  Leave the microphone off (--no-mic) for long runs,
+#   it keeps the loop busy every few ms
+#
+import argparse
+import calendar
+import gc
+import logging
+import os
+import sys
+import tempfile
+import time
+
+HOST = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HOST, '..'))
+sys.path.insert(0, HOST)
+sys.path.insert(0, os.path.join(HOST, 'sim'))
+
+import world
+import uasyncio as asyncio
+import hal
+
+# MicroPython's gc reports heap use.  CPython's gc is built in (it cannot be replaced
+# from host/sim), so the functions are added to it
+if not hasattr(gc, 'mem_free'):
+    gc.mem_free = lambda: 0
+    gc.mem_alloc = lambda: 0
+
+def simulate(duration, sd_root, start='2020-01-01T00:00:00', wav=None, interval=None,
+             mode='normal', offline=False, virtual=False, mic=True, mic_bits=None):
+    """run the application for duration seconds (simulated).  Returns the list of
+    exceptions raised in coroutines"""
+    if virtual:
+        asyncio.use_virtual_clock()
+    world.set_time(calendar.timegm(time.strptime(start, '%Y-%m-%dT%H:%M:%S')) - 946684800)
+    world.wav_file = wav
+    world.mqtt_online = not offline
+    hal.SD_ROOT = sd_root
+    os.makedirs(hal.SD_ROOT, exist_ok=True)
+
+    import streetsense
+    if interval:
+        streetsense.LOGGING_INTERVAL_IN_SECS = interval
+    if mode == 'demo':
+        streetsense.operating_mode = streetsense.DEMO_MODE
+    streetsense.MIC_ENABLED = mic
+    if mic_bits:
+        # and the constants derived from it
+        streetsense.MIC_BITS = mic_bits
+        streetsense.NUM_BYTES_USED = mic_bits // 8
+        streetsense.BITS_PER_SAMPLE = mic_bits
+        streetsense.NUM_BYTES_IN_MIC_BLOCK = streetsense.NUM_FRAMES_IN_BLOCK * mic_bits // 8
+
+    # on the device an exception in a coroutine stops the scheduler:  do the same here,
+    # instead of only logging it
+    errors = []
+    def exception_handler(loop, context):
+        errors.append(context)
+        loop.default_exception_handler(context)
+        loop.stop()
+
+    loop = asyncio.get_event_loop()
+    loop.set_exception_handler(exception_handler)
+    loop.call_later(duration, loop.stop)
+    streetsense.main()
+
+    # the device would keep running:  write what is buffered
+    if hasattr(streetsense, 'sdcard_logger'):
+        streetsense.sdcard_logger.close()
+    return errors
+
+def main():
+    parser = argparse.ArgumentParser(description='run Street Sense with simulated devices')
+    parser.add_argument('--duration', type=float, default=300, help='seconds to run')
+    parser.add_argument('--sd', help='directory used as the SD Card (default: a new temporary directory)')
+    parser.add_argument('--wav', help='16, 24 or 32-bit mono WAV file played into the microphone')
+    parser.add_argument('--start', default='2020-01-01T00:00:00', help='RTC start time (UTC)')
+    parser.add_argument('--interval', type=int, help='measurement interval in seconds')
+    parser.add_argument('--mode', choices=('normal', 'demo'), default='normal')
+    parser.add_argument('--offline', action='store_true', help='MQTT broker cannot be reached')
+    parser.add_argument('--virtual', action='store_true', help='run on a virtual clock, as fast as possible')
+    parser.add_argument('--no-mic', action='store_true', help='no microphone capture')
+    parser.add_argument('--mic-bits', type=int, choices=(16, 24, 32), help='sample resolution (streetsense.MIC_BITS)')
+    args = parser.parse_args()
+
+    sd_root = args.sd or tempfile.mkdtemp(prefix='streetsense-sd-')
+    errors = simulate(args.duration, sd_root, start=args.start, wav=args.wav, interval=args.interval,
+                      mode=args.mode, offline=args.offline, virtual=args.virtual, mic=not args.no_mic,
+                      mic_bits=args.mic_bits)
+    logging.shutdown()
+
+    print('SD Card:  {}'.format(sd_root))
+    for fn in sorted(os.listdir(sd_root)):
+        print('  {:40s} {:10d} bytes'.format(fn, os.path.getsize(os.path.join(sd_root, fn))))
+    print('MQTT messages:  {}'.format(len(world.mqtt_messages)))
+    for topic, payload in world.mqtt_messages[-3:]:
+        print('  {} {}'.format(topic.decode(), payload.decode()))
+    if errors:
+        raise SystemExit('stopped by an exception in a coroutine')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Shared I2C bus (DS3231, ADS1219, si7021)
+# - I2CBus:  coroutines take the bus for a device operation with "async with bus:".
+#   Waiting coroutines queue on a lock, so the transactions of one operation (e.g. the
+#   ADS1219 configuration and capture) are not interleaved with another device's.
+#   The longest wait for the bus is kept in wait_max_us
+# - the ADS1219 DRDY read runs from an interrupt and does not take the lock:  it is done
+#   while the gas capture holds the bus
+# - Clock:  UTC time from utime.ticks_ms(), set from the DS3231 every resync_s seconds
+#   instead of an I2C read each time a timestamp is needed.  seconds() never touches the
+#   bus:  coroutines call update() first, which reads the DS3231 under the lock when the
+#   resync is due.  The first read, in the constructor, is done at startup before any
+#   coroutine shares the bus
+# - the clock must be resynced at least every few days:  utime.ticks_diff() is only valid
+#   within half the ticks period (about 6.2 days on the ESP32), past that seconds() is
+#   wrong and update() no longer sees the resync as due.  The interval timer calls update()
+#   at every interval;  without it (e.g. DEMO mode) run_sync() resyncs every resync_s
+#
+import utime
+import uasyncio as asyncio
+import urtc
+import asyn
+
+class I2CBus():
+    def __init__(self, i2c):
+        self.i2c = i2c
+        self.lock = asyn.Lock()
+        self.wait_max_us = 0
+
+    async def __aenter__(self):
+        start_us = utime.ticks_us()
+        await self.lock.acquire()
+        wait_us = utime.ticks_diff(utime.ticks_us(), start_us)
+        if wait_us > self.wait_max_us:
+            self.wait_max_us = wait_us
+        return self.i2c
+
+    async def __aexit__(self, *args):
+        self.lock.release()
+
+class Clock():
+    def __init__(self, rtc, bus, resync_s=600):
+        self.rtc = rtc
+        self.bus = bus
+        self.resync_s = resync_s
+        self.syncs = 0
+        self.set(rtc.datetime())
+
+    def set(self, datetime):
+        self.base_s = urtc.tuple2seconds(datetime)
+        self.base_ms = utime.ticks_ms()
+        self.syncs += 1
+
+    async def sync(self):
+        async with self.bus:
+            datetime = self.rtc.datetime()
+        self.set(datetime)
+
+    # resync from the DS3231 when due.  resync_s = 0 reads it at every update
+    async def update(self):
+        if utime.ticks_diff(utime.ticks_ms(), self.base_ms) >= self.resync_s * 1000:
+            await self.sync()
+
+    # for modes without the interval timer, which would otherwise never resync the clock
+    async def run_sync(self):
+        while True:
+            await self.update()
+            await asyncio.sleep(max(self.resync_s, 1))
+
+    # seconds since 2000-01-01 (MicroPython epoch), UTC
+    def seconds(self):
+        return self.base_s + utime.ticks_diff(utime.ticks_ms(), self.base_ms) // 1000
@@ -0,0 +1,293 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+import logging
+from array import array
+from collections import namedtuple
+try:
+    import utime
+except ImportError:
+    import time as utime
+
+log = logging.getLogger('streetsense')
+
+###################################
+#    Measurement Channels
+###################################
+#
+# Every measurement has a fixed integer handle.  The handle is used
+# as an index into the preallocated arrays of the repo, so producers
+# call add() with a handle rather than a string key.
+#
+PM10 = 0
+PM25 = 1
+PM100 = 2
+O3 = 3
+O3_VGAS = 4
+O3_VREF = 5
+NO2 = 6
+NO2_VGAS = 7
+NO2_VREF = 8
+TDEGC = 9
+RH = 10
+DBA = 11
+VBAT = 12
+VUSB = 13
+# octave band levels from the microphone band analyzer
+OCT63 = 14
+OCT125 = 15
+OCT250 = 16
+OCT500 = 17
+OCT1K = 18
+OCT2K = 19
+OCT4K = 20
+# noise statistics for the interval (see noisestats.py), in noisestats summary order
+LAEQ = 21
+LAFMAX = 22
+LASMAX = 23
+LA10 = 24
+LA50 = 25
+LA90 = 26
+
+# channel names, in handle order.  Names are used by the display, logger
+# and MQTT code when calling get()
+CHANNELS = ('pm10', 'pm25', 'pm100',
+            'o3', 'o3_vgas', 'o3_vref',
+            'no2', 'no2_vgas', 'no2_vref',
+            'tdegc', 'rh',
+            'dba',
+            'vbat', 'vusb',
+            'oct63', 'oct125', 'oct250', 'oct500', 'oct1k', 'oct2k', 'oct4k',
+            'laeq', 'lafmax', 'lasmax', 'la10', 'la50', 'la90')
+
+NUM_CHANNELS = len(CHANNELS)
+
+NAN = float('nan')
+
+_channel_ids = {name: handle for handle, name in enumerate(CHANNELS)}
+
+# channels that keep a time-series history
+HISTORY_CHANNELS = (PM25, O3, NO2, TDEGC, RH, DBA, VBAT)
+
+# history tiers:  (bucket resolution in seconds, number of buckets)
+# - 1 s buckets for the last 5 min
+# - 1 min buckets for the last 6 h
+# - 15 min buckets for the last 7 days
+# Memory bound, per history channel (4 bytes per bucket):
+#   tier 0:  300 x 4 = 1200 bytes
+#   tier 1:  360 x 4 = 1440 bytes
+#   tier 2:  672 x 4 = 2688 bytes
+#   total:   5328 bytes + ~40 bytes of accumulators
+# With the 7 default HISTORY_CHANNELS:  ~37.6 kB
+HISTORY_TIERS = ((1, 300), (60, 360), (900, 672))
+
+def channel_id(channel):
+    if isinstance(channel, str):
+        return _channel_ids[channel]
+    return channel
+
+#
+# Multi-resolution history for one channel
+# - one ring of bucket averages per tier, preallocated
+# - add() only accumulates into the finest tier's current bucket.  When time moves
+#   into a new bucket, its sum and count are written to the ring and carried into the
+#   next tier's bucket, which is closed in turn only when its own bucket changes.  So
+#   add() is O(1) and the coarser tiers are touched once per bucket of the tier below.
+#   Each tier's resolution must be a multiple of the previous tier's
+# - buckets without samples hold NaN
+#
+class History():
+    def __init__(self, tiers=HISTORY_TIERS):
+        for i in range(1, len(tiers)):
+            if tiers[i][0] % tiers[i - 1][0]:
+                raise ValueError('tier resolutions must be multiples of the previous tier')
+        self.tiers = tiers
+        num_tiers = len(tiers)
+        self.res = array('I', [res for res, _ in tiers])
+        self.size = array('I', [size for _, size in tiers])
+        self.res0 = tiers[0][0]
+        self.span = tiers[-1][0] * tiers[-1][1]  # longest window, in seconds
+        self.rings = [array('f', [NAN] * size) for _, size in tiers]
+        self.bucket = array('i', [-1] * num_tiers)  # bucket number being accumulated, per tier
+        self.acc_sum = array('f', [0] * num_tiers)
+        self.acc_count = array('I', [0] * num_tiers)
+        self.bucket0 = -1  # self.bucket[0], kept as an int for the test in add()
+
+    # t = timestamp in seconds
+    def add(self, value, t):
+        if t // self.res0 != self.bucket0:
+            self._advance(t)
+        self.acc_sum[0] += value
+        self.acc_count[0] += 1
+
+    # close the buckets that t has moved past, finest tier first
+    def _advance(self, t):
+        res = self.res
+        bucket = self.bucket
+        acc_sum = self.acc_sum
+        acc_count = self.acc_count
+        last = len(res) - 1
+        i = 0
+        while True:
+            b = t // res[i]
+            current = bucket[i]
+            if b == current:
+                # the coarser tiers' buckets hold this one:  unchanged too
+                break
+            if current >= 0:
+                size = self.size[i]
+                ring = self.rings[i]
+                count = acc_count[i]
+                if count:
+                    ring[current % size] = acc_sum[i] / count
+                    if i < last:
+                        acc_sum[i + 1] += acc_sum[i]
+                        acc_count[i + 1] += count
+                # mark buckets skipped without samples as empty
+                for k in range(current + 1, min(b, current + 1 + size)):
+                    ring[k % size] = NAN
+            bucket[i] = b
+            acc_sum[i] = 0
+            acc_count[i] = 0
+            if i == last:
+                break
+            i += 1
+        self.bucket0 = bucket[0]
+
+    # stats over bucket averages for the window (now - seconds, now]
+    # uses the finest tier that spans the window.  Windows longer than the
+    # coarsest tier (span seconds, 7 days by default) raise ValueError
+    # returns (min, max, sum, count) where count = number of buckets with data
+    def window(self, seconds, now):
+        if seconds > self.span:
+            raise ValueError('window longer than the history ({} s)'.format(self.span))
+        for i in range(len(self.tiers)):
+            res, size = self.tiers[i]
+            if res * size >= seconds:
+                break
+        last = now // res
+        first = last - (seconds + res - 1) // res + 1
+        current = self.bucket[i]
+        ring = self.rings[i]
+        # the current bucket:  its own samples and those of the finer tiers' open buckets
+        acc_sum = 0
+        acc_count = 0
+        for j in range(i + 1):
+            acc_sum += self.acc_sum[j]
+            acc_count += self.acc_count[j]
+        vmin = vmax = vsum = 0
+        count = 0
+        for k in range(first, last + 1):
+            if k == current and acc_count:
+                v = acc_sum / acc_count
+            elif k < current and k > current - size:
+                v = ring[k % size]
+                if v != v:  # NaN -> no samples in bucket
+                    continue
+            else:
+                continue
+            if count == 0 or v < vmin:
+                vmin = v
+            if count == 0 or v > vmax:
+                vmax = v
+            vsum += v
+            count += 1
+        return vmin, vmax, vsum, count
+
+#
+# Measurement Repository
+# - stores current value of measurements
+# - calculates stats: min, max, sum, avg, count
+# - storage is preallocated at init:  add() updates array slots in place,
+#   no per-sample namedtuple or dict entry is created
+# - keeps a multi-resolution history for HISTORY_CHANNELS, which is not
+#   affected by clear_stats()
+# - NaN is "not measured":  the current value of a channel never added, and a NaN added
+#   (e.g. noise statistics of an interval without audio).  It becomes the current value
+#   but is left out of the stats and the history.  min, max and avg are NaN without samples
+#
+class MeasurementRepo():
+    Measurement = namedtuple('Measurement', 'current min max sum avg count')
+
+    # clock:  function returning the time in seconds
+    def __init__(self, clock=utime.time):
+        log.info('REPO:init')
+        self.clock = clock
+        self.history = [None] * NUM_CHANNELS
+        for ch in HISTORY_CHANNELS:
+            self.history[ch] = History()
+        self.current = array('f', [NAN] * NUM_CHANNELS)
+        self.min = array('f', [0] * NUM_CHANNELS)
+        self.max = array('f', [0] * NUM_CHANNELS)
+        self.sum = array('f', [0] * NUM_CHANNELS)
+        self.count = array('I', [0] * NUM_CHANNELS)
+
+    # channel is an integer handle, e.g. measurements.DBA
+    def add(self, channel, value):
+        self.current[channel] = value
+        if value != value:
+            return
+        if self.count[channel] == 0:
+            self.min[channel] = value
+            self.max[channel] = value
+            self.sum[channel] = value
+        else:
+            if value < self.min[channel]:
+                self.min[channel] = value
+            if value > self.max[channel]:
+                self.max[channel] = value
+            self.sum[channel] += value
+        self.count[channel] += 1
+        history = self.history[channel]
+        if history is not None:
+            history.add(value, int(self.clock()))
+
+    # channel is an integer handle or a channel name, e.g. 'dba'
+    def get(self, channel):
+        log.debug('REPO:get')
+        ch = channel_id(channel)
+        count = self.count[ch]
+        if count == 0:
+            return MeasurementRepo.Measurement(current=self.current[ch], min=NAN, max=NAN, sum=0, avg=NAN, count=0)
+        return MeasurementRepo.Measurement(current=self.current[ch],
+                                           min=self.min[ch],
+                                           max=self.max[ch],
+                                           sum=self.sum[ch],
+                                           avg=self.sum[ch] / count,
+                                           count=count)
+
+    # stats for a window of time ending now, e.g. window('pm25', 3600)
+    # min/max/avg are taken over the bucket averages of the finest tier
+    # that covers the window.  count is the number of buckets with data.
+    # ValueError for a channel without history or a window longer than the history
+    def window(self, channel, seconds):
+        ch = channel_id(channel)
+        history = self.history[ch]
+        if history is None:
+            raise ValueError('no history for channel {}'.format(CHANNELS[ch]))
+        vmin, vmax, vsum, count = history.window(seconds, int(self.clock()))
+        return MeasurementRepo.Measurement(current=self.current[ch],
+                                           min=vmin,
+                                           max=vmax,
+                                           sum=vsum,
+                                           avg=vsum / count if count else 0,
+                                           count=count)
+
+    # clear stats, retaining the current value
+    def clear_stats(self, channel):
+        log.debug('REPO:clear')
+        ch = channel_id(channel)
+        self.min[ch] = 0
+        self.max[ch] = 0
+        self.sum[ch] = 0
+        self.count[ch] = 0
+
+    def clear_all_stats(self):
+        log.debug('REPO:clear all')
+        for ch in range(NUM_CHANNELS):
+            self.clear_stats(ch)
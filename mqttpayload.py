@@ -0,0 +1,41 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# One compact MQTT message per interval, holding every published measurement
+# - Adafruit IO group feed format, published to '<user>/groups/<group>':
+#     {"v":1,"feeds":{"pm25":12,"o3":21.53,...}}
+# - "v" is the schema version, incremented when fields are renamed or change meaning
+# - fields come from a table of (feed key, channel, statistic, decimal places),
+#   the same layout as LOG_FIELDS in streetsense.py
+# - a value that has not been measured (NaN) is sent as null
+#
+SCHEMA_VERSION = 1
+
+def group_topic(user, group):
+    return '{}/groups/{}'.format(user, group)
+
+def feed_topic(user, feed):
+    return '{}/feeds/{}'.format(user, feed)
+
+class GroupPayload():
+    def __init__(self, fields, version=SCHEMA_VERSION):
+        self.fields = fields
+        self.prefix = '{{"v":{},"feeds":{{'.format(version)
+        self.formats = ['"{}":{{:.{}f}}'.format(field[0], field[3]) for field in fields]
+        self.nulls = ['"{}":null'.format(field[0]) for field in fields]
+        self.parts = [None] * len(fields)
+
+    # returns the payload for the current values in a MeasurementRepo
+    def encode(self, repo):
+        for i, field in enumerate(self.fields):
+            value = getattr(repo.get(field[1]), field[2])
+            if value != value:
+                self.parts[i] = self.nulls[i]
+            else:
+                self.parts[i] = self.formats[i].format(value)
+        return self.prefix + ','.join(self.parts) + '}}'
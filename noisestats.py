@@ -0,0 +1,130 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Noise statistics over a reporting interval, from short dB(A) levels (dba module)
+# - update() takes the level of one block of samples, e.g. 125 ms.  Levels are averaged
+#   as energies (10^(L/10)), not as decibels
+#   - Leq:  running energy sum of the blocks
+#   - fast (125 ms) and slow (1 s) time weighting:  exponential averages of the block
+#     energies, with their maximum (LAFmax, LASmax)
+#   - L10, L50, L90:  levels exceeded 10, 50 and 90% of the time, from a histogram of the
+#     fast weighted level with 0.1 dB bins, LEVEL_MIN_DB to LEVEL_MAX_DB
+# - update() is O(1):  a few float operations and one histogram increment.  The state
+#   is preallocated, nothing grows with the interval length
+# - report() fills the summary array (LEQ ... L90), then starts a new interval.  The
+#   time weighted levels carry on across intervals.  An interval without updates (e.g.
+#   the capture stopped) reports NaN for every statistic:  not measured, rather than 0 dB
+#
+# Memory:  1200 bins x 4 bytes = 4.8 kB of histogram
+#
+import math
+from array import array
+
+LEVEL_MIN_DB = 20
+LEVEL_MAX_DB = 140
+BINS_PER_DB = 10
+NUM_BINS = (LEVEL_MAX_DB - LEVEL_MIN_DB) * BINS_PER_DB
+
+NAN = float('nan')
+
+FAST_TAU_S = 0.125
+SLOW_TAU_S = 1.0
+
+# summary columns
+LEQ = 0
+LAFMAX = 1
+LASMAX = 2
+L10 = 3
+L50 = 4
+L90 = 5
+NUM_SUMMARY = 6
+
+class NoiseStats():
+    # block_s:  duration of the blocks passed to update(), in seconds
+    def __init__(self, block_s):
+        self.fast_k = 1 - math.exp(-block_s / FAST_TAU_S)
+        self.slow_k = 1 - math.exp(-block_s / SLOW_TAU_S)
+        self.hist = array('I', [0] * NUM_BINS)
+        self.summary = array('f', [0] * NUM_SUMMARY)
+        self.fast = 0.0
+        self.slow = 0.0
+        self.lo = NUM_BINS
+        self.hi = -1
+        self.clear()
+
+    def clear(self):
+        for b in range(max(0, self.lo), self.hi + 1):
+            self.hist[b] = 0
+        self.lo = NUM_BINS
+        self.hi = -1
+        self.count = 0
+        self.energy_sum = 0.0
+        self.fast_max = 0.0
+        self.slow_max = 0.0
+
+    # level of one block, dB(A)
+    def update(self, level):
+        energy = math.pow(10, level * 0.1)
+        self.energy_sum += energy
+        self.count += 1
+        self.fast += (energy - self.fast) * self.fast_k
+        self.slow += (energy - self.slow) * self.slow_k
+        if self.fast > self.fast_max:
+            self.fast_max = self.fast
+        if self.slow > self.slow_max:
+            self.slow_max = self.slow
+        b = int((self.laf() - LEVEL_MIN_DB) * BINS_PER_DB)
+        if b < 0:
+            b = 0
+        elif b >= NUM_BINS:
+            b = NUM_BINS - 1
+        self.hist[b] += 1
+        if b < self.lo:
+            self.lo = b
+        if b > self.hi:
+            self.hi = b
+
+    # fast and slow time weighted levels, dB(A)
+    def laf(self):
+        return to_db(self.fast)
+
+    def las(self):
+        return to_db(self.slow)
+
+    # level exceeded pct % of the time:  the center of the bin where the count from the
+    # top reaches pct % of the updates.  NaN without updates
+    def exceeded(self, pct):
+        if self.count == 0:
+            return NAN
+        target = self.count * pct / 100
+        total = 0
+        for b in range(self.hi, self.lo - 1, -1):
+            total += self.hist[b]
+            if total >= target:
+                return LEVEL_MIN_DB + (b + 0.5) / BINS_PER_DB
+        return LEVEL_MIN_DB + (self.lo + 0.5) / BINS_PER_DB
+
+    # summarize the interval into summary[], then start a new one.  All NaN without updates
+    def report(self):
+        s = self.summary
+        if self.count == 0:
+            for i in range(NUM_SUMMARY):
+                s[i] = NAN
+        else:
+            s[LEQ] = to_db(self.energy_sum / self.count)
+            s[LAFMAX] = to_db(self.fast_max)
+            s[LASMAX] = to_db(self.slow_max)
+            s[L10] = self.exceeded(10)
+            s[L50] = self.exceeded(50)
+            s[L90] = self.exceeded(90)
+        self.clear()
+
+def to_db(energy):
+    if energy <= 0:
+        return 0.0
+    return 10 * math.log10(energy)
@@ -0,0 +1,259 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Store-and-forward outbox for MQTT messages, kept on the SD Card
+# - put() appends a message to an append-only file:
+#     topic length (H), payload length (H), topic, payload, CRC-32 of the preceding bytes (I)
+# - drain() publishes messages oldest first, in bounded batches with a pause between
+#   batches.  After each batch the read offset is saved in a checkpoint file, so a reset
+#   or a dropped connection resends at most one batch (at-least-once delivery)
+# - when everything is sent, both files are reset.  When the read offset passes
+#   compact_bytes (e.g. while the oldest messages are dropped during a long broker outage)
+#   the unsent messages are copied to the front of a new file, so the file stays below
+#   max_bytes + compact_bytes
+# - at start-up, a torn message at the end of the file (reset during put) is removed and
+#   a corrupt message is skipped:  reading resumes at the next valid message
+# - a header is checked before its message is read:  lengths above MAX_MESSAGE_BYTES or
+#   past the end of the file are rejected, so a garbage header cannot make read() allocate
+#   up to 128 kB.  The search for the next valid message scans RESYNC_CHUNK bytes per read
+# - if the backlog grows above max_bytes, the oldest messages are dropped
+#
+import logging
+try:
+    import uos
+    import ustruct as struct
+    import ubinascii as binascii
+    import uasyncio as asyncio
+except ImportError:
+    import os as uos
+    import struct
+    import binascii
+    import asyncio
+
+log = logging.getLogger('streetsense')
+
+MSG_HEADER = '<HH'
+MSG_HEADER_SIZE = struct.calcsize(MSG_HEADER)
+MAX_MESSAGE_BYTES = 2048  # topic + payload.  The largest message, diagnostics, is ~700 bytes
+RESYNC_CHUNK = 512
+
+class Outbox():
+    def __init__(self, fn, checkpoint_fn, max_bytes=1024*1024, compact_bytes=None):
+        log.info('OUTBOX:init')
+        self.fn = fn
+        self.checkpoint_fn = checkpoint_fn
+        self.max_bytes = max_bytes
+        self.compact_bytes = compact_bytes or max_bytes // 4
+        self.finish_rewrite()
+        self.offset = self.read_checkpoint()
+        self.size = self.file_size()
+        self.sent_count = 0
+        self.recover()
+
+    def file_size(self):
+        try:
+            return uos.stat(self.fn)[6]
+        except OSError:
+            return 0
+
+    def read_checkpoint(self):
+        try:
+            with open(self.checkpoint_fn, 'r') as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    def write_checkpoint(self, offset):
+        with open(self.checkpoint_fn, 'w') as f:
+            f.write('{}'.format(offset))
+        self.offset = offset
+
+    # a header that can start a message at offset
+    def plausible(self, offset, topic_len, payload_len):
+        n = topic_len + payload_len
+        return n <= MAX_MESSAGE_BYTES and offset + MSG_HEADER_SIZE + n + 4 <= self.size
+
+    # read the message at offset in an open file
+    # returns (topic, payload, next offset), or None if the message is torn or corrupt
+    def read_message(self, f, offset):
+        f.seek(offset)
+        header = f.read(MSG_HEADER_SIZE)
+        if len(header) < MSG_HEADER_SIZE:
+            return None
+        topic_len, payload_len = struct.unpack(MSG_HEADER, header)
+        if not self.plausible(offset, topic_len, payload_len):
+            return None
+        body = f.read(topic_len + payload_len + 4)
+        if len(body) < topic_len + payload_len + 4:
+            return None
+        crc = binascii.crc32(body[:topic_len + payload_len], binascii.crc32(header)) & 0xFFFFFFFF
+        if crc != struct.unpack('<I', body[topic_len + payload_len:])[0]:
+            return None
+        return body[:topic_len], body[topic_len:topic_len + payload_len], offset + MSG_HEADER_SIZE + len(body)
+
+    # a reset during rewrite() after the old file was removed:  use the new one
+    def finish_rewrite(self):
+        tmp_fn = self.fn + '.tmp'
+        try:
+            uos.stat(tmp_fn)
+        except OSError:
+            return
+        try:
+            uos.stat(self.fn)
+            uos.remove(tmp_fn)  # the rewrite did not complete
+        except OSError:
+            uos.rename(tmp_fn, self.fn)
+
+    # the offset of the next valid message at or after offset, or None.  Headers are
+    # checked in a chunk in memory, a message is read only for a plausible header
+    def resync(self, f, offset):
+        while offset < self.size - MSG_HEADER_SIZE:
+            f.seek(offset)
+            chunk = f.read(RESYNC_CHUNK)
+            for i in range(len(chunk) - MSG_HEADER_SIZE + 1):
+                topic_len, payload_len = struct.unpack_from(MSG_HEADER, chunk, i)
+                if (self.plausible(offset + i, topic_len, payload_len) and
+                        self.read_message(f, offset + i) is not None):
+                    return offset + i
+            offset += len(chunk) - MSG_HEADER_SIZE + 1
+        return None
+
+    # keep only the valid messages after the checkpoint
+    def recover(self):
+        if self.offset > self.size:
+            self.offset = 0
+        if self.size == 0:
+            return
+        ranges = []  # [start, end) of runs of valid messages
+        start = end = self.offset
+        with open(self.fn, 'rb') as f:
+            while end < self.size:
+                msg = self.read_message(f, end)
+                if msg is not None:
+                    end = msg[2]
+                    continue
+                if end > start:
+                    ranges.append((start, end))
+                start = end = self.resync(f, end + 1)
+                if start is None:
+                    break
+        if end is not None and end > start:
+            ranges.append((start, end))
+        if ranges == [(self.offset, self.size)]:
+            log.info('OUTBOX:%d bytes waiting', self.size - self.offset)
+            return
+        kept = sum(end - start for start, end in ranges)
+        log.info('OUTBOX:removing %d bytes of torn or corrupt messages', self.size - self.offset - kept)
+        self.rewrite(ranges)
+
+    # copy the byte ranges [(start, end), ...] to a new file, which then starts at offset 0.
+    # The checkpoint is reset first:  a reset during the copy resends, it does not lose
+    # messages (MicroPython cannot truncate files)
+    def rewrite(self, ranges):
+        tmp_fn = self.fn + '.tmp'
+        size = 0
+        with open(self.fn, 'rb') as f, open(tmp_fn, 'wb') as out:
+            for start, end in ranges:
+                f.seek(start)
+                remaining = end - start
+                while remaining:
+                    chunk = f.read(min(remaining, 512))
+                    out.write(chunk)
+                    remaining -= len(chunk)
+                size += end - start
+        self.write_checkpoint(0)
+        uos.remove(self.fn)
+        uos.rename(tmp_fn, self.fn)
+        self.size = size
+
+    # move the unsent messages to the front of the file, once enough has been consumed
+    def compact(self):
+        if self.offset >= self.compact_bytes:
+            log.info('OUTBOX:compacting, %d bytes consumed', self.offset)
+            self.rewrite([(self.offset, self.size)])
+
+    def pending_bytes(self):
+        return self.size - self.offset
+
+    def put(self, topic, payload):
+        if isinstance(topic, str):
+            topic = topic.encode()
+        if isinstance(payload, str):
+            payload = payload.encode()
+        if len(topic) + len(payload) > MAX_MESSAGE_BYTES:
+            raise ValueError('message over MAX_MESSAGE_BYTES')
+        header = struct.pack(MSG_HEADER, len(topic), len(payload))
+        crc = binascii.crc32(payload, binascii.crc32(topic, binascii.crc32(header))) & 0xFFFFFFFF
+        with open(self.fn, 'ab') as f:
+            # one write, so a reset can only leave a torn message at the end
+            f.write(header + topic + payload + struct.pack('<I', crc))
+        self.size += MSG_HEADER_SIZE + len(topic) + len(payload) + 4
+        if self.pending_bytes() > self.max_bytes:
+            self.drop_oldest()
+
+    def drop_oldest(self):
+        offset = self.offset
+        with open(self.fn, 'rb') as f:
+            while self.size - offset > self.max_bytes:
+                msg = self.read_message(f, offset)
+                if msg is None:
+                    break
+                offset = msg[2]
+        log.info('OUTBOX:backlog full, dropped %d bytes', offset - self.offset)
+        self.write_checkpoint(offset)
+        self.compact()
+
+    # returns [(topic, payload, offset after the message), ...]
+    def read_batch(self, max_messages):
+        batch = []
+        offset = self.offset
+        if offset >= self.size:
+            return batch
+        with open(self.fn, 'rb') as f:
+            while len(batch) < max_messages and offset < self.size:
+                msg = self.read_message(f, offset)
+                if msg is None:
+                    break
+                batch.append(msg)
+                offset = msg[2]
+        return batch
+
+    def commit(self, offset):
+        if offset >= self.size:
+            # all sent:  start again with empty files
+            uos.remove(self.fn)
+            self.size = 0
+            offset = 0
+        self.write_checkpoint(offset)
+        self.compact()
+
+    # publish:  coroutine function (topic, payload), raising an exception when the message
+    #           was not acknowledged
+    # returns the number of messages sent.  Stops early on a publish failure, keeping
+    # the messages acknowledged so far
+    async def drain(self, publish, batch_size=10, pacing_ms=200, max_batches=30):
+        sent = 0
+        for _ in range(max_batches):
+            batch = self.read_batch(batch_size)
+            if not batch:
+                break
+            acked = self.offset
+            try:
+                for topic, payload, next_offset in batch:
+                    await publish(topic, payload)
+                    acked = next_offset
+                    sent += 1
+            except Exception as e:
+                log.info('OUTBOX:publish failed %s', e)
+                self.commit(acked)
+                break
+            self.commit(acked)
+            await asyncio.sleep(pacing_ms / 1000)
+        self.sent_count += sent
+        log.info('OUTBOX:sent %d, %d bytes waiting', sent, self.pending_bytes())
+        return sent
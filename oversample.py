@@ -0,0 +1,94 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Adaptive oversampling of ADC conversions, with an outlier-robust estimate
+# - the DRDY interrupt handler stores raw codes with add():  one array('i') slot write,
+#   no allocation.  The ring holds the last max_samples codes
+# - the capture coroutine calls update() while it waits:  it folds the new codes into a
+#   running mean / variance (Welford) and returns True when the capture can stop, i.e.
+#   max_samples codes, or at least min_samples codes with a standard error of the mean
+#   below target_se
+# - estimate() is the trimmed mean of the codes:  trim is the fraction dropped at each
+#   end (0 = mean, 0.5 = median), which rejects spikes a plain mean would average in
+#
+# Codes are kept as integers and the target is in codes:  the caller converts from mV
+#
+import math
+from array import array
+
+INFINITY = float('inf')
+
+class Oversampler():
+    def __init__(self, max_samples=100, min_samples=20, target_se=0, trim=0.1):
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        self.target_se = target_se
+        self.trim = trim
+        self.ring = array('i', [0] * max_samples)
+        self.sorted = array('i', [0] * max_samples)
+        self.reset()
+
+    def reset(self):
+        self.count = 0    # codes added, written by the interrupt handler
+        self.seen = 0     # codes looked at by update()
+        self.n = 0        # codes in the running stats
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    # interrupt handler:  store one code
+    def add(self, code):
+        self.ring[self.count % self.max_samples] = code
+        self.count += 1
+
+    # running standard error of the mean, in codes
+    def standard_error(self):
+        n = self.n
+        if n < 2:
+            return INFINITY
+        return math.sqrt(self.m2 / (n - 1) / n)
+
+    # returns True when enough codes were captured
+    def update(self):
+        count = self.count
+        first = max(self.seen, count - self.max_samples)
+        for i in range(first, count):
+            code = self.ring[i % self.max_samples]
+            self.n += 1
+            delta = code - self.mean
+            self.mean += delta / self.n
+            self.m2 += delta * (code - self.mean)
+        self.seen = count
+        if count >= self.max_samples:
+            return True
+        return count >= self.min_samples and self.standard_error() <= self.target_se
+
+    def captured(self):
+        return min(self.count, self.max_samples)
+
+    # trimmed mean of the captured codes
+    def estimate(self):
+        n = self.captured()
+        if n == 0:
+            return 0
+        # insertion sort into the preallocated work array
+        ring = self.ring
+        s = self.sorted
+        for i in range(n):
+            code = ring[i]
+            j = i - 1
+            while j >= 0 and s[j] > code:
+                s[j + 1] = s[j]
+                j -= 1
+            s[j + 1] = code
+        k = int(n * self.trim)
+        if n - 2 * k < 1:
+            k = (n - 1) // 2
+        total = 0
+        for i in range(k, n - k):
+            total += s[i]
+        return total / (n - 2 * k)
@@ -0,0 +1,209 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Continuous, segmented WAV recording
+# - audio is written through an SDWriter to a sequence of WAV files, each holding
+#   exactly segment_seconds of audio.  A block that crosses a segment boundary is split
+#   on a sample boundary, so no samples are lost or repeated between segments
+# - the header is written with a data size of 0 and the RIFF/data sizes are filled in
+#   when the segment is closed
+# - segments left with a size of 0 (e.g. by a reset) are repaired at start-up from the file size
+# - a preallocated segment has its full size from the start, and the unwritten part holds
+#   whatever the card's clusters held (SDWriter.preallocate).  So while it is recorded, the
+#   header's data size is updated every checkpoint_bytes (from the flush coroutine), and
+#   recovery keeps the header's size:  a reset loses at most the audio since the last
+#   checkpoint and never exposes stale data
+# - when the segments use more than max_disk_bytes, the oldest segments are deleted
+# - with an ADPCMEncoder, 16-bit PCM blocks are encoded to IMA ADPCM before writing.
+#   Segments then hold a whole number of ADPCM blocks
+#
+import logging
+import wavheader
+import adpcm
+try:
+    import uos
+except ImportError:
+    import os as uos
+
+log = logging.getLogger('streetsense:MIC')
+
+# sort key for segment file names, e.g. 'mic-2020-1-31-23-5-9.wav' -> (2020, 1, 31, 23, 5, 9)
+def segment_key(fn):
+    key = []
+    for field in fn.rsplit('.', 1)[0].split('-')[1:]:
+        try:
+            key.append(int(field))
+        except ValueError:
+            key.append(0)
+    return tuple(key)
+
+class SegmentRecorder():
+    # directory:  e.g. '/sd'
+    # name_fn:  returns the file name (without directory) for a new segment
+    # writer:  SDWriter used for all segment files
+    # encoder:  None for PCM, or an adpcm.ADPCMEncoder (input must be 16-bit PCM)
+    def __init__(self, directory, prefix, name_fn, writer, sample_rate, bits_per_sample,
+                 segment_seconds, max_disk_bytes, preallocate=False, encoder=None, checkpoint_bytes=65536):
+        if encoder is not None and bits_per_sample != 16:
+            raise ValueError('ADPCM encoding needs 16-bit samples')
+        self.directory = directory
+        self.prefix = prefix
+        self.name_fn = name_fn
+        self.writer = writer
+        self.sample_rate = sample_rate
+        self.bits_per_sample = bits_per_sample
+        self.sample_bytes = bits_per_sample // 8  # bytes per input sample
+        self.encoder = encoder
+        self.segment_samples = segment_seconds * sample_rate
+        if encoder is None:
+            self.header_len = wavheader.WAV_HEADER_LEN
+            self.segment_bytes = self.segment_samples * self.sample_bytes
+        else:
+            spb = encoder.samples_per_block
+            self.segment_samples = (self.segment_samples + spb - 1) // spb * spb
+            self.header_len = wavheader.IMA_ADPCM_HEADER_LEN
+            self.segment_bytes = self.segment_samples // spb * encoder.block_align
+        self.max_disk_bytes = max_disk_bytes
+        self.preallocate = preallocate
+        if preallocate:
+            writer.set_checkpoint(checkpoint_bytes, self.checkpoint)
+        self.f = None
+        self.fn = None
+        self.bytes_in_segment = 0
+        self.samples_in_segment = 0
+        self.segments = []  # [segment_key, file name, size], oldest first
+        self.disk_bytes = 0
+        self.segment_count = 0
+
+    def path(self, fn):
+        return '{}/{}'.format(self.directory, fn)
+
+    def is_segment(self, fn):
+        return fn.startswith(self.prefix + '-') and fn.endswith('.wav')
+
+    # repair segments left open by a reset and build the list of segments on disk
+    def recover(self):
+        for fn in uos.listdir(self.directory):
+            if not self.is_segment(fn):
+                continue
+            size = uos.stat(self.path(fn))[6]
+            if size >= wavheader.IMA_ADPCM_HEADER_LEN:
+                with open(self.path(fn), 'r+b') as f:
+                    self.recover_file(f, fn, size)
+            self.segments.append([segment_key(fn), fn, size])
+            self.disk_bytes += size
+        self.segments.sort()
+        self.enforce_disk_cap()
+
+    def recover_file(self, f, fn, size):
+        header_len = wavheader.header_len(f)
+        datasize = wavheader.read_data_size(f, header_len)
+        if datasize + header_len <= size and (datasize != 0 or size == self.header_len + self.segment_bytes):
+            # closed, or preallocated:  the header has the audio written up to the last checkpoint
+            return
+        f.seek(32)
+        block_align = int.from_bytes(f.read(2), 'little')
+        datasize = size - header_len
+        datasize -= datasize % block_align
+        samples = None
+        if header_len == wavheader.IMA_ADPCM_HEADER_LEN:
+            samples = datasize // block_align * adpcm.samples_per_block(block_align)
+        wavheader.update_wav_header(f, datasize, header_len, samples)
+        log.info('recovered %s, %d bytes of audio', fn, datasize)
+
+    def enforce_disk_cap(self):
+        # never delete the segment being recorded (last in the list)
+        while self.disk_bytes > self.max_disk_bytes and len(self.segments) > 1:
+            _, fn, size = self.segments.pop(0)
+            try:
+                uos.remove(self.path(fn))
+                log.info('disk cap: deleted %s', fn)
+            except OSError:
+                log.info('disk cap: could not delete %s', fn)
+            self.disk_bytes -= size
+
+    def open_segment(self):
+        self.fn = self.name_fn()
+        self.f = open(self.path(self.fn), 'wb')
+        self.writer.open(self.f)
+        if self.encoder is None:
+            wav_header = wavheader.gen_wav_header(self.sample_rate, self.bits_per_sample, 1, 0)
+        else:
+            wav_header = wavheader.gen_wav_header_ima_adpcm(self.sample_rate, 1, self.encoder.block_align,
+                                                            self.encoder.samples_per_block, 0)
+        if self.preallocate:
+            self.writer.preallocate(len(wav_header) + self.segment_bytes)
+        self.writer.write(wav_header)
+        self.bytes_in_segment = 0
+        self.samples_in_segment = 0
+        full_size = len(wav_header) + self.segment_bytes
+        self.segments.append([segment_key(self.fn), self.fn, full_size])
+        self.disk_bytes += full_size
+        self.enforce_disk_cap()
+        log.info('recording segment %s', self.fn)
+
+    # from the writer's flush coroutine:  the audio in the file so far into the header
+    def checkpoint(self, f, file_bytes):
+        datasize = file_bytes - self.header_len
+        samples = None
+        if self.encoder is not None:
+            datasize -= datasize % self.encoder.block_align
+            samples = datasize // self.encoder.block_align * self.encoder.samples_per_block
+        wavheader.update_wav_header(f, datasize, self.header_len, samples)
+
+    def close_segment(self):
+        self.writer.close()
+        samples = None
+        if self.encoder is not None:
+            # samples of an incomplete last ADPCM block are not written
+            samples = self.bytes_in_segment // self.encoder.block_align * self.encoder.samples_per_block
+        wavheader.update_wav_header(self.f, self.bytes_in_segment, self.header_len, samples)
+        self.f.close()
+        self.f = None
+        # correct the size booked in open_segment() for a short (closed early) segment.
+        # A preallocated file keeps its full size on the card
+        if not self.preallocate:
+            booked = self.segments[-1][2]
+            actual = self.header_len + self.bytes_in_segment
+            self.segments[-1][2] = actual
+            self.disk_bytes += actual - booked
+        self.segment_count += 1
+        log.info('closed segment %s, %d bytes of audio', self.fn, self.bytes_in_segment)
+
+    def start(self):
+        self.recover()
+        self.open_segment()
+
+    def _write(self, data):
+        if self.encoder is None:
+            # count the bytes the writer accepted, so a dropped block does not
+            # make the header claim more audio than the file holds
+            self.bytes_in_segment += self.writer.write(data)
+        else:
+            completed = self.encoder.encode(data)
+            if completed is not None:
+                self.bytes_in_segment += self.writer.write(completed)
+        self.samples_in_segment += len(data) // self.sample_bytes
+
+    # write a block of samples, rolling over to a new segment on a sample boundary
+    def write(self, block):
+        n = len(block) // self.sample_bytes
+        remaining = self.segment_samples - self.samples_in_segment
+        if n < remaining:
+            self._write(block)
+            return
+        mv = memoryview(block)
+        self._write(mv[:remaining * self.sample_bytes])
+        self.close_segment()
+        self.open_segment()
+        if n > remaining:
+            self._write(mv[remaining * self.sample_bytes:])
+
+    def stop(self):
+        if self.f is not None:
+            self.close_segment()
@@ -0,0 +1,220 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Run-length encoded RGB565 images, decoded one row at a time from a file
+#
+# File layout (little-endian), written by host/png2rle.py:
+#   header:     magic 'SSRL' (4s), width (H), height (H)
+#   row table:  file offset of each row (I), height entries
+#   rows:       packets of a control byte c followed by 2-byte pixels
+#                 c < 0x80:   c + 1 literal pixels
+#                 c >= 0x80:  one pixel repeated (c & 0x7F) + 1 times
+#               runs never cross a row, so any row can be decoded on its own
+#
+# Pixels are stored in the byte order of the display (same as the raw *_rgb565.bin images)
+#
+# register_decoder() adds an LVGL image decoder, so an lv.img can show an .rle file.
+# LVGL asks for the image row by row while it draws into its display buffer.  The rows are
+# decoded a strip at a time (STRIP_ROWS, the height of the display buffer):  the first row
+# asked for in a strip reads the strip's encoded rows with one readinto() and decodes them
+# all, the other rows of the strip are copied from the decoded strip.  Only the row table,
+# one encoded and one decoded strip are kept in RAM (preallocated at open, 6.4 kB decoded
+# for a 320 pixel wide image), never the whole image
+#
+from array import array
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+try:
+    import micropython
+    native = micropython.native
+except (ImportError, AttributeError):
+    native = lambda f: f
+
+MAGIC = b'SSRL'
+HEADER_FORMAT = '<4sHH'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAX_PACKET_PIXELS = 128
+STRIP_ROWS = 10
+
+# largest encoded row:  all literal packets
+def max_row_bytes(width):
+    return width * 2 + (width + MAX_PACKET_PIXELS - 1) // MAX_PACKET_PIXELS
+
+# decode the packets of one row, src[i:src_end], into dest from byte out:  pixels x to
+# x + length of the row.  Returns the byte position in dest after the pixels
+@native
+def decode_row(src, i, src_end, dest, out, x, length):
+    pos = 0  # pixel position in the row
+    end = x + length
+    while i < src_end and pos < end:
+        c = src[i]
+        i += 1
+        if c & 0x80:
+            n = (c & 0x7F) + 1
+            lo = src[i]
+            hi = src[i + 1]
+            i += 2
+            first = pos if pos > x else x
+            last = pos + n if pos + n < end else end
+            while first < last:
+                dest[out] = lo
+                dest[out + 1] = hi
+                out += 2
+                first += 1
+        else:
+            n = c + 1
+            first = pos if pos > x else x
+            last = pos + n if pos + n < end else end
+            j = i + (first - pos) * 2
+            while first < last:
+                dest[out] = src[j]
+                dest[out + 1] = src[j + 1]
+                out += 2
+                j += 2
+                first += 1
+            i += n * 2
+        pos += n
+    return out
+
+class RLEImage():
+    def __init__(self, fn, strip_rows=STRIP_ROWS):
+        self.f = open(fn, 'rb')
+        magic, self.width, self.height = struct.unpack(HEADER_FORMAT, self.f.read(HEADER_SIZE))
+        if magic != MAGIC:
+            self.f.close()
+            raise ValueError('not an RLE image')
+        self.rows = array('I', [0] * (self.height + 1))
+        self.f.readinto(memoryview(self.rows)[:self.height * 4])
+        self.rows[self.height] = self.f.seek(0, 2)
+        self.strip_rows = strip_rows
+        # the largest encoded strip of this image, at most strip_rows x max_row_bytes()
+        largest = 0
+        for y in range(0, self.height, strip_rows):
+            n = self.rows[min(y + strip_rows, self.height)] - self.rows[y]
+            if n > largest:
+                largest = n
+        self.src = bytearray(largest)
+        self.src_mv = memoryview(self.src)
+        self.strip = bytearray(self.width * 2 * strip_rows)
+        self.strip_mv = memoryview(self.strip)
+        self.strip_y = self.height  # no strip decoded
+
+    # read and decode the strip starting at row y0
+    def load_strip(self, y0):
+        rows = self.rows
+        y1 = min(y0 + self.strip_rows, self.height)
+        start = rows[y0]
+        self.f.seek(start)
+        self.f.readinto(self.src_mv[:rows[y1] - start])
+        out = 0
+        for y in range(y0, y1):
+            out = decode_row(self.src, rows[y] - start, rows[y + 1] - start, self.strip, out, 0, self.width)
+        self.strip_y = y0
+
+    # pixels x to x + length of row y into dest (2 bytes per pixel).  Returns the bytes written
+    def read_row(self, y, x, length, dest):
+        if not self.strip_y <= y < self.strip_y + self.strip_rows:
+            self.load_strip(y - y % self.strip_rows)
+        i = ((y - self.strip_y) * self.width + x) * 2
+        n = length * 2
+        dest[:n] = self.strip_mv[i:i + n]
+        return n
+
+    def close(self):
+        self.f.close()
+
+def read_header(fn):
+    with open(fn, 'rb') as f:
+        magic, width, height = struct.unpack(HEADER_FORMAT, f.read(HEADER_SIZE))
+    if magic != MAGIC:
+        raise ValueError('not an RLE image')
+    return width, height
+
+#
+# LVGL integration
+#
+_open_images = {}
+_single = None  # the open image when there is only one, e.g. a splash screen
+
+# image source for lv.img.set_src():  the descriptor data holds MAGIC + the file name,
+# the pixels are read by the decoder
+def image_dsc(fn):
+    import lvgl as lv
+    width, height = read_header(fn)
+    data = MAGIC + fn.encode()
+    return lv.img_dsc_t({
+        'header':{
+            'always_zero': 0,
+            'w':width,
+            'h':height,
+            'cf':lv.img.CF.RAW
+        },
+        'data_size': len(data),
+        'data': data
+    })
+
+def _source_fn(lv, src):
+    if lv.img.src_get_type(src) != lv.img.SRC.VARIABLE:
+        return None
+    dsc = lv.img_dsc_t.cast(src)
+    data = bytes(dsc.data.__dereference__(dsc.data_size))
+    if data[:4] != MAGIC:
+        return None
+    return data[4:].decode()
+
+def register_decoder():
+    import lvgl as lv
+
+    def info_cb(decoder, src, header):
+        fn = _source_fn(lv, src)
+        if fn is None:
+            return lv.RES.INV
+        dsc = lv.img_dsc_t.cast(src)
+        header.always_zero = 0
+        header.w = dsc.header.w
+        header.h = dsc.header.h
+        header.cf = lv.img.CF.TRUE_COLOR
+        return lv.RES.OK
+
+    def open_cb(decoder, dsc):
+        fn = _source_fn(lv, dsc.src)
+        if fn is None:
+            return lv.RES.INV
+        global _single
+        if fn not in _open_images:
+            _open_images[fn] = RLEImage(fn)
+        _single = _open_images[fn] if len(_open_images) == 1 else None
+        # no image data:  LVGL calls read_line_cb for each row it draws
+        dsc.img_data = None
+        return lv.RES.OK
+
+    # once per row drawn:  with one image open, no lookup (_source_fn allocates)
+    def read_line_cb(decoder, dsc, x, y, length, buf):
+        image = _single
+        if image is None:
+            image = _open_images.get(_source_fn(lv, dsc.src))
+        if image is None:
+            return lv.RES.INV
+        image.read_row(y, x, length, buf.__dereference__(length * 2))
+        return lv.RES.OK
+
+    def close_cb(decoder, dsc):
+        global _single
+        image = _open_images.pop(_source_fn(lv, dsc.src), None)
+        if image is not None:
+            image.close()
+        _single = next(iter(_open_images.values())) if len(_open_images) == 1 else None
+
+    decoder = lv.img.decoder_create()
+    decoder.info_cb = info_cb
+    decoder.open_cb = open_cb
+    decoder.read_line_cb = read_line_cb
+    decoder.close_cb = close_cb
+    return decoder
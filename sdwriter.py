@@ -0,0 +1,162 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Buffered SD Card writer for the audio stream
+# - the capture loop calls write() with small blocks (e.g. 512 byte sectors).  write() only
+#   copies into one of several preallocated cluster-sized buffers and never touches the file
+# - full buffers are written to the file by the run_flush() coroutine, one buffer per file write
+# - every file write starts at a multiple of buffer_size in the file (the WAV header goes
+#   through write() too), so writes are cluster aligned when buffer_size is a multiple of
+#   the FAT cluster size
+# - if the block does not fit in the buffers not yet full, the whole block is dropped and
+#   counted.  The file then holds whole blocks only and stays on a sample boundary for any
+#   sample size (e.g. 3-byte samples, which do not divide buffer_size)
+#
+# - checkpoints:  set_checkpoint(nbytes, fn) calls fn(f, bytes written to the file) from the
+#   flush coroutine after every nbytes, e.g. to update a WAV header, then seeks back
+#
+# Note: a file write still blocks the event loop while it runs.  The gain is far fewer,
+# larger writes:  e.g. ~2.4 writes/s with 8 kB buffers instead of ~39 writes/s of 512 bytes
+# at 10 kS/s, 16-bit.  The worst stall is not shorter:  one slow write (a FAT update or wear
+# levelling on the card, ~120 ms in bench/bench_sdwriter.py) blocks the capture loop at any
+# buffer size, larger buffers only make it rarer.  The I2S DMA memory (~200 ms) absorbs it.
+#
+try:
+    import utime
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+    import time
+    class utime():
+        ticks_us = lambda: int(time.perf_counter() * 1000000)
+        ticks_diff = lambda a, b: a - b
+
+FLUSH_POLL_MS = 10
+
+class SDWriter():
+    # on_write:  optional function called with the time of every file write, in us
+    def __init__(self, f=None, buffer_size=8192, num_buffers=3, on_write=None):
+        self.buffer_size = buffer_size
+        self.on_write = on_write
+        self.num_buffers = num_buffers
+        self.buffers = [bytearray(buffer_size) for _ in range(num_buffers)]
+        self.mvs = [memoryview(b) for b in self.buffers]
+        self.closed = True
+        self.checkpoint_bytes = 0
+        self.on_checkpoint = None
+        self.reset_stats()
+        self.open(f)
+
+    def reset_stats(self):
+        self.write_count = 0
+        self.bytes_written = 0
+        self.max_write_us = 0
+        self.total_write_us = 0
+        self.dropped_blocks = 0
+
+    # start writing to a new file.  Pending buffers must be flushed first (see close())
+    def open(self, f):
+        self.f = f
+        self.fill = 0        # index of the buffer being filled
+        self.pos = 0         # fill position in that buffer
+        self.flush_next = 0  # index of the oldest full buffer
+        self.num_full = 0
+        self.closed = f is None
+        self.file_bytes = 0  # bytes written to the file
+        self.checkpoint_at = 0
+
+    # call fn(f, file bytes) every nbytes written to the file (0:  never)
+    def set_checkpoint(self, nbytes, fn):
+        self.checkpoint_bytes = nbytes
+        self.on_checkpoint = fn
+
+    # preallocate nbytes for the file, so FAT cluster chains are allocated up front.
+    # Only the chain is allocated:  FatFs does not clear the clusters, so the file reads
+    # back whatever they held (e.g. audio of deleted segments) up to nbytes until it is
+    # overwritten.  The file size is nbytes from now on, it does not show what was written
+    def preallocate(self, nbytes):
+        self.f.seek(nbytes - 1)
+        self.f.write(b'\x00')
+        self.f.seek(0)
+
+    # copy a block into the fill buffer.  Never blocks
+    # returns the number of bytes accepted (0 if the block was dropped)
+    def write(self, data):
+        n = len(data)
+        if n > (self.num_buffers - self.num_full) * self.buffer_size - self.pos:
+            # buffers waiting for the SD Card
+            self.dropped_blocks += 1
+            return 0
+        accepted = 0
+        while accepted < n:
+            take = min(n - accepted, self.buffer_size - self.pos)
+            if accepted == 0 and take == n:
+                self.mvs[self.fill][self.pos:self.pos + n] = data
+            else:
+                self.mvs[self.fill][self.pos:self.pos + take] = memoryview(data)[accepted:accepted + take]
+            self.pos += take
+            accepted += take
+            if self.pos == self.buffer_size:
+                self.num_full += 1
+                self.fill = (self.fill + 1) % self.num_buffers
+                self.pos = 0
+        return accepted
+
+    def _write_file(self, mv):
+        start = utime.ticks_us()
+        self.f.write(mv)
+        write_time = utime.ticks_diff(utime.ticks_us(), start)
+        self.write_count += 1
+        self.bytes_written += len(mv)
+        self.file_bytes += len(mv)
+        self.total_write_us += write_time
+        if write_time > self.max_write_us:
+            self.max_write_us = write_time
+        if self.on_write is not None:
+            self.on_write(write_time)
+
+    def _flush_one(self):
+        self._write_file(self.mvs[self.flush_next])
+        self.flush_next = (self.flush_next + 1) % self.num_buffers
+        self.num_full -= 1
+
+    def _checkpoint(self):
+        self.on_checkpoint(self.f, self.file_bytes)
+        self.f.seek(self.file_bytes)
+        self.checkpoint_at = self.file_bytes
+
+    # coroutine:  writes full buffers to the file as they become available
+    async def run_flush(self):
+        while True:
+            if self.num_full and not self.closed:
+                self._flush_one()
+                if self.checkpoint_bytes and self.file_bytes - self.checkpoint_at >= self.checkpoint_bytes:
+                    self._checkpoint()
+                await asyncio.sleep(0)
+            else:
+                await asyncio.sleep(FLUSH_POLL_MS / 1000)
+
+    # write all full buffers and the partly filled buffer to the file
+    def flush(self):
+        while self.num_full:
+            self._flush_one()
+        if self.pos:
+            self._write_file(self.mvs[self.fill][:self.pos])
+            self.pos = 0
+
+    def close(self):
+        self.flush()
+        self.closed = True
+        self.f = None
+
+    def stats(self):
+        return {'write_count': self.write_count,
+                'bytes_written': self.bytes_written,
+                'max_write_us': self.max_write_us,
+                'avg_write_us': self.total_write_us // self.write_count if self.write_count else 0,
+                'dropped_blocks': self.dropped_blocks}
@@ -11,12 +11,8 @@ import sys
 import esp
 import math
 import machine
-from machine import I2S
-from machine import I2C
+import micropython
 from machine import Pin
-from machine import UART
-from machine import SDCard
-from machine import ADC
 from machine import Timer
 from array import array
 import uos
@@ -29,17 +25,37 @@ import asyn
 import ms_timer
 import logging
 from ads1219 import ADS1219
-import lvgl as lv
-import ILI9341 as ili
-import lvesp32
+try:
+    import lvgl as lv
+    import ILI9341 as ili
+    import lvesp32
+except ImportError:
+    lv = None  # no display, e.g. running in the host simulator
 import pms5003
 import urtc
-import si7021
 import i2stools
+import hal
 import dba
-import wavheader
+import noisestats
+import measurements
+import bands
+import diag
+import trend
+from sdwriter import SDWriter
+from recorder import SegmentRecorder
+from adpcm import ADPCMEncoder
+import binlog
+import rleimage
+from measurements import MeasurementRepo
+from diag import Diagnostics
+from oversample import Oversampler
+from noisestats import NoiseStats
+from i2cbus import I2CBus, Clock
+from taskplan import Step, Plan
+from trend import Trend
+from outbox import Outbox
+from mqttpayload import GroupPayload, group_topic, feed_topic
 from collections import namedtuple
-#import fft
 #import ustruct
 
 ###################################
@@ -109,23 +125,75 @@ from collections import namedtuple
 #    35    Battery Voltage. Resistive divider on Lolin board: BAT-100k-Pin35-100k-GND
 #    39    USB Voltage. Resistive divider:  USB-68k-Pin39-100k-GND
 
+#    DS3231 Real Time Clock
+#    Pin   Function
+#    36    INT/SQW (alarm interrupt, external pull-up)
+
 #    UNUSED GPIO PINS
 #    5
-#    36
 
 LOGGING_INTERVAL_IN_SECS = 60*2
 
+# the DS3231 alarm starts each interval
+# RTC_ALARM_WAKE:  'interrupt' = the DS3231 INT output interrupts on GPIO 36, 
+#                  'poll' = the alarm flag is read over I2C every RTC_POLL_MS
+# with 'interrupt' the wait checks a flag in RAM every RTC_POLL_MS, and falls back to
+# reading the alarm flag over I2C if the interrupt has not come RTC_ALARM_GRACE_MS late
+RTC_ALARM_WAKE = 'interrupt'
+RTC_POLL_MS = 250
+RTC_ALARM_GRACE_MS = 2000
+# timestamps come from a clock that follows utime.ticks_ms() and is set from the DS3231 
+# every RTC_RESYNC_S seconds (0 = read the DS3231 for every interval and log record), see i2cbus.py
+RTC_RESYNC_S = 600
+# between intervals, with the microphone off and the display asleep, the ESP32 light sleeps
+# (at most LIGHT_SLEEP_MAX_MS at a time) until the DS3231 alarm or the screen button wakes it
+LIGHT_SLEEP = False
+LIGHT_SLEEP_MAX_MS = 10000
+
 # I2S Microphone related config
 # TODO:  refactor this section to improve reader comprehension
+MIC_ENABLED = True  # capture, dB(A) and recording
 SAMPLES_PER_SECOND = 10000
-RECORD_TIME_IN_SECONDS = 20
-NUM_BYTES_RX = 8
-NUM_BYTES_USED = 2  
+# MIC_BITS:  resolution kept from the 32-bit I2S slots for dB(A), band analysis and the WAV files
+#   16 = ~72 MB/hour, the top 16 bits:  reads ~2 dB high near 25 dB(A) (truncation floor)
+#   24 = ~108 MB/hour, all of the INMP441's 24-bit data
+#   32 = ~144 MB/hour, the 24 bits in 32-bit words (lowest byte 0), for tools without 24-bit support
+# 24 and 32 need firmware whose dba and i2stools modules have B24 / B32 (checked at startup)
+# 'adpcm' recording needs 16.  CPU per block and SD Card bandwidth:  bench/bench_capture.py
+MIC_BITS = 16
+NUM_BYTES_RX = 8  # stereo frame of two 32-bit slots
+NUM_BYTES_USED = MIC_BITS // 8
 BITS_PER_SAMPLE = NUM_BYTES_USED * 8
-NUM_BYTES_IN_SDCARD_SECTOR = 512
-NUM_BYTES_IN_SAMPLE_BLOCK = NUM_BYTES_IN_SDCARD_SECTOR * (NUM_BYTES_RX // NUM_BYTES_USED)
-NUM_SAMPLE_BYTES_IN_WAV = (RECORD_TIME_IN_SECONDS * SAMPLES_PER_SECOND * NUM_BYTES_USED)
-NUM_SAMPLE_BYTES_TO_RX = ((RECORD_TIME_IN_SECONDS * SAMPLES_PER_SECOND * NUM_BYTES_RX))
+NUM_FRAMES_IN_BLOCK = 256
+NUM_BYTES_IN_SAMPLE_BLOCK = NUM_FRAMES_IN_BLOCK * NUM_BYTES_RX
+NUM_BYTES_IN_MIC_BLOCK = NUM_FRAMES_IN_BLOCK * NUM_BYTES_USED
+
+# continuous recording to a sequence of WAV files (segments) on the SD Card
+MIC_SEGMENT_TIME_IN_SECONDS = 60*10
+MIC_DISK_CAP_BYTES = 2 * 1024 * 1024 * 1024  # oldest segments are deleted above this
+# 'pcm' = MIC_BITS PCM, 'adpcm' = 4-bit IMA ADPCM (~18 MB/hour, MIC_BITS = 16 only)
+MIC_AUDIO_FORMAT = 'pcm'
+ADPCM_BLOCK_ALIGN = 256
+
+# noise statistics (see noisestats.py):  dB(A) levels of NOISE_BLOCK_MS blocks feed the 
+# interval's Leq, fast / slow weighted maxima and L10 / L50 / L90.  The noise reading 
+# shown and kept in the history ('dba') is the slow weighted level, once a second
+NOISE_BLOCK_MS = 125
+
+# spectrum analysis of the microphone stream
+# BAND_ANALYSIS:  0 = off, bands.OCTAVE, bands.THIRD_OCTAVE
+# BAND_STRIDE:  analyze 1 of every BAND_STRIDE runs of blocks, to bound CPU time (see bench/bench_bands.py)
+BAND_ANALYSIS = bands.OCTAVE
+BAND_STRIDE = 4
+
+# audio samples are collected in cluster-sized buffers and written to the SD Card 
+# by a separate coroutine:  ~2.4 writes/s instead of ~39.  A slow write still blocks the
+# capture loop for its duration, at any buffer size (see sdwriter.py, bench/bench_sdwriter.py)
+SD_WRITE_BUFFER_SIZE = 8192
+SD_WRITE_NUM_BUFFERS = 3
+# allocate each WAV segment's clusters before recording.  The WAV header is then updated 
+# every 64 kB (~3 s at 16-bit), so a segment cut by a reset keeps only audio (recorder.py)
+SD_PREALLOCATE = True
 
 DEMO_MODE = 1
 NORMAL_MODE = 2
@@ -135,6 +203,104 @@ modes = {DEMO_MODE:Mode(aq='continuous', display='always_on', logging=0, mqtt=0)
 
 PM_POLLING_DELAY_MS = 500
 
+# a si7021 reading is reused for TH_MAX_AGE_MS (0 = read the sensor every time)
+TH_MAX_AGE_MS = 10000
+
+# Spec Sensor gas acquisition (ADS1219), 100 samples at 20 SPS (~5 s) per read
+# 'differential':  one differential read per gas (gas - reference), the reference voltages 
+#                  are read every GAS_VREF_EVERY intervals, for diagnostics
+# 'single_ended':  gas and reference voltages read separately, subtracted in software
+GAS_ACQUISITION = 'differential'
+GAS_VREF_EVERY = 30
+# adaptive oversampling (see oversample.py):  a read stops when the standard error of the mean 
+# is below GAS_TARGET_SE_MV, after GAS_MIN_SAMPLES to SpecSensors.SAMPLES_TO_CAPTURE samples.
+# The result is a trimmed mean, GAS_TRIM = fraction dropped at each end (0.5 = median)
+GAS_MIN_SAMPLES = 20
+GAS_TARGET_SE_MV = 0.005
+GAS_TRIM = 0.1
+
+# work done at each DS3231 alarm (see taskplan.py):  (step, steps it waits for, power domains)
+# 'parallel':  a step starts as soon as the steps it waits for are done, unless a running step 
+#              holds a conflicting power domain.  'sequential':  one step at a time, in table order
+# 'publish' sends the previous interval's messages, overlapping the PMS5003 warm-up.  The 
+# MQTT steps are left out when the operating mode has no MQTT
+INTERVAL_PLAN = 'parallel'
+INTERVAL_STEPS = (('publish', (), ('wifi',)),
+                  ('pm', (), ('pm',)),
+                  ('gas', (), ('gas',)),
+                  ('th', (), ()),
+                  ('log', ('pm', 'gas', 'th'), ()),
+                  ('queue', ('log', 'publish'), ()))
+# the PMS5003 is powered off while the Spec Sensors are read.  Add ('wifi', 'gas') if the 
+# radio disturbs the gas readings
+POWER_CONFLICTS = (('pm', 'gas'),)
+
+# measurement log on the SD Card
+# LOG_FORMAT:  'csv' = text, 'bin' = compact binary records (see binlog.py, convert with host/logconv.py)
+LOG_FORMAT = 'csv'
+# columns after utc:  (name, channel, statistic, decimal places in CSV)
+LOG_FIELDS = (('pm25', measurements.PM25, 'current', 0),
+              ('o3', measurements.O3, 'current', 2),
+              ('o3_vgas', measurements.O3_VGAS, 'current', 2),
+              ('o3_vref', measurements.O3_VREF, 'current', 2),
+              ('no2', measurements.NO2, 'current', 2),
+              ('no2_vgas', measurements.NO2_VGAS, 'current', 2),
+              ('no2_vref', measurements.NO2_VREF, 'current', 2),
+              ('tdegc', measurements.TDEGC, 'current', 1),
+              ('rh', measurements.RH, 'current', 1),
+              ('laeq', measurements.LAEQ, 'current', 1),
+              ('lafmax', measurements.LAFMAX, 'current', 1),
+              ('la10', measurements.LA10, 'current', 1),
+              ('la50', measurements.LA50, 'current', 1),
+              ('la90', measurements.LA90, 'current', 1),
+              ('vusb_avg', measurements.VUSB, 'avg', 2),
+              ('vusb_min', measurements.VUSB, 'min', 2),
+              ('vbat_avg', measurements.VBAT, 'avg', 2),
+              ('vbat_min', measurements.VBAT, 'min', 2))
+# records are kept in RAM and written to the log file with one write when 
+# LOG_FLUSH_RECORDS records are buffered, the oldest record is LOG_FLUSH_AGE_IN_SECS old, 
+# on a USB power loss or low battery, and at the daily file rollover
+LOG_FLUSH_RECORDS = 15
+LOG_FLUSH_AGE_IN_SECS = 60*30
+LOG_BUFFER_BYTES = 4096
+
+# measurements are published as one Adafruit IO group feed message per interval (see mqttpayload.py)
+# feeds:  (feed key, channel, statistic, decimal places)
+MQTT_USER = 'MikeTeachman'
+MQTT_GROUP = 'streetsense'
+MQTT_FIELDS = (('pm25', measurements.PM25, 'current', 0),
+               ('o3', measurements.O3, 'current', 2),
+               ('no2', measurements.NO2, 'current', 2),
+               ('tdegc', measurements.TDEGC, 'current', 2),
+               ('humidity', measurements.RH, 'current', 1),
+               ('laeq', measurements.LAEQ, 'current', 1),
+               ('lafmax', measurements.LAFMAX, 'current', 1),
+               ('la10', measurements.LA10, 'current', 1),
+               ('la50', measurements.LA50, 'current', 1),
+               ('la90', measurements.LA90, 'current', 1),
+               ('vbat_avg', measurements.VBAT, 'avg', 2),
+               ('vbat_min', measurements.VBAT, 'min', 2))
+
+# MQTT messages are queued in an outbox on the SD Card and published with QoS 1, so 
+# readings taken while the WiFi or broker is down are sent later (oldest first)
+MQTT_OUTBOX_FILE = 'outbox.dat'  # on the SD Card
+MQTT_OUTBOX_CHECKPOINT_FILE = 'outbox.ckp'
+MQTT_OUTBOX_MAX_BYTES = 1024*1024  # oldest messages are dropped above this
+MQTT_OUTBOX_COMPACT_BYTES = 256*1024  # sent or dropped bytes before the file is compacted
+MQTT_DRAIN_BATCH = 10  # messages between checkpoints
+MQTT_DRAIN_PACING_MS = 200  # pause between batches (broker rate limit)
+MQTT_DRAIN_MAX_BATCHES = 30  # bounds the time the WiFi radio is on per interval
+MQTT_PUBLISH_TIMEOUT_IN_SECS = 10
+
+# diagnostics (see diag.py):  coroutine run time, event loop lag, sensor acquisition and 
+# SD Card / MQTT latency histograms.  Every interval a summary is appended to DIAG_LOG_FILE 
+# and published to MQTT_DIAG_FEED.  A long press of the screen button switches them on/off.
+# A DIAG_LOG_FILE with other columns (e.g. probes added by an update) is renamed to 
+# diag-<utc>.csv and a new one started
+DIAG_ENABLED = True
+DIAG_LOG_FILE = 'diag.csv'  # on the SD Card
+MQTT_DIAG_FEED = 'streetsense-diag'
+
 # convert a timestamp (in seconds) from MicroPython epoch to Unix epoch
 # from uPy docs:  "However, embedded ports use epoch of 2000-01-01 00:00:00 UTC"
 # Unix time epoch is 1970-01-01 00:00:00 UTC
@@ -146,50 +312,6 @@ def epoch_time_upy_to_unix(upy_time):
 def gmt_to_pst(gmt_time):
     return gmt_time - (3600 * 8)
 
-#
-# Measurement Repository
-# - stores current value of measurements
-# - calculates stats: min, max, sum, avg, count
-#
-class MeasurementRepo():
-    Measurement = namedtuple('Measurement', 'current min max sum avg count')
-    
-    def __init__(self):
-        log.info('REPO:init')
-        self.measurement_repo = {}
-
-    def add(self, measurement, value):
-        log.debug('REPO:add')
-        if not measurement in self.measurement_repo:
-            self.measurement_repo[measurement] = MeasurementRepo.Measurement(current=None, min=None, max=None, sum=0, avg=0, count=0)
-    
-        min =  self.measurement_repo[measurement].min
-        if min is None or value < min:
-            min = value
-            
-        max =  self.measurement_repo[measurement].max  
-        if max is None or value > max:
-            max = value
-            
-        sum = self.measurement_repo[measurement].sum + value
-        count = self.measurement_repo[measurement].count + 1
-        avg = sum / count
-            
-        self.measurement_repo[measurement] = MeasurementRepo.Measurement(current=value, min=min, max=max, sum=sum, avg=avg, count=count)
-            
-    def get(self, measurement):
-        log.debug('REPO:get')
-        if measurement in self.measurement_repo:
-            return self.measurement_repo[measurement]
-        else:
-            return MeasurementRepo.Measurement(current=0, min=0, max=0, sum=0, avg=0, count=0)  
-        
-    def clear_stats(self, measurement):    
-        log.debug('REPO:clear')
-        if measurement in self.measurement_repo:
-            value =  self.measurement_repo[measurement].current
-        self.measurement_repo[measurement] = MeasurementRepo.Measurement(current=value, min=None, max=None, sum=0, avg=0, count=0)
-
 # TODO pass in ADC object
 class SpecSensors():
     SAMPLES_TO_CAPTURE = 100
@@ -198,82 +320,147 @@ class SpecSensors():
                           
     def __init__(self):
         log.info('SPEC:init')
-        self.sample_count = 0
-        self.sample_sum = 2**32-1   # allocate 4 byte sample to be used in ISR  TODO needed?
+        self.reads = 0
+        self.oversampler = Oversampler(max_samples=self.SAMPLES_TO_CAPTURE,
+                                       min_samples=GAS_MIN_SAMPLES,
+                                       target_se=GAS_TARGET_SE_MV * ADS1219.POSITIVE_CODE_RANGE / ADS1219.VREF_INTERNAL_MV,
+                                       trim=GAS_TRIM)
 
         adc.set_channel(ADS1219.CHANNEL_AIN0)
         adc.set_conversion_mode(ADS1219.CM_SINGLE)
         adc.set_gain(ADS1219.GAIN_1X)
         adc.set_data_rate(ADS1219.DR_20_SPS)
         adc.set_vref(ADS1219.VREF_INTERNAL)
-        self.drdy_pin = Pin(34, mode=Pin.IN)        
-        
-    def callback(self, arg):
-        if self.sample_count < self.SAMPLES_TO_CAPTURE:
-            self.sample_sum += adc.read_data_irq()
-            self.sample_count += 1
+        self.drdy_pin = hal.gas_adc_drdy_pin()
+        self.drdy_us = 0
+        self.drdy_max_us = 0
+        self.read_code_ref = self.read_code  # allocated once:  the hard interrupt handler cannot allocate a bound method
+        # set while a capture holds the bus:  read_code() calls scheduled before the DRDY
+        # interrupt was disabled can still run after read() released the bus
+        self.capturing = False
+        
+    # DRDY interrupt (hard):  note the time of the edge.  The I2C read runs once the 
+    # handler returns.  If the schedule queue is full the conversion is lost
+    def callback(self, pin):
+        self.drdy_us = utime.ticks_us()
+        try:
+            micropython.schedule(self.read_code_ref, 0)
+        except RuntimeError:
+            pass
+        
+    # raw code into the oversampler ring.  The latency from the DRDY edge is what the 
+    # rest of the application costs the ADC:  above one conversion period a result is lost
+    def read_code(self, arg):
+        if not self.capturing:
+            return
+        self.oversampler.add(adc.read_data_irq())
+        latency_us = utime.ticks_diff(utime.ticks_us(), self.drdy_us)
+        if latency_us > self.drdy_max_us:
+            self.drdy_max_us = latency_us
+        diagnostics.record(diag.I2C_DRDY, latency_us)
         
     async def read(self, adc_channel):
         log.info('SPEC:read adc_channel= %d', adc_channel)
-        self.sample_sum= 0 
-        self.sample_count = 0     
-        adc.set_channel(adc_channel)
-        adc.set_conversion_mode(ADS1219.CM_CONTINUOUS)
-        adc.set_gain(ADS1219.GAIN_1X)
-        adc.set_data_rate(ADS1219.DR_20_SPS)
-        adc.set_vref(ADS1219.VREF_INTERNAL)
-        adc.start_sync() # starts continuous sampling
-        start_capture = utime.ticks_ms()
-        # enable interrupts
-        self.drdy_pin.irq(trigger=Pin.IRQ_FALLING, handler=self.callback)
-        
-        while self.sample_count < self.SAMPLES_TO_CAPTURE:
-            await asyncio.sleep_ms(10)
-
-        # disable the interrupt by setting handler = None
-        self.drdy_pin.irq(handler = None)
-        log.debug('SPEC:done.  conversion time = %d', utime.ticks_diff(utime.ticks_ms(), start_capture))
-        adc.set_conversion_mode(ADS1219.CM_SINGLE)
-        
-        avg_mv = self.sample_sum * ADS1219.VREF_INTERNAL_MV / ADS1219.POSITIVE_CODE_RANGE / self.sample_count
+        # the capture holds the bus:  other devices wait, the DRDY reads do not
+        async with bus:
+            oversampler = self.oversampler
+            oversampler.reset()
+            adc.set_channel(adc_channel)
+            adc.set_conversion_mode(ADS1219.CM_CONTINUOUS)
+            adc.set_gain(ADS1219.GAIN_1X)
+            adc.set_data_rate(ADS1219.DR_20_SPS)
+            adc.set_vref(ADS1219.VREF_INTERNAL)
+            adc.start_sync() # starts continuous sampling
+            start_capture = utime.ticks_ms()
+            start_us = utime.ticks_us()
+            # enable interrupts
+            self.capturing = True
+            self.drdy_pin.irq(trigger=Pin.IRQ_FALLING, handler=self.callback, hard=True)
+            
+            while not oversampler.update():
+                await asyncio.sleep_ms(10)
+    
+            # disable the interrupt by setting handler = None
+            self.drdy_pin.irq(handler = None)
+            self.capturing = False
+            diagnostics.done(diag.ACQ_GAS, start_us)
+            log.debug('SPEC:done.  conversion time = %d, samples = %d', 
+                      utime.ticks_diff(utime.ticks_ms(), start_capture), oversampler.captured())
+            adc.set_conversion_mode(ADS1219.CM_SINGLE)
+        
+        avg_mv = oversampler.estimate() * ADS1219.VREF_INTERNAL_MV / ADS1219.POSITIVE_CODE_RANGE
         log.debug('SPEC:avg_mv = %d', avg_mv)
         
         return avg_mv
     
     async def read_all(self):
+        if GAS_ACQUISITION == 'differential':
+            await self.read_differential()
+        else:
+            await self.read_single_ended()
+        self.reads += 1
+        
+    async def read_single_ended(self):
         # read Ozone gas voltage
-        repo.add('o3_vgas', await self.read(ADS1219.CHANNEL_AIN1))        
+        repo.add(measurements.O3_VGAS, await self.read(ADS1219.CHANNEL_AIN1))        
         # read Ozone reference voltage
-        repo.add('o3_vref', await self.read(ADS1219.CHANNEL_AIN0))       
+        repo.add(measurements.O3_VREF, await self.read(ADS1219.CHANNEL_AIN0))       
         # read NO2 gas voltage
-        repo.add('no2_vgas', await self.read(ADS1219.CHANNEL_AIN2))        
+        repo.add(measurements.NO2_VGAS, await self.read(ADS1219.CHANNEL_AIN2))        
         # read NO2 reference voltage
-        repo.add('no2_vref', await self.read(ADS1219.CHANNEL_AIN3))      
+        repo.add(measurements.NO2_VREF, await self.read(ADS1219.CHANNEL_AIN3))      
         
         # calculate gas concentration in parts-per-billion (ppb)
-        # TODO investigate differential ADC calc
         # TODO calibrate Spec Sensors, with offset
-        ozone_ppb = (repo.get('o3_vgas').current - repo.get('o3_vref').current) / self.CALIBRATION_FACTOR_OZONE
-        repo.add('o3', ozone_ppb)
-        no2_ppb = (repo.get('no2_vgas').current - repo.get('no2_vref').current) / self.CALIBRATION_FACTOR_NO2
-        repo.add('no2', no2_ppb)
+        self.add_gases(repo.get('o3_vgas').current - repo.get('o3_vref').current,
+                       repo.get('no2_vgas').current - repo.get('no2_vref').current)
+        
+    # the ADC subtracts the reference:  one read per gas, half the conversions.  
+    # The reference voltages change slowly and are read every GAS_VREF_EVERY intervals, 
+    # the gas voltages logged are the last reference plus the differential reading
+    async def read_differential(self):
+        # Ozone:  AIN1 (gas) - AIN0 (reference), the mux measures AIN0 - AIN1
+        o3_mv = -(await self.read(ADS1219.CHANNEL_AIN0_AIN1))
+        # NO2:  AIN2 (gas) - AIN3 (reference)
+        no2_mv = await self.read(ADS1219.CHANNEL_AIN2_AIN3)
+        if self.reads % GAS_VREF_EVERY == 0:
+            repo.add(measurements.O3_VREF, await self.read(ADS1219.CHANNEL_AIN0))
+            repo.add(measurements.NO2_VREF, await self.read(ADS1219.CHANNEL_AIN3))
+        repo.add(measurements.O3_VGAS, repo.current[measurements.O3_VREF] + o3_mv)
+        repo.add(measurements.NO2_VGAS, repo.current[measurements.NO2_VREF] + no2_mv)
+        self.add_gases(o3_mv, no2_mv)
+        
+    # o3_mv, no2_mv:  gas - reference voltage
+    def add_gases(self, o3_mv, no2_mv):
+        repo.add(measurements.O3, o3_mv / self.CALIBRATION_FACTOR_OZONE)
+        repo.add(measurements.NO2, no2_mv / self.CALIBRATION_FACTOR_NO2)
 
 # TODO does this class make sense anymore ?        
 class THSensor():
     def __init__(self):
         log.info('TH:init')
+        self.read_ms = None
         loop = asyncio.get_event_loop()
-        loop.create_task(self.run_th_continuous())
+        loop.create_task(diagnostics.timed(diag.TASK_TH, self.run_th_continuous()))
         
     async def run_th_continuous(self):
         while True:
-            repo.add('tdegc', temp_humid_sensor.temperature)
-            repo.add('rh', temp_humid_sensor.relative_humidity)
+            await self.read()
             await asyncio.sleep(1)
 
+    # the si7021 is read if the last reading is older than TH_MAX_AGE_MS
     async def read(self):
-        repo.add('tdegc', temp_humid_sensor.temperature)
-        repo.add('rh', temp_humid_sensor.relative_humidity)
+        now_ms = utime.ticks_ms()
+        if self.read_ms is not None and utime.ticks_diff(now_ms, self.read_ms) < TH_MAX_AGE_MS:
+            return
+        start_us = utime.ticks_us()
+        async with bus:
+            temperature = temp_humid_sensor.temperature
+            relative_humidity = temp_humid_sensor.relative_humidity
+        self.read_ms = utime.ticks_ms()
+        repo.add(measurements.TDEGC, temperature)
+        repo.add(measurements.RH, relative_humidity)
+        diagnostics.done(diag.ACQ_TH, start_us)
 
 class ParticulateSensor():
     def __init__(self, 
@@ -284,10 +471,10 @@ class ParticulateSensor():
         self.event_new_pm_data = event_new_pm_data
         self.uart = None
         self.pm = None
-        self.pm_pwr_pin = Pin(25, Pin.OUT)
+        self.pm_pwr_pin = hal.pm_power_pin()
         if modes[operating_mode].aq == 'continuous':
             loop = asyncio.get_event_loop()
-            loop.create_task(self.run_pm_continuous())
+            loop.create_task(diagnostics.timed(diag.TASK_PM, self.run_pm_continuous()))
         else:
             self.pm_pwr_pin.value(0)
         
@@ -295,24 +482,25 @@ class ParticulateSensor():
         log.info('PM:30s warm-up')
         self.pm_pwr_pin.value(1)
         await asyncio.sleep(30) # 30s warm-up period as specified in datasheet
-        self.uart = UART(1, tx=32, rx=33, baudrate=9600)
+        self.uart = hal.pm_uart()
         self.pm = pms5003.PMS5003(self.uart, self.lock, event = self.event_new_pm_data)
         await asyncio.sleep(1)
         log.debug('PM:set Passive mode')
         await self.pm.setPassiveMode()
         log.debug('PM:trigger read sensor')
         await asyncio.sleep(1)
+        start_us = utime.ticks_us()
         await self.pm.read()
         log.debug('PM:waiting for event')
         await self.event_new_pm_data
+        diagnostics.done(diag.ACQ_PM, start_us)
         log.debug('PM:got event')
-        repo.add('pm10', self.pm.pm10_env)
-        repo.add('pm25', self.pm.pm25_env)
-        repo.add('pm100', self.pm.pm100_env)
-        log.info('PM:PM2.5 = %d', repo.get('pm25').current)
+        repo.add(measurements.PM10, self.pm.pm10_env)
+        repo.add(measurements.PM25, self.pm.pm25_env)
+        repo.add(measurements.PM100, self.pm.pm100_env)
+        log.info('PM:PM2.5 = %d', self.pm.pm25_env)
         self.event_new_pm_data.clear() 
-        Pin(32, Pin.IN, Pin.PULL_DOWN)
-        Pin(33, Pin.IN, Pin.PULL_DOWN)
+        hal.pm_uart_release()
         log.info('PM:power-down')
         self.pm_pwr_pin.value(0)
         
@@ -320,7 +508,7 @@ class ParticulateSensor():
         log.info('PM:30s warm-up')
         self.pm_pwr_pin.value(1)
         await asyncio.sleep(30) # 30s warm-up period as specified in datasheet
-        self.uart = UART(1, tx=32, rx=33, baudrate=9600)
+        self.uart = hal.pm_uart()
         self.pm = pms5003.PMS5003(self.uart, self.lock, event = self.event_new_pm_data)
         while True:
             await asyncio.sleep(1)
@@ -328,14 +516,16 @@ class ParticulateSensor():
             await self.pm.setPassiveMode()
             log.debug('PM:trigger read sensor')
             await asyncio.sleep(1)
+            start_us = utime.ticks_us()
             await self.pm.read()
             log.debug('PM:waiting for event')
             await self.event_new_pm_data
+            diagnostics.done(diag.ACQ_PM, start_us)
             log.debug('PM:got event')
-            repo.add('pm10', self.pm.pm10_env)
-            repo.add('pm25', self.pm.pm25_env)
-            repo.add('pm100', self.pm.pm100_env)
-            log.debug('PM:PM2.5 = %d', repo.get('pm25').current)
+            repo.add(measurements.PM10, self.pm.pm10_env)
+            repo.add(measurements.PM25, self.pm.pm25_env)
+            repo.add(measurements.PM100, self.pm.pm100_env)
+            log.debug('PM:PM2.5 = %d', self.pm.pm25_env)
             self.event_new_pm_data.clear() 
             await asyncio.sleep(0)
     '''    
@@ -344,17 +534,27 @@ class ParticulateSensor():
         return self.pm.pm25_env
     '''
 class IntervalTimer():
-    def __init__(self, event_mqtt_publish):  
+    def __init__(self):  
         log.info('TMR:init')
-        self.event_mqtt_publish = event_mqtt_publish
+        self.plan = None
+        self.event_alarm = asyn.Event(RTC_POLL_MS)
+        self.i2c_transactions = i2c.transactions
         loop = asyncio.get_event_loop()
-        loop.create_task(self.run_timer()) 
+        loop.create_task(diagnostics.timed(diag.TASK_TIMER, self.run_timer()))
     
     async def run_timer(self):
         global timestamp_unix  # TODO fix this when interval timer becomes a class
-        ds3231.alarm(False, alarm=0)  # TODO fix this coupling
+        async with bus:
+            ds3231.alarm(False, alarm=0)  # TODO fix this coupling
+            if RTC_ALARM_WAKE == 'interrupt':
+                ds3231.interrupt(alarm=0)
+        if RTC_ALARM_WAKE == 'interrupt':
+            self.alarm_pin = hal.rtc_int_pin()
+            self.alarm_pin.irq(trigger=Pin.IRQ_FALLING, handler=self.alarm_callback)
         while True:
-            time_now = urtc.tuple2seconds(ds3231.datetime())
+            self.event_alarm.clear()
+            await clock.update()
+            time_now = clock.seconds()
             
             # calculate the next alarm time, aligned to the desired interval
             # e.g.  interval=15mins ==>  align to 00, 15, 30, 45 mins
@@ -366,54 +566,166 @@ class IntervalTimer():
             wake_time_tuple = urtc.seconds2tuple(int(wake_time))
             wake_time_list = list(wake_time_tuple)
             wake_time_list[3]=None  
-            ds3231.alarm_time(wake_time_list, alarm=0)  # TODO fix coupling   
+            async with bus:
+                ds3231.alarm_time(wake_time_list, alarm=0)  # TODO fix coupling   
             log.info('TMR:next sensor read at %s', wake_time_list)
             log.info('TMR:waiting for DS3231 alarm')
-            # loop until the DS3231 alarm is detected 
-            while ds3231.alarm(alarm=0) == False:
-                await asyncio.sleep_ms(250)
+            if RTC_ALARM_WAKE == 'interrupt':
+                await self.wait_alarm_interrupt(int(wake_time - time_now + 5))
+            else:
+                # loop until the DS3231 alarm is detected 
+                while True:
+                    async with bus:
+                        alarm = ds3231.alarm(alarm=0)
+                    if alarm:
+                        break
+                    await asyncio.sleep_ms(RTC_POLL_MS)
 
-            timestamp_unix = epoch_time_upy_to_unix(urtc.tuple2seconds(ds3231.datetime()))
+            # the alarm matched the DS3231 at wake_time
+            timestamp_unix = epoch_time_upy_to_unix(wake_time)
             # clear alarm    
-            ds3231.alarm(False, alarm=0)
+            async with bus:
+                ds3231.alarm(False, alarm=0)
             log.info('TMR:DS3231 alarm -> read all sensors')
-            # dispatch a whole pile of activity
-            # following sequence is deliberately sequential so PM2.5 sensor is powered off when
-            # the Spec Sensor devices are being read
-            await ps.read_pm()
-            await spec_sensors.read_all()
-            await temp_hum.read()
-            await sdcard_logger.run_logger()
-            if modes[operating_mode].mqtt == 1:
-                self.event_mqtt_publish.set()
+            if self.plan is None:
+                self.plan = self.create_plan()
+            await self.plan.run()
+            log.info('TMR:plan %d ms:  %s', self.plan.wall_ms, self.plan.timing())
             mem_free_before_gc = gc.mem_free()
             log.debug('TMR:gc mem_free = %d bytes', mem_free_before_gc)
             gc.collect()
             log.debug('TMR:gc freed %d bytes', gc.mem_free() - mem_free_before_gc)
+            log.debug('TMR:i2c transactions = %d, longest bus wait = %d us, DRDY latency = %d us', 
+                      i2c.transactions - self.i2c_transactions, bus.wait_max_us, spec_sensors.drdy_max_us)
+            self.i2c_transactions = i2c.transactions
+            
+    # the interval's steps, from INTERVAL_STEPS.  Created on the first alarm, when the 
+    # sensor, logger and MQTT objects exist
+    def create_plan(self):
+        funcs = {'pm': ps.read_pm,
+                 'gas': spec_sensors.read_all,
+                 'th': temp_hum.read,
+                 'log': self.log_interval}
+        if modes[operating_mode].mqtt == 1:
+            funcs['publish'] = mqtt.send
+            funcs['queue'] = mqtt.queue
+        steps = [Step(name, funcs[name], tuple(a for a in after if a in funcs), domains)
+                 for name, after, domains in INTERVAL_STEPS if name in funcs]
+        return Plan(steps, POWER_CONFLICTS, serial=INTERVAL_PLAN == 'sequential')
+        
+    async def log_interval(self):
+        if MIC_ENABLED:
+            mic.report_noise()
+        await sdcard_logger.run_logger()
+        if diagnostics.enabled:
+            diagnostics.report()
+            sdcard_logger.log_diagnostics()
+            
+    # DS3231 INT falling edge
+    def alarm_callback(self, pin):
+        self.event_alarm.set()
+        
+    # wait for the alarm interrupt, due in seconds.  In light sleep the edge can be missed:  
+    # the wake reason sets the event instead
+    async def wait_alarm_interrupt(self, seconds):
+        deadline = utime.ticks_add(utime.ticks_ms(), seconds * 1000)
+        while not self.event_alarm.is_set():
+            remaining = utime.ticks_diff(deadline, utime.ticks_ms())
+            if remaining < -RTC_ALARM_GRACE_MS:
+                async with bus:
+                    alarm = ds3231.alarm(alarm=0)
+                if alarm:
+                    log.warning('TMR:DS3231 alarm interrupt missed')
+                    break
+            elif LIGHT_SLEEP and remaining > 0 and self.light_sleep_allowed():
+                if hal.light_sleep(min(remaining, LIGHT_SLEEP_MAX_MS)) == hal.WAKE_RTC_ALARM:
+                    self.event_alarm.set()
+                    break
+            await asyncio.sleep_ms(RTC_POLL_MS)
+            
+    # nothing else needs the CPU between intervals
+    def light_sleep_allowed(self):
+        return not MIC_ENABLED and (display is None or display.asleep())
+            
 
 class Display():
     SCREEN_TIMEOUT_IN_S = 60*5
     SCREEN_REFRESH_IN_S = 1
+    ROW_HEIGHT = 32
+    CELL_PAD = 10
+    # (name, channel, value format, unit)
+    MEASUREMENT_ROWS = (('Noise', measurements.DBA, '{:.1f}', 'dB(A)'),
+                        ('PM1.0', measurements.PM10, '{:.0f}', 'ug/m3'),
+                        ('PM2.5', measurements.PM25, '{:.0f}', 'ug/m3'),
+                        ('PM10.0', measurements.PM100, '{:.0f}', 'ug/m3'),
+                        ('NO2', measurements.NO2, '{:.1f}', 'ppb'),
+                        ('O3', measurements.O3, '{:.1f}', 'ppb'))
+    DIAG_ROW_HEIGHT = 13  # header + one row per probe in 240 px
+    DIAG_COLUMNS = (10, 110, 180, 250)  # x of probe name, p50, p95, max
+    ENVIRONMENTAL_ROWS = (('Temp', measurements.TDEGC, '{:.1f}', 'degC'),
+                          ('Humidity', measurements.RH, '{:.1f}', '%'))
+    VOLTAGE_ROWS = (('Vbat', measurements.VBAT, '{:.2f}', 'V'),
+                    ('Vusb', measurements.VUSB, '{:.2f}', 'V'))
+    # (file, x position), shown in order at start-up
+    WELCOME_IMAGES = (('street_sense_b_rgb565.rle', 0),
+                      ('gvcc_240x240_b_rgb565.rle', 40),  # center image by moving over 40px
+                      ('placemaking_320x96_b_rgb565.rle', 0))
+    # trend chart:  the last TREND_MINUTES, one sample every TREND_PERIOD_S (see trend.py)
+    # (name, channel, chart bottom, chart top, color)
+    TREND_SERIES = (('dB(A)', measurements.DBA, 30, 110, 0xFF0000),
+                    ('PM2.5', measurements.PM25, 0, 100, 0x0000FF),
+                    ('NO2', measurements.NO2, 0, 100, 0xFF8000),
+                    ('O3', measurements.O3, 0, 100, 0x008000))
+    TREND_MINUTES = 30
+    TREND_PERIOD_S = 10
+    TREND_CHART_HEIGHT = 200
+    # (background, text) colors for dBA below 70, below 85, and above
+    DECIBEL_COLORS = ((0x00FF00, 0x000000),  # green, black
+                      (0xFFFF00, 0x000000),  # yellow, black
+                      (0xFF0000, 0xFFFFFF))  # red, white
     
     def __init__(self):
         log.info('DISP:init')
         self.screens = [self.show_measurement_screen, 
                         self.show_decibel_screen, 
+                        self.show_trend_screen,
                         self.show_environmental_screen,                        
                         self.show_voltage_monitor_screen,
+                        self.show_diagnostics_screen,
                         self.show_display_sleep_screen]
-        pin_screen = Pin(0, Pin.IN, Pin.PULL_UP)
+        pin_screen = hal.screen_button_pin()
         pb_screen = Pushbutton(pin_screen)
         pb_screen.press_func(self.next_screen)
+        pb_screen.long_func(self.toggle_diagnostics)
         self.active_screen = 1  # TODO make some sort of datastructure for screens + screen ids
         self.next_screen = 0 # show the measurement screen first TODO this is a clunky way to show this after measurement screen
         self.diag_count = 0
         self.screen_timeout = False
         self.timeout_timer = Timer(-1)
-        self.backlight_ctrl = Pin(2, Pin.OUT)
+        self.backlight_ctrl = hal.backlight_pin()
         self.backlight_ctrl.value(0)
+        self.measurement_screen = None
+        self.environmental_screen = None
+        self.voltage_screen = None
+        self.decibel_screen = None
+        self.diagnostics_screen = None
+        self.trend_screen = None
+        self.trend = Trend([(channel, lo, hi) for _, channel, lo, hi, _ in Display.TREND_SERIES],
+                           Display.TREND_MINUTES * 60 // Display.TREND_PERIOD_S)
+        self.decibel_level = None
+        self.decibel_text = None
+        self.loaded_screen = None
+        # rendering counters:  LVGL objects created, value labels changed, 
+        # pixels sent to the display, and per refresh:  time to update the screen, 
+        # bytes allocated and pixels flushed
+        self.lv_objects = 0
+        self.label_updates = 0
+        self.flushed_pixels = 0
+        self.refresh_us = 0
+        self.refresh_alloc_bytes = 0
+        self.refresh_pixels = 0
         loop = asyncio.get_event_loop()
-        loop.create_task(self.run_display()) 
+        loop.create_task(diagnostics.timed(diag.TASK_DISPLAY, self.run_display()))
         
     # TODO power save mode:
     # - after a timeout, turn backlight off, and send cmd to put display to sleep
@@ -439,14 +751,17 @@ class Display():
         disp_drv = lv.disp_drv_t()
         lv.disp_drv_init(disp_drv)
         disp_drv.buffer = disp_buf1
-        disp_drv.flush_cb = disp.flush
+        disp_drv.flush_cb = self.counting_flush(disp.flush)
         disp_drv.hor_res = 320  
         disp_drv.ver_res = 240
         disp_drv.rotated = 0
         lv.disp_drv_register(disp_drv)  
         # ... End boilerplate magic   
-                   
+        
+        self.create_styles()
         await self.show_welcome_screens()
+        flushed_pixels = self.flushed_pixels
+        trend_ticks_ms = utime.ticks_ms()
         
         # continually refresh the active screen
         # detect screen change coming from a button press
@@ -463,380 +778,378 @@ class Display():
             elif (self.screen_timeout == True):
                 self.next_screen = len(self.screens) - 1
             
-            # display the active screen    
+            # the trend is sampled whichever screen is shown
+            if utime.ticks_diff(utime.ticks_ms(), trend_ticks_ms) >= Display.TREND_PERIOD_S * 1000:
+                trend_ticks_ms = utime.ticks_add(trend_ticks_ms, Display.TREND_PERIOD_S * 1000)
+                self.trend.add(repo.current)
+            
+            # display the active screen.  LVGL draws the changes after the screen
+            # method returns, so the pixels flushed are counted over the whole refresh period
+            alloc = gc.mem_alloc()
+            start_us = utime.ticks_us()
             await self.screens[self.active_screen]()
+            self.refresh_us = utime.ticks_diff(utime.ticks_us(), start_us)
+            self.refresh_alloc_bytes = max(0, gc.mem_alloc() - alloc)  # 0 if a collection ran
             await asyncio.sleep(Display.SCREEN_REFRESH_IN_S)                    
+            self.refresh_pixels = self.flushed_pixels - flushed_pixels
+            flushed_pixels = self.flushed_pixels
+            log.debug('DISP:refresh %d us, alloc = %d bytes, flushed = %d pixels, heap free = %d bytes', 
+                      self.refresh_us, self.refresh_alloc_bytes, self.refresh_pixels, gc.mem_free())
+        
+    # wraps the display driver flush callback to count the pixels sent to the display
+    def counting_flush(self, flush):
+        def flush_cb(disp_drv, area, color_p):
+            self.flushed_pixels += (area.x2 - area.x1 + 1) * (area.y2 - area.y1 + 1)
+            flush(disp_drv, area, color_p)
+        return flush_cb
         
     # following function is called when the screen advance button is pressed
     async def next_screen(self):
         self.next_screen = (self.active_screen + 1) % len(self.screens)
         
+    # a long press switches diagnostics on and off
+    async def toggle_diagnostics(self):
+        diagnostics.enable(not diagnostics.enabled)
+        log.info('DISP:diagnostics %s', 'on' if diagnostics.enabled else 'off')
+        
+    def asleep(self):
+        return self.active_screen == len(self.screens) - 1
+        
     def screen_timeout_callback(self, t):
         self.screen_timeout = True
         
+    # splash images are run-length encoded (host/png2rle.py) and decoded a strip at a time 
+    # from flash while LVGL draws them (see rleimage.py)
     async def show_welcome_screens(self):
-        #
-        # show Street Sense image 
-        #
-        welcome_screen1 = lv.obj()
-        with open('street_sense_b_rgb565.bin','rb') as f:
-            img_data = f.read()
-            
-        img = lv.img(welcome_screen1)
-        img_dsc = lv.img_dsc_t({
-            'header':{
-                'always_zero': 0,
-                'w':320,
-                'h':240,
-                'cf':lv.img.CF.TRUE_COLOR
-            },
-            'data_size': len(img_data),
-            'data': img_data
-        })
-        
-        img.set_src(img_dsc)
-        
-        lv.scr_load(welcome_screen1)
+        rleimage.register_decoder()
+        for fn, x in Display.WELCOME_IMAGES:
+            welcome_screen = lv.obj()
+            img = lv.img(welcome_screen)
+            img.set_x(x)
+            img.set_src(rleimage.image_dsc(fn))
+            lv.scr_load(welcome_screen)
+            self.backlight_ctrl.value(1)
+            await asyncio.sleep(2)
+        
+    # screens are built once.  Each refresh formats the values and only sets the text
+    # of labels whose text changed, so LVGL redraws just those labels.
+    # Values are labels, not lv.table cells:  setting any cell invalidates the whole table
+    def create_styles(self):
+        self.screenstyle = lv.style_t(lv.style_plain)
+        
+        self.cellstyle = lv.style_t(lv.style_plain)
+        self.cellstyle.text.color = lv.color_hex(0xa028d4)
+        self.cellstyle.text.font = lv.font_roboto_28
+        self.cellstyle.body.border.width = 0
+        self.cellstyle.body.opa = 0
+        
+    def create_label(self, screen, x, y, style, text):
+        label = lv.label(screen)
+        label.set_style(lv.label.STYLE.MAIN, style)
+        label.set_pos(x, y)
+        label.set_text(text)
+        self.lv_objects += 1
+        return label
+        
+    # rows:  (name, channel, value format, unit)
+    # returns [screen, value labels, last value texts, rows]
+    def create_table_screen(self, rows, col_widths):
+        screen = lv.obj()
+        screen.set_style(self.screenstyle)
+        self.lv_objects += 1
+        values = []
+        for row, (name, _, _, unit) in enumerate(rows):
+            y = row * Display.ROW_HEIGHT
+            x = Display.CELL_PAD
+            self.create_label(screen, x, y, self.cellstyle, name)
+            x += col_widths[0]
+            values.append(self.create_label(screen, x, y, self.cellstyle, ''))
+            x += col_widths[1]
+            self.create_label(screen, x, y, self.cellstyle, unit)
+        return [screen, values, [None] * len(rows), rows]
+        
+    def update_table_screen(self, table_screen):
+        _, values, texts, rows = table_screen
+        for row, (_, channel, fmt, _) in enumerate(rows):
+            value = repo.current[channel]
+            text = fmt.format(value) if value == value else '--'  # NaN:  not measured
+            if text != texts[row]:
+                values[row].set_text(text)
+                texts[row] = text
+                self.label_updates += 1
+                
+    def load_screen(self, screen):
+        if screen is not self.loaded_screen:
+            lv.scr_load(screen)
+            self.loaded_screen = screen
         self.backlight_ctrl.value(1)
-        await asyncio.sleep(2)
-        #
-        # show GVCC image 
-        #
-        welcome_screen2 = lv.obj()
-        with open('gvcc_240x240_b_rgb565.bin','rb') as f:
-            img_data = f.read()
-            
-        img = lv.img(welcome_screen2)
-        img.set_x(40)  # center image by moving over 40px
-        img_dsc = lv.img_dsc_t({
-            'header':{
-                'always_zero': 0,
-                'w':240,
-                'h':240,
-                'cf':lv.img.CF.TRUE_COLOR
-            },
-            'data_size': len(img_data),
-            'data': img_data
-        })
-        
-        img.set_src(img_dsc)
-        lv.scr_load(welcome_screen2)
-        
-        await asyncio.sleep(2)
-        #
-        # show GV Placemaking image 
-        #
-        welcome_screen3 = lv.obj()
-        with open('placemaking_320x96_b_rgb565.bin','rb') as f:
-            img_data = f.read()
-            
-        img = lv.img(welcome_screen3)
-        img_dsc = lv.img_dsc_t({
-            'header':{
-                'always_zero': 0,
-                'w':320,
-                'h':96,
-                'cf':lv.img.CF.TRUE_COLOR
-            },
-            'data_size': len(img_data),
-            'data': img_data
-        })
-        
-        img.set_src(img_dsc)
-        lv.scr_load(welcome_screen3)   
-        await asyncio.sleep(2)
         
     async def show_measurement_screen(self):
-        # 
-        # Measurement screen using a table
-        #
-        #
-        # lv.table.STYLE.CELL1 = normal cell
-        # lv.table.STYLE.CELL2 = header cell
-        # lv.table.STYLE.CELL3 = ?
-        # lv.table.STYLE.CELL4 = ?
-        measurement_screen = lv.obj()
-        
-        # set background color, with no gradient
-        screenstyle = lv.style_t(lv.style_plain)
-        #screenstyle.body.main_color = lv.color_make(0xFF, 0xA5, 0x00)
-        # 0xFF, 0x00, 0x00  Red
-        # 0xC0, 0xC0, 0xC0  Silver
-        # 0xFF, 0xA5, 0x00  Orange
-        #screenstyle.body.grad_color = lv.color_make(0xFF, 0xA5, 0x00)
-        #screenstyle.body.border.color = lv.color_hex(0xe32a19)
-        #screenstyle.body.border.width = 5
-        measurement_screen.set_style(screenstyle)
-        
-        tablestyle = lv.style_t(lv.style_plain)
-        tablestyle.body.border.width = 0
-        tablestyle.body.opa = 0
-        
-        cellstyle = lv.style_t(lv.style_plain)
-        cellstyle.text.color = lv.color_hex(0xa028d4)
-        cellstyle.text.font = lv.font_roboto_28
-        cellstyle.body.padding.top = 1
-        cellstyle.body.padding.bottom = 1
-        cellstyle.body.border.width = 0
-        cellstyle.body.opa = 0
-        
-        mtable = lv.table(measurement_screen)
-        mtable.set_row_cnt(6)
-        mtable.set_col_cnt(3)
-        mtable.set_col_width(0, 120)
-        mtable.set_col_width(1, 90)
-        mtable.set_col_width(2, 100)
-        mtable.set_style(lv.table.STYLE.BG, tablestyle)
-        mtable.set_style(lv.table.STYLE.CELL1, cellstyle)
-        
-        mtable.set_cell_value(0,0, "Noise")
-        mtable.set_cell_value(1,0, "PM1.0")
-        mtable.set_cell_value(2,0, "PM2.5")
-        mtable.set_cell_value(3,0, "PM10.0")
-        mtable.set_cell_value(4,0, "NO2")
-        mtable.set_cell_value(5,0, "O3")
-        
-        mtable.set_cell_value(0,1, '{:.1f}'.format(repo.get('dba').current))
-        mtable.set_cell_value(1,1, '{}'.format(repo.get('pm10').current))
-        mtable.set_cell_value(2,1, '{}'.format(repo.get('pm25').current))
-        mtable.set_cell_value(3,1, '{}'.format(repo.get('pm100').current))
-        mtable.set_cell_value(4,1, '{:.1f}'.format(repo.get('no2').current))
-        mtable.set_cell_value(5,1, '{:.1f}'.format(repo.get('o3').current))
-        
-        mtable.set_cell_value(0,2, "dB(A)")
-        mtable.set_cell_value(1,2, "ug/m3")
-        mtable.set_cell_value(2,2, "ug/m3")
-        mtable.set_cell_value(3,2, "ug/m3")
-        mtable.set_cell_value(4,2, "ppb")
-        mtable.set_cell_value(5,2, "ppb")
-        
-        lv.scr_load(measurement_screen)
-        self.backlight_ctrl.value(1)
+        if self.measurement_screen is None:
+            self.measurement_screen = self.create_table_screen(Display.MEASUREMENT_ROWS, (120, 90, 100))
+        self.update_table_screen(self.measurement_screen)
+        self.load_screen(self.measurement_screen[0])
 
     async def show_environmental_screen(self):
-        # 
-        # Environmental screen using a table
-        #
-        #
-        # lv.table.STYLE.CELL1 = normal cell
-        # lv.table.STYLE.CELL2 = header cell
-        # lv.table.STYLE.CELL3 = ?
-        # lv.table.STYLE.CELL4 = ?
-        environmental_screen = lv.obj()
-        
-        # set background color, with no gradient
-        screenstyle = lv.style_t(lv.style_plain)
-        #screenstyle.body.main_color = lv.color_make(0xFF, 0xA5, 0x00)
-        # 0xFF, 0x00, 0x00  Red
-        # 0xC0, 0xC0, 0xC0  Silver
-        # 0xFF, 0xA5, 0x00  Orange
-        #screenstyle.body.grad_color = lv.color_make(0xFF, 0xA5, 0x00)
-        #screenstyle.body.border.color = lv.color_hex(0xe32a19)
-        #screenstyle.body.border.width = 5
-        environmental_screen.set_style(screenstyle)
-        
-        tablestyle = lv.style_t(lv.style_plain)
-        tablestyle.body.border.width = 0
-        tablestyle.body.opa = 0
-        
-        cellstyle = lv.style_t(lv.style_plain)
-        cellstyle.text.color = lv.color_hex(0xa028d4)
-        cellstyle.text.font = lv.font_roboto_28
-        cellstyle.body.padding.top = 1
-        cellstyle.body.padding.bottom = 1
-        cellstyle.body.border.width = 0
-        cellstyle.body.opa = 0
-        
-        mtable = lv.table(environmental_screen)
-        mtable.set_row_cnt(2)
-        mtable.set_col_cnt(3)
-        mtable.set_col_width(0, 130)
-        mtable.set_col_width(1, 90)
-        mtable.set_col_width(2, 90)
-        mtable.set_style(lv.table.STYLE.BG, tablestyle)
-        mtable.set_style(lv.table.STYLE.CELL1, cellstyle)
-        
-        mtable.set_cell_value(0,0, "Temp")
-        mtable.set_cell_value(1,0, "Humidity")
-        
-        mtable.set_cell_value(0,1, '{:.1f}'.format(repo.get('tdegc').current))
-        mtable.set_cell_value(1,1, '{:.1f}'.format(repo.get('rh').current))
-        
-        mtable.set_cell_value(0,2, "degC")
-        mtable.set_cell_value(1,2, "%")
-        
-        lv.scr_load(environmental_screen)
-        self.backlight_ctrl.value(1)
+        if self.environmental_screen is None:
+            self.environmental_screen = self.create_table_screen(Display.ENVIRONMENTAL_ROWS, (130, 90, 90))
+        self.update_table_screen(self.environmental_screen)
+        self.load_screen(self.environmental_screen[0])
 
     async def show_voltage_monitor_screen(self): 
-        # 
-        # Measurement screen using a table
-        #
-        #
-        # lv.table.STYLE.CELL1 = normal cell
-        # lv.table.STYLE.CELL2 = header cell
-        # lv.table.STYLE.CELL3 = ?
-        # lv.table.STYLE.CELL4 = ?
-        voltage_screen = lv.obj()
-        
-        # set background color, with no gradient
-        screenstyle = lv.style_t(lv.style_plain)
-        #screenstyle.body.main_color = lv.color_make(0xFF, 0xA5, 0x00)
-        # 0xFF, 0x00, 0x00  Red
-        # 0xC0, 0xC0, 0xC0  Silver
-        # 0xFF, 0xA5, 0x00  Orange
-        #screenstyle.body.grad_color = lv.color_make(0xFF, 0xA5, 0x00)
-        #screenstyle.body.border.color = lv.color_hex(0xe32a19)
-        #screenstyle.body.border.width = 5
-        voltage_screen.set_style(screenstyle)
-        
-        tablestyle = lv.style_t(lv.style_plain)
-        tablestyle.body.border.width = 0
-        tablestyle.body.opa = 0
-        
-        cellstyle = lv.style_t(lv.style_plain)
-        cellstyle.text.color = lv.color_hex(0xa028d4)
-        cellstyle.text.font = lv.font_roboto_28
-        cellstyle.body.padding.top = 1
-        cellstyle.body.padding.bottom = 1
-        cellstyle.body.border.width = 0
-        cellstyle.body.opa = 0
-        
-        mtable = lv.table(voltage_screen)
-        mtable.set_row_cnt(2)
-        mtable.set_col_cnt(3)
-        mtable.set_col_width(0, 110)
-        mtable.set_col_width(1, 100)
-        mtable.set_col_width(2, 100)
-        mtable.set_style(lv.table.STYLE.BG, tablestyle)
-        mtable.set_style(lv.table.STYLE.CELL1, cellstyle)
-        
-        mtable.set_cell_value(0,0, "Vbat")
-        mtable.set_cell_value(1,0, "Vusb")
-        
-        mtable.set_cell_value(0,2, "V")
-        mtable.set_cell_value(1,2, "V")
-        
-        mtable.set_cell_value(0,1, '{:.2f}'.format(repo.get('vbat').current))
-        mtable.set_cell_value(1,1, '{:.2f}'.format(repo.get('vusb').current))
-        
-        lv.scr_load(voltage_screen)
-        self.backlight_ctrl.value(1)
+        if self.voltage_screen is None:
+            self.voltage_screen = self.create_table_screen(Display.VOLTAGE_ROWS, (110, 100, 100))
+        self.update_table_screen(self.voltage_screen)
+        self.load_screen(self.voltage_screen[0])
+        
+    # live latency percentiles in ms, one row per probe (see diag.py)
+    def create_diagnostics_screen(self):
+        screen = lv.obj()
+        screen.set_style(self.screenstyle)
+        self.lv_objects += 1
+        self.diagstyle = lv.style_t(lv.style_plain)
+        self.diagstyle.text.font = lv.font_roboto_12
+        self.diagstyle.body.opa = 0
+        x_name, x_p50, x_p95, x_max = Display.DIAG_COLUMNS
+        self.diag_state = self.create_label(screen, x_name, 0, self.diagstyle, '')
+        for x, text in ((x_p50, 'p50'), (x_p95, 'p95'), (x_max, 'max ms')):
+            self.create_label(screen, x, 0, self.diagstyle, text)
+        values = []
+        for probe, name in enumerate(diag.PROBES):
+            y = (probe + 1) * Display.DIAG_ROW_HEIGHT
+            self.create_label(screen, x_name, y, self.diagstyle, name)
+            for x in (x_p50, x_p95, x_max):
+                values.append(self.create_label(screen, x, y, self.diagstyle, ''))
+        self.diagnostics_screen = [screen, values, [None] * len(values)]
+        
+    async def show_diagnostics_screen(self):
+        if self.diagnostics_screen is None:
+            self.create_diagnostics_screen()
+        screen, values, texts = self.diagnostics_screen
+        state = 'on' if diagnostics.enabled else 'off'
+        if state != self.diag_state.get_text():
+            self.diag_state.set_text(state)
+        for probe in range(diag.NUM_PROBES):
+            for col, us in enumerate((diagnostics.percentile(probe, 50),
+                                      diagnostics.percentile(probe, 95),
+                                      diagnostics.max_us[probe])):
+                i = probe * 3 + col
+                text = '{:.1f}'.format(us / 1000)
+                if text != texts[i]:
+                    values[i].set_text(text)
+                    texts[i] = text
+                    self.label_updates += 1
+        self.load_screen(screen)
+        
+    # one line series per TREND_SERIES entry, drawn straight from the trend rings.  The 
+    # legend gives each series' chart range
+    def create_trend_screen(self):
+        screen = lv.obj()
+        screen.set_style(self.screenstyle)
+        self.lv_objects += 1
+        chart = lv.chart(screen)
+        chart.set_size(320, Display.TREND_CHART_HEIGHT)
+        chart.set_type(lv.chart.TYPE.LINE)
+        chart.set_range(0, trend.RANGE)
+        chart.set_div_line_count(3, 5)
+        chart.set_point_count(self.trend.points)
+        self.lv_objects += 1
+        series = []
+        self.trend_styles = []
+        x = Display.CELL_PAD
+        for i, (name, _, lo, hi, color) in enumerate(Display.TREND_SERIES):
+            ser = chart.add_series(lv.color_hex(color))
+            chart.set_ext_array(ser, self.trend.rings[i], self.trend.points)
+            series.append(ser)
+            style = lv.style_t(lv.style_plain)
+            style.text.font = lv.font_roboto_12
+            style.text.color = lv.color_hex(color)
+            style.body.opa = 0
+            self.trend_styles.append(style)
+            self.create_label(screen, x, Display.TREND_CHART_HEIGHT + 8, style, '{} {}-{}'.format(name, lo, hi))
+            x += 78
+        self.trend_screen = [screen, chart, series, None]
+        
+    # a new sample moves the start of every series to the oldest point:  no points are copied
+    async def show_trend_screen(self):
+        if self.trend_screen is None:
+            self.create_trend_screen()
+        screen, chart, series, samples = self.trend_screen
+        if self.trend.samples != samples:
+            for ser in series:
+                ser.start_point = self.trend.head
+            chart.refresh()
+            self.trend_screen[3] = self.trend.samples
+        self.load_screen(screen)
         
     async def show_display_sleep_screen(self): 
         self.backlight_ctrl.value(0)
 
-    async def show_decibel_screen(self):  
-        # 
-        # Decibel screen
-        #
-        decibel_screen = lv.obj()
-        dba = repo.get('dba').current
+    def create_decibel_screen(self):
+        self.decibel_screen = lv.obj()
+        self.decibel_style = lv.style_t(lv.style_plain)
+        self.decibel_style.text.font = lv.font_roboto_120
+        self.decibel_screen.set_style(self.decibel_style)
+        self.lv_objects += 1
+        
+        self.decibel_unitstyle = lv.style_t(lv.style_plain)
+        self.decibel_unitstyle.text.font = lv.font_roboto_28
+        self.decibel_reading = self.create_label(self.decibel_screen, 40, 70, self.decibel_style, '')
+        self.decibel_unit = self.create_label(self.decibel_screen, 215, 170, self.decibel_unitstyle, 'dBA')
         
-        screenstyle = lv.style_t(lv.style_plain)
-        # 0xFF, 0x00, 0x00  Red
-        # 0xC0, 0xC0, 0xC0  Silver
-        # 0xFF, 0xA5, 0x00  Orange
-        # set background color, with no gradient
+    async def show_decibel_screen(self):  
+        if self.decibel_screen is None:
+            self.create_decibel_screen()
+        dba = repo.current[measurements.DBA]
         
-        # set background and text color based on dBA reading
-        if dba < 70:
-            bg_color = lv.color_hex(0x00FF00) # green
-            text_color = lv.color_hex(0x000000) # black
+        # set background and text color based on dBA reading (NaN:  not measured yet)
+        if dba < 70 or dba != dba:
+            level = 0
         elif dba < 85:
-            bg_color = lv.color_hex(0xFFFF00) # yellow
-            text_color = lv.color_hex(0x000000) # black
+            level = 1
         else:
-            bg_color = lv.color_hex(0xFF0000)  # red
-            text_color = lv.color_hex(0xFFFFFF) # white
+            level = 2
+        if level != self.decibel_level:
+            bg_color, text_color = Display.DECIBEL_COLORS[level]
+            self.decibel_style.body.grad_color = lv.color_hex(bg_color)
+            self.decibel_style.body.main_color = lv.color_hex(bg_color)
+            self.decibel_style.text.color = lv.color_hex(text_color)
+            self.decibel_unitstyle.text.color = lv.color_hex(text_color)
+            self.decibel_screen.refresh_style()
+            self.decibel_reading.refresh_style()
+            self.decibel_unit.refresh_style()
+            self.decibel_level = level
             
-        screenstyle.body.grad_color = bg_color
-        screenstyle.body.main_color = bg_color
-        #screenstyle.body.border.color = lv.color_hex(0xe32a19)
-        #screenstyle.body.border.width = 5
-        screenstyle.text.color = text_color
-        screenstyle.text.font = lv.font_roboto_120
-        decibel_screen.set_style(screenstyle)
-        
-        reading = lv.label(decibel_screen)
-        reading.set_x(40)
-        reading.set_y(70)
-        reading.set_text('{:.1f}'.format(dba))
-        
-        unit = lv.label(decibel_screen)
-        unitstyle = lv.style_t(lv.style_plain)
-        unitstyle.text.color = text_color
-        unitstyle.text.font = lv.font_roboto_28
-        unit.set_style(lv.label.STYLE.MAIN, unitstyle)
-        unit.set_x(215)
-        unit.set_y(170)
-        unit.set_text("dBA")
-        
-        lv.scr_load(decibel_screen)        
-        self.backlight_ctrl.value(1)
+        text = '{:.1f}'.format(dba) if dba == dba else '--'
+        if text != self.decibel_text:
+            self.decibel_reading.set_text(text)
+            self.decibel_text = text
+            self.label_updates += 1
+        self.load_screen(self.decibel_screen)
         
 class SDCardLogger():
     def __init__(self):
         log.info('SD:init')
         self.fn = None
+        self.f = None
+        self.day = None
+        self.values = [0] * len(LOG_FIELDS)
+        self.csv_format = '{}' + ''.join([',{:.%df}' % field[3] for field in LOG_FIELDS]) + '\n'
+        self.packer = binlog.RecordPacker(len(LOG_FIELDS))
+        self.buffer = bytearray(LOG_BUFFER_BYTES)
+        self.buffer_mv = memoryview(self.buffer)
+        self.buffered_bytes = 0
+        self.buffered_records = 0
+        self.oldest_ticks_ms = 0
+        self.diag_f = None
+        
+    # create a new log file, kept open until the daily rollover
+    def open_file(self, ld):
+        self.fn = '{}/meas-{}-{}-{}-{}-{}-{}.{}'.format(sd_root, ld.year, ld.month, ld.day, 
+                                                       ld.hour, ld.minute, ld.second, LOG_FORMAT)
+        self.f = open(self.fn, 'wb')
+        if LOG_FORMAT == 'bin':
+            self.f.write(binlog.gen_header([field[0] for field in LOG_FIELDS]))
+        else:
+            self.f.write(('utc,' + ','.join([field[0] for field in LOG_FIELDS]) + '\n').encode())
+        self.f.flush()
+        self.day = (ld.year, ld.month, ld.day)
+        log.info('SD:created new file %s', self.fn)
+        
+    # write buffered records to the log file
+    def flush(self):
+        if self.f is None or self.buffered_bytes == 0:
+            return
+        start_us = utime.ticks_us()
+        self.f.write(self.buffer_mv[:self.buffered_bytes])
+        self.f.flush()
+        diagnostics.done(diag.SD_LOG, start_us)
+        log.info('SD:flushed %d records', self.buffered_records)
+        self.buffered_bytes = 0
+        self.buffered_records = 0
+        
+    def close(self):
+        self.flush()
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+        if self.diag_f is not None:
+            self.diag_f.close()
+            self.diag_f = None
+            
+    # open DIAG_LOG_FILE for appending, kept open like the log file.  A file written with 
+    # other columns is renamed, so every file has one header
+    def open_diagnostics(self):
+        fn = '{}/{}'.format(sd_root, DIAG_LOG_FILE)
+        header = diagnostics.csv_header()
+        try:
+            with open(fn, 'rt') as f:
+                existing = f.readline()
+        except OSError:
+            existing = ''
+        if existing and existing != header:
+            name, ext = DIAG_LOG_FILE.rsplit('.', 1)
+            old_fn = '{}/{}-{}.{}'.format(sd_root, name, timestamp_unix, ext)
+            uos.rename(fn, old_fn)
+            log.info('SD:diagnostics columns changed, previous file kept as %s', old_fn)
+            existing = ''
+        self.diag_f = open(fn, 'at')
+        if not existing:
+            self.diag_f.write(header)
+            
+    # append the diagnostics summary for the interval to the SD Card
+    def log_diagnostics(self):
+        if self.diag_f is None:
+            self.open_diagnostics()
+        self.diag_f.write(diagnostics.csv_record(timestamp_unix))
+        self.diag_f.flush()
+        log.debug('SD:diagnostics lag p95 = %d us', diagnostics.summary[diag.LOOP_LAG * diag.NUM_SUMMARY + diag.P95])
+            
+    def append(self, record):
+        n = len(record)
+        if self.buffered_bytes + n > len(self.buffer):
+            self.flush()
+        if self.buffered_records == 0:
+            self.oldest_ticks_ms = utime.ticks_ms()
+        self.buffer_mv[self.buffered_bytes:self.buffered_bytes + n] = record
+        self.buffered_bytes += n
+        self.buffered_records += 1
         
     async def run_logger(self):
-        timestamp_local = gmt_to_pst(urtc.tuple2seconds(ds3231.datetime()))
+        await clock.update()
+        timestamp_local = gmt_to_pst(clock.seconds())
         ld = urtc.seconds2tuple(timestamp_local)
-        # does log file already exist?  Yes->open, append  No->create, write header
-        if self.fn == None:
-            self.fn = '/sd/meas-{}-{}-{}-{}-{}-{}.csv'.format(ld.year, ld.month, ld.day, ld.hour, ld.minute, ld.second)
-            s = open(self.fn, 'w+')
-            numwrite = s.write('utc,pm25,o3,o3_vgas,o3_vref,no2,no2_vgas,no2_vref,tdegc,rh,dba_avg,dba_max,'
-                               'vusb_avg,vusb_min,vbat_avg,vbat_min\n')
-            log.info('SD:created new file')
-        else:
-            s = open(self.fn, 'a+')
-            log.info('SD:opened existing file')
+        for i, field in enumerate(LOG_FIELDS):
+            self.values[i] = getattr(repo.get(field[1]), field[2])
+        # start a new log file every day
+        if self.f is not None and self.day != (ld.year, ld.month, ld.day):
+            self.close()
+        if self.f is None:
+            self.open_file(ld)
 
+        # buffer sensor data, written to the SD Card in batches
+        if LOG_FORMAT == 'bin':
+            self.append(self.packer.pack(timestamp_unix, self.values))
+        else:
+            self.append(self.csv_format.format(timestamp_unix, *self.values).encode())
+        log.info('SD:buffered record %d', self.buffered_records)
         await asyncio.sleep(0)
-        # write sensor data to the SD Card in CSV format
-        numwrite = s.write('{}, {},' 
-                           '{:.2f},{:.2f},{:.2f},' 
-                           '{:.2f},{:.2f},{:.2f},'
-                           '{:.1f},{:.1f},'
-                           '{:.1f},{:.1f},'
-                           '{:.2f},{:.2f},{:.2f},{:.2f}\n'.format(
-                            timestamp_unix, 
-                            repo.get('pm25').current,
-                            repo.get('o3').current,
-                            repo.get('o3_vgas').current,
-                            repo.get('o3_vref').current,
-                            repo.get('no2').current,
-                            repo.get('no2_vgas').current,
-                            repo.get('no2_vref').current,
-                            repo.get('tdegc').current,
-                            repo.get('rh').current,
-                            repo.get('dba').avg,
-                            repo.get('dba').max,
-                            repo.get('vusb').avg,
-                            repo.get('vusb').min,
-                            repo.get('vbat').avg,
-                            repo.get('vbat').min))
-        log.info('SD:wrote log and closed')
-        s.close()
+        if (self.buffered_records >= LOG_FLUSH_RECORDS or
+            utime.ticks_diff(utime.ticks_ms(), self.oldest_ticks_ms) >= LOG_FLUSH_AGE_IN_SECS * 1000):
+            self.flush()
         await asyncio.sleep(0)
 
 class MQTTPublish():
-    def __init__(self, event_mqtt_publish):
+    def __init__(self):
         log.info('MQTT:init')
-        self.event_mqtt_publish = event_mqtt_publish    
-        self.feedname_pm25 = bytes('{:s}/feeds/{:s}'.format(b'MikeTeachman', b'pm25'), 'utf-8')
-        self.feedname_o3 = bytes('{:s}/feeds/{:s}'.format(b'MikeTeachman', b'o3'), 'utf-8')
-        self.feedname_no2 = bytes('{:s}/feeds/{:s}'.format(b'MikeTeachman', b'no2'), 'utf-8')
-        self.feedname_temp = bytes('{:s}/feeds/{:s}'.format(b'MikeTeachman', b'tdegc'), 'utf-8')
-        self.feedname_humidity = bytes('{:s}/feeds/{:s}'.format(b'MikeTeachman', b'humidity'), 'utf-8')
-        self.feedname_dba_avg = bytes('{:s}/feeds/{:s}'.format(b'MikeTeachman', b'dba_avg'), 'utf-8')
-        self.feedname_dba_max = bytes('{:s}/feeds/{:s}'.format(b'MikeTeachman', b'dba_max'), 'utf-8')
-        self.feedname_vbat_avg = bytes('{:s}/feeds/{:s}'.format(b'MikeTeachman', b'vbat_avg'), 'utf-8')
-        self.feedname_vbat_min = bytes('{:s}/feeds/{:s}'.format(b'MikeTeachman', b'vbat_min'), 'utf-8')
+        self.topic = group_topic(MQTT_USER, MQTT_GROUP).encode()
+        self.payload = GroupPayload(MQTT_FIELDS)
+        self.diag_topic = feed_topic(MQTT_USER, MQTT_DIAG_FEED).encode()
         
         self.wifi_status = 'unknown'
+        self.outbox = Outbox('{}/{}'.format(sd_root, MQTT_OUTBOX_FILE), 
+                             '{}/{}'.format(sd_root, MQTT_OUTBOX_CHECKPOINT_FILE), 
+                             MQTT_OUTBOX_MAX_BYTES, MQTT_OUTBOX_COMPACT_BYTES)
         
         self.client = MQTTClient(server='io.adafruit.com', 
                                  ssid=mqtt_config['ssid'],
@@ -846,177 +1159,186 @@ class MQTTPublish():
         
         loop = asyncio.get_event_loop()
         try:
-            loop.create_task(self.run_mqtt())
+            loop.create_task(diagnostics.timed(diag.TASK_MQTT, self.run_mqtt()))
         finally:
             self.client.close()  # Prevent LmacRxBlk:1 errors  
     
+    # QoS 1 publish, raising an exception if the broker does not acknowledge in time.  
+    # The outbox keeps the message for the next interval
+    async def publish(self, topic, payload):
+        if not self.client.isconnected():
+            raise OSError('not connected')
+        start_us = utime.ticks_us()
+        await asyncio.wait_for(self.client.publish(topic, payload, qos = 1), MQTT_PUBLISH_TIMEOUT_IN_SECS)
+        diagnostics.done(diag.MQTT_PUBLISH, start_us)
+        
     async def run_mqtt(self):
         await self.client.connect()
         log.info('MQTT:turn WiFi off')
         self.client.pause()
-        while True:
-            await self.event_mqtt_publish
-            
-            log.info('MQTT:turn WiFi on')
-            self.wifi_status = 'on'
-            self.client.resume()
-            await self.client.publish(self.feedname_pm25, '{}'.format(repo.get('pm25').current), qos = 0)
-            await self.client.publish(self.feedname_o3, '{}'.format(repo.get('o3').current), qos = 0)
-            await self.client.publish(self.feedname_no2, '{}'.format(repo.get('no2').current), qos = 0)
-            await self.client.publish(self.feedname_temp, '{:.2f}'.format(repo.get('tdegc').current), qos = 0)
-            await self.client.publish(self.feedname_humidity, '{:.1f}'.format(repo.get('rh').current), qos = 0)
-            await self.client.publish(self.feedname_dba_avg, '{:.1f}'.format(repo.get('dba').avg), qos = 0)
-            await self.client.publish(self.feedname_dba_max, '{:.1f}'.format(repo.get('dba').max), qos = 0)
-            await self.client.publish(self.feedname_vbat_avg, '{:.2f}'.format(repo.get('vbat').avg), qos = 0)
-            await self.client.publish(self.feedname_vbat_min, '{:.2f}'.format(repo.get('vbat').min), qos = 0)
-            
-            # pausing the MQTT client will turn off the WiFi radio
-            # which reduces the processor power usage
-            log.info('MQTT:turn WiFi off')
-            self.wifi_status = 'off'
-            self.client.pause()
-            
-            self.event_mqtt_publish.clear()
-            
-            # TODO need a better place to perform measurement stat clearing (another event sync object?)
-            repo.clear_stats('pm25')
-            repo.clear_stats('o3')
-            repo.clear_stats('o3_vgas')
-            repo.clear_stats('o3_vref')
-            repo.clear_stats('no2')
-            repo.clear_stats('no2_vgas')
-            repo.clear_stats('no2_vref')
-            repo.clear_stats('tdegc')
-            repo.clear_stats('rh')
-            repo.clear_stats('dba')
-            repo.clear_stats('vusb')
-            repo.clear_stats('vbat')
-            await asyncio.sleep(0)
+        
+    # interval step:  one message per interval holding all measurements (one round trip), 
+    # kept in the outbox until send()
+    async def queue(self):
+        start_us = utime.ticks_us()
+        self.outbox.put(self.topic, self.payload.encode(repo))
+        diagnostics.done(diag.SD_OUTBOX, start_us)
+        if diagnostics.enabled and diagnostics.reports:
+            self.outbox.put(self.diag_topic, diagnostics.json())
+        # TODO need a better place to perform measurement stat clearing
+        repo.clear_all_stats()
+        await asyncio.sleep(0)
+        
+    # interval step:  send the outbox
+    async def send(self):
+        log.info('MQTT:turn WiFi on')
+        self.wifi_status = 'on'
+        self.client.resume()
+        # the radio and broker connection come back in the background
+        deadline = utime.ticks_add(utime.ticks_ms(), MQTT_PUBLISH_TIMEOUT_IN_SECS * 1000)
+        while not self.client.isconnected() and utime.ticks_diff(deadline, utime.ticks_ms()) > 0:
+            await asyncio.sleep_ms(100)
+        await self.outbox.drain(self.publish, MQTT_DRAIN_BATCH, MQTT_DRAIN_PACING_MS, MQTT_DRAIN_MAX_BATCHES)
+        
+        # pausing the MQTT client will turn off the WiFi radio
+        # which reduces the processor power usage
+        log.info('MQTT:turn WiFi off')
+        self.wifi_status = 'off'
+        self.client.pause()
             
 class Microphone():
     def __init__(self):
         logmic.info('init')
+        # MIC_BITS formats of the firmware's dba and i2stools C modules.  B16 is in every build, 
+        # B24 and B32 need firmware with the 24/32-bit capture path:  stop here, not in run_mic
+        self.resolution = getattr(dba, 'B%d' % MIC_BITS, None)
+        self.copy_format = getattr(i2stools, 'B%d' % MIC_BITS, None)
+        if self.resolution is None or self.copy_format is None:
+            raise ValueError('MIC_BITS = {}:  no B{} format in the firmware dba / i2stools modules'.format(
+                             MIC_BITS, MIC_BITS))
+        self.noise_stats = NoiseStats(NOISE_BLOCK_MS / 1000)
         loop = asyncio.get_event_loop()
-        loop.create_task(self.run_mic()) 
+        loop.create_task(diagnostics.timed(diag.TASK_MIC, self.run_mic()))
+        
+    # noise statistics for the interval into the repo, then start the next interval
+    def report_noise(self):
+        stats = self.noise_stats
+        stats.report()
+        for i in range(noisestats.NUM_SUMMARY):
+            repo.add(measurements.LAEQ + i, stats.summary[i])
                 
     async def run_mic(self):
-        # dmacount range:  2 to 128 incl
-        # dmalen range:   8 to 1024 incl
-        
-        bck_pin = Pin(13)
-        ws_pin = Pin(12)
-        sdin_pin = Pin(14)
-
-        audio=I2S(I2S.NUM0,
-            bck=bck_pin,
-            ws=ws_pin,
-            sdin=sdin_pin,
-            mode=I2S.MASTER_RX,
-            samplerate=SAMPLES_PER_SECOND,
-            dataformat=I2S.B32,
-            channelformat=I2S.RIGHT_LEFT,
-            standard=I2S.PHILIPS,
-            dmacount=64,
-            dmalen=256)
+        audio = hal.mic_i2s(SAMPLES_PER_SECOND, dmacount=64, dmalen=256)
         timer_ms = ms_timer.MillisecTimer()
         
-        noise = dba.DBA(samples=10000, resolution=dba.B16, 
+        copy_format = self.copy_format
+        noise = dba.DBA(samples=SAMPLES_PER_SECOND * NOISE_BLOCK_MS // 1000, resolution=self.resolution, 
              coeffa=(1.0, -2.3604841 ,  0.83692802,  1.54849677, -0.96903429, -0.25092355,  0.1950274),
              coeffb=(0.61367941, -1.22735882, -0.61367941,  2.45471764, -0.61367941, -1.22735882,  0.61367941))
+        
+        spectrum = None
+        if BAND_ANALYSIS:
+            spectrum = bands.BandAnalyzer(SAMPLES_PER_SECOND, fraction=BAND_ANALYSIS, stride=BAND_STRIDE,
+                                          block_samples=NUM_FRAMES_IN_BLOCK, sample_bytes=NUM_BYTES_USED)
                 
+        def segment_name():
+            local_timestamp = gmt_to_pst(clock.seconds())
+            ld = urtc.seconds2tuple(local_timestamp)
+            return 'mic-{}-{}-{}-{}-{}-{}.wav'.format(ld.year, ld.month, ld.day, ld.hour, ld.minute, ld.second)
+        
+        encoder = None
+        if MIC_AUDIO_FORMAT == 'adpcm':
+            encoder = ADPCMEncoder(block_align=ADPCM_BLOCK_ALIGN)
+        sd_writer = SDWriter(buffer_size=SD_WRITE_BUFFER_SIZE, num_buffers=SD_WRITE_NUM_BUFFERS,
+                             on_write=lambda us: diagnostics.record(diag.SD_AUDIO, us))
+        mic_recorder = SegmentRecorder(sd_root, 'mic', segment_name, sd_writer,
+                                       SAMPLES_PER_SECOND, BITS_PER_SAMPLE,
+                                       MIC_SEGMENT_TIME_IN_SECONDS, MIC_DISK_CAP_BYTES,
+                                       preallocate=SD_PREALLOCATE, encoder=encoder)
         logmic.info('opening WAV file')
-        local_timestamp = gmt_to_pst(urtc.tuple2seconds(ds3231.datetime()))
-        ld = urtc.seconds2tuple(local_timestamp)
-        fn = '/sd/mic-{}-{}-{}-{}-{}-{}.wav'.format(ld.year, ld.month, ld.day, ld.hour, ld.minute, ld.second)
-        m=open(fn,'wb')
-        wav_header = wavheader.gen_wav_header(SAMPLES_PER_SECOND, BITS_PER_SAMPLE, 1,
-                            SAMPLES_PER_SECOND * RECORD_TIME_IN_SECONDS)
-        logmic.debug('write WAV header')
-        m.write(wav_header)
+        mic_recorder.start()
+        loop = asyncio.get_event_loop()
+        loop.create_task(diagnostics.timed(diag.TASK_SD_FLUSH, sd_writer.run_flush()))
         numread = 0
-        numwrite = 0
         bytes_in_dma_memory = 0
         overrun_count = 0
-        sdwrite_over_100ms = 0
-        sdwrite_50_to_100ms = 0
-        sdwrite_count = 0
         dma_capacity = 64 * 256 * NUM_BYTES_RX  # dmacount*dmalen*8
         samples = bytearray(NUM_BYTES_IN_SAMPLE_BLOCK)
-        sd_sector = bytearray(NUM_BYTES_IN_SDCARD_SECTOR)
-        bytes_remaining_to_rx = NUM_SAMPLE_BYTES_TO_RX
-        mic_file_open = True
+        mic_block = bytearray(NUM_BYTES_IN_MIC_BLOCK)
+        segments_done = 0
+        noise_stats = self.noise_stats
+        noise_blocks = 0
         logmic.info('recording start')
+        record_start_ticks_ms = utime.ticks_ms()
+        last_ticks_us = utime.ticks_us()
         while True:
             try:
                 start_ticks_us = utime.ticks_us()
+                # estimate DMA memory fill:  samples arrive continuously while other coroutines
+                # (including the SD Card flush) run
+                bytes_in_dma_memory += (utime.ticks_diff(start_ticks_us, last_ticks_us) * (SAMPLES_PER_SECOND * NUM_BYTES_RX)) // 1000000
+                last_ticks_us = start_ticks_us
+                if bytes_in_dma_memory > dma_capacity:
+                    overrun_count += 1
+                    logmic.debug('Mic:  DMA overrun!, count= %d', overrun_count)
+                    bytes_in_dma_memory = dma_capacity
 
                 # read samples from microphone
                 numread = audio.readinto(samples, timeout=0)
-                bytes_remaining_to_rx -= numread
                 
                 if numread == 0:
                     # no samples available in DMA memory
                     # allow lower priority coroutines to run
-                    await timer_ms(2)
                     bytes_in_dma_memory = 0
+                    await timer_ms(2)
                 else:
-                    bytes_in_dma_memory -= numread
+                    bytes_in_dma_memory = max(0, bytes_in_dma_memory - numread)
                     
-                    # copy sample from left channel and reduce sample resolution to 16 bits
-                    num_copied = i2stools.copy(bufin=samples, bufout=sd_sector, channel=i2stools.LEFT, format=i2stools.B16)
+                    # copy samples from left channel, keeping the top MIC_BITS of each 32-bit slot
+                    num_copied = i2stools.copy(bufin=samples, bufout=mic_block, channel=i2stools.LEFT, format=copy_format)
                     
                     # feed samples to dBA calculation
-                    res = noise.calc(sd_sector)
+                    res = noise.calc(mic_block)
                     if (res != None):
-                        # dba result ready
-                        repo.add('dba', res)
-                        logmic.debug("noise = {:.1f} dB(A)".format(repo.get('dba').current))
+                        # dba result ready for a block
+                        noise_stats.update(res)
+                        noise_blocks += 1
+                        if noise_blocks * NOISE_BLOCK_MS >= 1000:
+                            noise_blocks = 0
+                            repo.add(measurements.DBA, noise_stats.las())
+                            logmic.debug("noise = {:.1f} dB(A)".format(repo.get('dba').current))
+                    
+                    # feed samples to octave band analysis
+                    if spectrum and spectrum.process(mic_block):
+                        # one second of band levels ready
+                        for band in range(len(bands.OCTAVE_BANDS)):
+                            repo.add(measurements.OCT63 + band, spectrum.octave_levels[band])
                 
-                    # write samples to SD Card
-                    if bytes_remaining_to_rx > 0:
-                        start_sd_write = utime.ticks_us()
-                        numwrite = m.write(sd_sector)
-                        sd_write_time = utime.ticks_diff(utime.ticks_us(), start_sd_write)
-                        sdwrite_count += 1
-                        
-                        logmic.debug('sd_write_time = %d', sd_write_time)
-                        if (sd_write_time) > 100*1000:  # 100ms
-                            sdwrite_over_100ms += 1
-                        elif (sd_write_time) > 50*1000:  # 50ms
-                            sdwrite_50_to_100ms += 1
-                            
-                            end_ticks_us = utime.ticks_us()  
-                            bytes_in_dma_memory += (utime.ticks_diff(end_ticks_us, start_ticks_us) * (SAMPLES_PER_SECOND * NUM_BYTES_RX)) // 1000000
-                            if bytes_in_dma_memory > dma_capacity:
-                                overrun_count += 1
-                                logmic.debug('Mic:  DMA overrun!, count= ', overrun_count)
-                    elif mic_file_open == True:
-                        m.close()
-                        logmic.info('recording done')
+                    # queue samples for the SD Card (copy only, the flush coroutine does the write)
+                    mic_recorder.write(mic_block)
+                    
+                    if mic_recorder.segment_count != segments_done:
+                        # a segment was completed:  report stats for it
+                        segments_done = mic_recorder.segment_count
+                        record_time_ms = utime.ticks_diff(utime.ticks_ms(), record_start_ticks_ms)
+                        record_start_ticks_ms = utime.ticks_ms()
+                        stats = sd_writer.stats()
                         logmic.info('Stats:\n  overrun_count: {}\n'
-                                    '  sdwrite_50_to_100ms: {}\n' 
-                                    '  sdwrite_over_100ms: {}\n' 
-                                    '  sdwrite_count:  {}\n'.format(overrun_count, 
-                                                                     sdwrite_50_to_100ms, 
-                                                                     sdwrite_over_100ms, 
-                                                                     sdwrite_count))
-                        mic_file_open = False
+                                    '  sdwrite_count:  {}\n'
+                                    '  sdwrites_per_second:  {:.2f}\n'
+                                    '  sdwrite_max_ms:  {}\n'
+                                    '  sdwrite_avg_ms:  {}\n'
+                                    '  dropped_blocks:  {}\n'.format(overrun_count,
+                                                                     stats['write_count'],
+                                                                     stats['write_count'] * 1000 / record_time_ms,
+                                                                     stats['max_write_us'] // 1000,
+                                                                     stats['avg_write_us'] // 1000,
+                                                                     stats['dropped_blocks']))
+                        sd_writer.reset_stats()
+                        overrun_count = 0
                         
-                    # fft TODO  coming soon .... 
-                    '''
-                    num_samples = 256
-                    y = bytearray(num_samples * 4) # (sample / 2) freq bins, 2 floats per bin (real/imag)
-                    fft.fft(sd_sector, y)
-                    
-                    print('fft results')
-                    print(ustruct.unpack('>fffff', y)[0]) 
-                    print(ustruct.unpack('>fffff', y)[1]) 
-                    print(ustruct.unpack('>fffff', y)[2]) 
-                    print(ustruct.unpack('>fffff', y)[3]) 
-                    print(ustruct.unpack('>fffff', y)[4]) 
-                    '''
             except Exception as e:
-                m.close()
+                mic_recorder.stop()
                 audio.deinit()
   
 class VoltageMonitor():
@@ -1024,16 +1346,16 @@ class VoltageMonitor():
     READING_PERIOD_MS = 100
     V_BAT_CALIBRATION = 0.001757
     V_USB_CALIBRATION = 0.001419    
+    V_USB_PRESENT = 4.0  # USB power is present above this voltage
+    V_BAT_LOW = 3.4
     def __init__(self):
         log.info('VMON:init')
-        self.vbat_pin = ADC(Pin(35))
-        self.vbat_pin.atten(ADC.ATTN_11DB)
-        self.vbat_pin.width(ADC.WIDTH_12BIT)
-        self.vusb_pin = ADC(Pin(39))
-        self.vusb_pin.atten(ADC.ATTN_11DB)
-        self.vusb_pin.width(ADC.WIDTH_12BIT)
+        self.usb_present = True
+        self.battery_low = False
+        self.vbat_pin = hal.battery_adc()
+        self.vusb_pin = hal.usb_adc()
         loop = asyncio.get_event_loop()
-        loop.create_task(self.run_v_monitor()) 
+        loop.create_task(diagnostics.timed(diag.TASK_VMON, self.run_v_monitor()))
                 
     async def run_v_monitor(self):
         v_bat_sample_sum = 0
@@ -1046,12 +1368,25 @@ class VoltageMonitor():
                 v_usb_sample_sum += self.vusb_pin.read()
                 await asyncio.sleep_ms(VoltageMonitor.READING_PERIOD_MS)
                 
-            repo.add('vbat', v_bat_sample_sum * VoltageMonitor.V_BAT_CALIBRATION / VoltageMonitor.NUM_READINGS)
-            repo.add('vusb', v_usb_sample_sum * VoltageMonitor.V_USB_CALIBRATION / VoltageMonitor.NUM_READINGS)
+            repo.add(measurements.VBAT, v_bat_sample_sum * VoltageMonitor.V_BAT_CALIBRATION / VoltageMonitor.NUM_READINGS)
+            repo.add(measurements.VUSB, v_usb_sample_sum * VoltageMonitor.V_USB_CALIBRATION / VoltageMonitor.NUM_READINGS)
+            self.check_power_events()
             
             v_bat_sample_sum = 0
             v_usb_sample_sum = 0
             await asyncio.sleep(0)
+            
+    # on USB power loss or low battery, write buffered log records to the SD Card
+    def check_power_events(self):
+        usb_present = repo.get(measurements.VUSB).current > VoltageMonitor.V_USB_PRESENT
+        battery_low = repo.get(measurements.VBAT).current < VoltageMonitor.V_BAT_LOW
+        power_event = (self.usb_present and not usb_present) or (battery_low and not self.battery_low)
+        self.usb_present = usb_present
+        self.battery_low = battery_low
+        if power_event:
+            log.info('VMON:power event usb_present=%s battery_low=%s', usb_present, battery_low)
+            if modes[operating_mode].logging == 1:
+                sdcard_logger.flush()
 #
 #  TODO add User Interface, likely using setup screens driven by buttons
 #
@@ -1073,68 +1408,82 @@ MQTTClient.DEBUG = False
 
 operating_mode = NORMAL_MODE
 
-log.info('Reset Cause = %d', machine.reset_cause())
-
-i2c = I2C(scl=Pin(26), sda=Pin(27))
-ds3231 = urtc.DS3231(i2c, address=0x68)
-adc = ADS1219(i2c, address=0x41)
-temp_humid_sensor = si7021.Si7021(i2c)
-
 timestamp_unix = None  #  TODO implement without using a global
 
 # all measurements are stored and retreived to/from 
 # a centralized repo
 repo = MeasurementRepo()
 
-# slot=2 configures SD Card to use the SPI3 controller (VSPI), DMA channel = 2
-# slot=3 configures SD Card to use the SPI2 controller (HSPI), DMA channel = 1
-sd = SDCard(slot=3, sck=Pin(18), mosi=Pin(23), miso=Pin(19), cs=Pin(4))
+# latency histograms, see diag.py
+diagnostics = Diagnostics()
 
-# loop until mount() stops raising exception "OSError: 16"
-# which is related to this error "sdmmc_common: sdmmc_init_csd: send_csd returned 0x109"
-while True:
-    try:
-        uos.mount(sd, "/sd")
-        break
-    except:
-        utime.sleep_ms(100)
-
-# create file exception.txt if it does not yet exist
-files = uos.listdir("/sd")
-if not 'exception.txt' in files:
-    f = open('/sd/exception.txt', mode='wt', encoding='utf-8')
-    f.close()
-
-# wrap the application in a global exception catcher
-try:
-    loop = asyncio.get_event_loop(ioq_len=2)
-    lock = asyn.Lock()
-    event_new_pm_data = asyn.Event(PM_POLLING_DELAY_MS)
-    event_mqtt_publish = asyn.Event()
+def main():
+    global i2c, bus, clock, sd_root, ds3231, adc, temp_humid_sensor
+    global spec_sensors, temp_hum, ps, display, interval_timer, sdcard_logger, mic, mqtt, voltage_monitor
+    log.info('Reset Cause = %d', machine.reset_cause())
     
-    spec_sensors = SpecSensors()
-    temp_hum = THSensor()
-    ps = ParticulateSensor(lock, event_new_pm_data)
-    display = Display()
+    i2c = hal.i2c_bus()
+    bus = I2CBus(i2c)
+    ds3231 = hal.rtc(i2c)
+    clock = Clock(ds3231, bus, RTC_RESYNC_S)
+    adc = hal.gas_adc(i2c)
+    temp_humid_sensor = hal.temp_humidity(i2c)
     
-    if modes[operating_mode].aq == 'periodic':
-        interval_timer = IntervalTimer(event_mqtt_publish)
+    sd_root = hal.mount_sd()
     
-    if modes[operating_mode].logging == 1:
-        sdcard_logger = SDCardLogger()
-        
-    mic = Microphone()
+    # create file exception.txt if it does not yet exist
+    files = uos.listdir(sd_root)
+    if not 'exception.txt' in files:
+        f = open('{}/exception.txt'.format(sd_root), mode='wt', encoding='utf-8')
+        f.close()
     
-    if modes[operating_mode].mqtt == 1:
-        mqtt = MQTTPublish(event_mqtt_publish)
+    # wrap the application in a global exception catcher
+    try:
+        loop = asyncio.get_event_loop(ioq_len=2)
+        diagnostics.enable(DIAG_ENABLED)
+        loop.create_task(diagnostics.run_lag_monitor())
+        lock = asyn.Lock()
+        event_new_pm_data = asyn.Event(PM_POLLING_DELAY_MS)
+        
+        spec_sensors = SpecSensors()
+        temp_hum = THSensor()
+        ps = ParticulateSensor(lock, event_new_pm_data)
+        display = None
+        if lv is not None:
+            display = Display()
+        
+        if modes[operating_mode].aq == 'periodic':
+            interval_timer = IntervalTimer()
+        else:
+            # no interval timer calling clock.update(), e.g. DEMO mode:  keep the clock synced
+            loop.create_task(clock.run_sync())
+        
+        if modes[operating_mode].logging == 1:
+            sdcard_logger = SDCardLogger()
+            
+        if MIC_ENABLED:
+            mic = Microphone()
         
-    voltage_monitor = VoltageMonitor()
-    loop.run_forever()
-except Exception as e:
-    # "should" never get here.  
-    # Save exception to a file and force a hard reset
-    emsg = 'Unexpected Exception {} {}\n'.format(type(e).__name__, e)
-    print(emsg)
-    with open('/sd/exception.txt', mode='at', encoding='utf-8') as f:
-        f.write(emsg)
-    machine.reset()
\ No newline at end of file
+        if modes[operating_mode].mqtt == 1:
+            mqtt = MQTTPublish()
+            
+        voltage_monitor = VoltageMonitor()
+        loop.run_forever()
+    except Exception as e:
+        # "should" never get here.  
+        # Save exception to a file and force a hard reset
+        emsg = 'Unexpected Exception {} {}\n'.format(type(e).__name__, e)
+        print(emsg)
+        # keep buffered log records
+        try:
+            sdcard_logger.close()
+        except:
+            pass
+        with open('{}/exception.txt'.format(sd_root), mode='at', encoding='utf-8') as f:
+            f.write(emsg)
+        machine.reset()
+
+# on the device the application starts when this module is imported.
+# host/simulate.py imports it and calls main() itself
+if sys.platform == 'esp32':
+    main()
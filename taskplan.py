@@ -0,0 +1,125 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Task plan for the work done every measurement interval
+# - a plan is a table of steps:  Step(name, coroutine function, after, domains)
+#   - after:  names of the steps that must be done before the step starts
+#   - domains:  power domains the step switches on, e.g. 'pm' for the PMS5003 supply
+# - conflicts:  pairs of domains that must not be on at the same time.  A step waits
+#   while a running step holds a conflicting domain
+# - run() starts every step as soon as it is allowed, in table order, so independent
+#   work overlaps.  serial=True runs one step at a time, in table order
+# - a step that raises is logged and marked failed.  A failed step counts as finished:
+#   the steps after it still run (e.g. the log step writes the values it has) and run()
+#   returns once every step is done or failed
+# - timing:  per run, the start offset and duration of each step (ms), plus totals
+#   over all runs
+# - run() waits for a step to finish on an asyn.Event polled every poll_ms.  A delay of 0
+#   polls on every pass of the scheduler and keeps the CPU from light sleep for the whole
+#   plan;  the steps take seconds, so a late start of up to poll_ms costs little
+#
+from array import array
+import utime
+import uasyncio as asyncio
+import asyn
+import logging
+
+log = logging.getLogger('streetsense')
+
+POLL_MS = 100
+
+class Step():
+    def __init__(self, name, func, after=(), domains=()):
+        self.name = name
+        self.func = func
+        self.after = after
+        self.domains = domains
+
+class Plan():
+    def __init__(self, steps, conflicts=(), serial=False, poll_ms=POLL_MS):
+        self.steps = steps
+        self.serial = serial
+        names = [step.name for step in steps]
+        self.after = [tuple(names.index(name) for name in step.after) for step in steps]
+        # blocked[i]:  domains that conflict with step i
+        self.blocked = []
+        for step in steps:
+            blocked = set()
+            for a, b in conflicts:
+                if a in step.domains:
+                    blocked.add(b)
+                if b in step.domains:
+                    blocked.add(a)
+            self.blocked.append(blocked)
+        n = len(steps)
+        self.state = bytearray(n)  # 0 = waiting, 1 = running, 2 = done, 3 = failed
+        self.start_ms = array('i', [0] * n)
+        self.duration_ms = array('i', [0] * n)
+        self.total_ms = array('i', [0] * n)
+        self.wall_ms = 0
+        self.total_wall_ms = 0
+        self.runs = 0
+        self.failures = 0
+        self.event = asyn.Event(poll_ms)
+
+    def ready(self, i):
+        if self.state[i] != 0:
+            return False
+        for j in self.after[i]:
+            if self.state[j] < 2:
+                return False
+        for j, step in enumerate(self.steps):
+            if self.state[j] == 1:
+                if self.serial:
+                    return False
+                for domain in step.domains:
+                    if domain in self.blocked[i]:
+                        return False
+        return True
+
+    async def run_step(self, i, start):
+        self.start_ms[i] = utime.ticks_diff(utime.ticks_ms(), start)
+        state = 3
+        try:
+            await self.steps[i].func()
+            state = 2
+        except Exception as e:
+            self.failures += 1
+            log.error('PLAN:step %s failed:  %s %s', self.steps[i].name, type(e).__name__, e)
+        finally:
+            self.duration_ms[i] = utime.ticks_diff(utime.ticks_ms(), start) - self.start_ms[i]
+            self.state[i] = state
+            self.event.set()
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        start = utime.ticks_ms()
+        n = len(self.steps)
+        for i in range(n):
+            self.state[i] = 0
+        done = 0
+        while done < n:
+            for i in range(n):
+                if self.ready(i):
+                    self.state[i] = 1
+                    loop.create_task(self.run_step(i, start))
+                    if self.serial:
+                        break
+            self.event.clear()
+            await self.event
+            done = sum(1 for s in self.state if s >= 2)
+        self.wall_ms = utime.ticks_diff(utime.ticks_ms(), start)
+        for i in range(n):
+            self.total_ms[i] += self.duration_ms[i]
+        self.total_wall_ms += self.wall_ms
+        self.runs += 1
+
+    # e.g. 'pm 0+35012 gas 35013+10040 ...' (start offset + duration, ms)
+    def timing(self):
+        return ' '.join(['{} {}+{}'.format(step.name, self.start_ms[i], self.duration_ms[i])
+                         for i, step in enumerate(self.steps)])
@@ -0,0 +1,49 @@
+# The MIT License (MIT)
+# Copyright (c) 2020 Mike Teachman
+# https://opensource.org/licenses/MIT
+
+#
+# Street Sense Project:  Air and Noise pollution sensor unit
+# https://hackaday.io/project/162059-street-sense
+#
+# Trend rings for the chart screen
+# - one array('h') ring per channel, preallocated, holding the last `points` samples
+#   scaled to chart coordinates (0 to RANGE over the channel's lo to hi)
+# - the ring is the point storage of an lv.chart series (set_ext_array):  add() writes
+#   one slot per channel and moves head, the chart draws the ring from head (the oldest
+#   sample, series start_point).  No point list is built or copied
+# - slots without a sample, or with a NaN (not measured) value, hold NO_POINT, which the
+#   chart does not draw
+#
+# Memory:  2 bytes per point and channel, e.g. 4 channels x 180 points = 1.4 kB
+#
+from array import array
+
+RANGE = 100
+NO_POINT = -31767  # LV_CHART_POINT_DEF (LV_COORD_MIN) for a 16-bit lv_coord_t
+
+class Trend():
+    # channels:  ((channel handle, lo, hi), ...)
+    def __init__(self, channels, points):
+        self.channels = channels
+        self.points = points
+        self.rings = [array('h', [NO_POINT] * points) for _ in channels]
+        self.head = 0
+        self.samples = 0
+
+    # values:  indexed by channel handle, e.g. repo.current
+    def add(self, values):
+        head = self.head
+        for i, (channel, lo, hi) in enumerate(self.channels):
+            value = values[channel]
+            if value != value:
+                self.rings[i][head] = NO_POINT
+                continue
+            p = int((value - lo) * RANGE / (hi - lo))
+            if p < 0:
+                p = 0
+            elif p > RANGE:
+                p = RANGE
+            self.rings[i][head] = p
+        self.head = (head + 1) % self.points
+        self.samples += 1
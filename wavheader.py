@@ -19,4 +19,61 @@ def gen_wav_header(
     o += bitsPerSample.to_bytes(2, 'little')  # (2byte)
     o += bytes('data', 'ascii')  # (4byte) Data Chunk Marker
     o += datasize.to_bytes(4, 'little')  # (4byte) Data size in bytes
-    return o
\ No newline at end of file
+    return o
+
+# IMA ADPCM (format type 0x11), mono or stereo
+def gen_wav_header_ima_adpcm(
+    sampleRate,
+    channels,
+    blockAlign,
+    samplesPerBlock,
+    samples,
+    ):
+    blocks = (samples + samplesPerBlock - 1) // samplesPerBlock
+    datasize = blocks * blockAlign
+    o = bytes('RIFF', 'ascii')  # (4byte) Marks file as RIFF
+    o += (datasize + IMA_ADPCM_HEADER_LEN - 8).to_bytes(4, 'little')  # (4byte) File size in bytes excluding this and RIFF marker
+    o += bytes('WAVE', 'ascii')  # (4byte) File type
+    o += bytes('fmt ', 'ascii')  # (4byte) Format Chunk Marker
+    o += (20).to_bytes(4, 'little')  # (4byte) Length of above format data
+    o += (0x11).to_bytes(2, 'little')  # (2byte) Format type (0x11 - IMA ADPCM)
+    o += channels.to_bytes(2, 'little')  # (2byte)
+    o += sampleRate.to_bytes(4, 'little')  # (4byte)
+    o += (sampleRate * blockAlign // samplesPerBlock).to_bytes(4, 'little')  # (4byte) bytes per second
+    o += blockAlign.to_bytes(2, 'little')  # (2byte)
+    o += (4).to_bytes(2, 'little')  # (2byte) bits per sample
+    o += (2).to_bytes(2, 'little')  # (2byte) size of extra format data
+    o += samplesPerBlock.to_bytes(2, 'little')  # (2byte)
+    o += bytes('fact', 'ascii')  # (4byte) Fact Chunk Marker
+    o += (4).to_bytes(4, 'little')  # (4byte) Length of fact data
+    o += samples.to_bytes(4, 'little')  # (4byte) number of samples
+    o += bytes('data', 'ascii')  # (4byte) Data Chunk Marker
+    o += datasize.to_bytes(4, 'little')  # (4byte) Data size in bytes
+    return o
+
+WAV_HEADER_LEN = 44
+IMA_ADPCM_HEADER_LEN = 60
+
+# header length of an open WAV file made by gen_wav_header() or gen_wav_header_ima_adpcm()
+def header_len(f):
+    f.seek(20)
+    if int.from_bytes(f.read(2), 'little') == 0x11:
+        return IMA_ADPCM_HEADER_LEN
+    return WAV_HEADER_LEN
+
+# fill in the RIFF and data chunk sizes of an open WAV file,
+# for files where the length was not known when the header was written.
+# For IMA ADPCM files also fill in the number of samples (fact chunk)
+def update_wav_header(f, datasize, headerLen=WAV_HEADER_LEN, samples=None):
+    f.seek(4)
+    f.write((datasize + headerLen - 8).to_bytes(4, 'little'))
+    f.seek(headerLen - 4)
+    f.write(datasize.to_bytes(4, 'little'))
+    if samples is not None:
+        f.seek(headerLen - 12)
+        f.write(samples.to_bytes(4, 'little'))
+
+# read the data chunk size from the header of an open WAV file
+def read_data_size(f, headerLen=WAV_HEADER_LEN):
+    f.seek(headerLen - 4)
+    return int.from_bytes(f.read(4), 'little')